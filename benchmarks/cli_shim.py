@@ -0,0 +1,31 @@
+"""
+Runs the `superpaste` CLI against a mock server, by pointing the built-in backends at ``$SUPERPASTE_BENCH_URL``.
+
+Usage: ``SUPERPASTE_BENCH_URL=http://127.0.0.1:8080 python benchmarks/cli_shim.py --backend hst.sh FILE``
+
+Only the backend named by ``--backend`` is imported, like the real CLI. Set ``SUPERPASTE_BENCH_EAGER=1`` to import
+every backend up front instead, for comparison.
+"""
+
+import os
+import sys
+
+if __name__ == "__main__":
+    url = os.environ["SUPERPASTE_BENCH_URL"]
+
+    from superpaste import backends
+    from superpaste.__main__ import main
+
+    if os.environ.get("SUPERPASTE_BENCH_EAGER"):
+        for name in backends.__all__:
+            getattr(backends, name)
+
+    urls = {"base_url": url, "post_url": url + "/api/paste", "html_url": url + "/{key}"}
+    flag = next((arg for arg in ("--backend", "-b") if arg in sys.argv), None)
+    name = sys.argv[sys.argv.index(flag) + 1] if flag else None
+    if name in ("hst.sh", "skyra.pw"):
+        backends.load_backend(name).base_url = urls["base_url"]
+    elif name == "mystb.in":
+        backend = backends.load_backend(name)
+        backend.post_url, backend.html_url = urls["post_url"], urls["html_url"]
+    sys.exit(main())
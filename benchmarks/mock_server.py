@@ -0,0 +1,251 @@
+"""
+A local stand-in for the paste services, for benchmarking without touching the public ones.
+
+It speaks three protocols at once:
+
+* hastebin: ``POST /documents``, ``GET /raw/{key}``
+* Mystbin: ``POST /api/paste``, ``GET /api/paste/{key}``
+* paste.ee: ``POST /v1/pastes``, ``GET /v1/pastes/{key}``
+
+Latency, error rate and size limits are configurable. Run it on its own with
+``python benchmarks/mock_server.py --port 8080 --latency 0.05``.
+"""
+
+import argparse
+import datetime
+import gzip
+import json
+import random
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+__all__ = ("MockPasteServer",)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, which Nagle's algorithm would otherwise delay by ~40ms.
+    disable_nagle_algorithm = True
+    server: "_Server"
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                body += self.rfile.read(size)
+                self.rfile.readline()
+            body = bytes(body)
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        encoding = self.headers.get("Content-Encoding")
+        if encoding == "gzip":
+            body = gzip.decompress(body)
+        elif encoding == "deflate":
+            body = zlib.decompress(body)
+        return body
+
+    def _send(self, status: int, body: Any, content_type: str = "application/json", headers: Dict[str, str] = None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _simulate(self) -> bool:
+        """Applies the configured latency and errors. Returns False if an error response was sent."""
+        server = self.server.mock
+        with server.lock:
+            server.stats["requests"] += 1
+        if server.latency:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+        if server.error_rate and random.random() < server.error_rate:
+            with server.lock:
+                server.stats["errors"] += 1
+            self._send(server.error_status, {"message": "Simulated failure"})
+            return False
+        return True
+
+    def do_HEAD(self):
+        self._send(200, b"", "text/plain")
+
+    def do_POST(self):
+        body = self._read_body()
+        if not self._simulate():
+            return
+        server = self.server.mock
+        if server.max_size is not None and len(body) > server.max_size:
+            return self._send(413, {"message": "Document exceeds maximum length."})
+        key = uuid.uuid4().hex[:10]
+        with server.lock:
+            server.stats["posts"] += 1
+            server.stats["bytes_in"] += len(body)
+        if self.path == "/documents":
+            server.store[key] = body
+            return self._send(200, {"key": key})
+        if self.path == "/api/paste":
+            server.store[key] = json.loads(body)
+            return self._send(
+                200,
+                {
+                    "id": key,
+                    "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                    "expires": None,
+                    "safety": uuid.uuid4().hex,
+                    "views": 0,
+                },
+            )
+        if self.path == "/v1/pastes":
+            server.store[key] = json.loads(body)
+            return self._send(201, {"id": key, "link": "%s/p/%s" % (server.url, key)})
+        self._send(404, {"message": "Not found"})
+
+    def do_GET(self):
+        if not self._simulate():
+            return
+        server = self.server.mock
+        with server.lock:
+            server.stats["gets"] += 1
+        prefix, _, key = self.path.rpartition("/")
+        stored = server.store.get(key)
+        if stored is None:
+            return self._send(404, {"message": "Document not found."})
+        etag = '"%s"' % key
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            return self.end_headers()
+        headers = {"ETag": etag}
+        if prefix == "/raw":
+            return self._send(200, stored, "text/plain; charset=utf-8", headers)
+        if prefix == "/api/paste":
+            return self._send(200, {"id": key, "files": stored["files"]}, headers=headers)
+        if prefix == "/v1/pastes":
+            sections = [
+                {"id": n, "name": s.get("name", s.get("filename")), "syntax": s.get("syntax"), "content": s["content"]}
+                for n, s in enumerate(stored["sections"])
+            ]
+            return self._send(200, {"paste": {"id": key, "sections": sections}}, headers=headers)
+        self._send(404, {"message": "Not found"})
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # the default backlog of 5 resets connections from highly parallel clients
+    mock: "MockPasteServer"
+
+
+class MockPasteServer:
+    """
+    A threaded HTTP server implementing the hastebin, Mystbin and paste.ee APIs, with simulated latency and errors.
+
+    Example:
+    >>> with MockPasteServer(latency=0.01) as server:
+    ...     GenericBackend(server.url).create_paste("hello")
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        *,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        max_size: Optional[int] = None,
+    ):
+        """
+        :param host: The address to listen on
+        :param port: The port to listen on. 0 picks a free one.
+        :param latency: Seconds to wait before answering each request
+        :param jitter: Extra random latency, up to this many seconds
+        :param error_rate: The fraction of requests (0-1) to fail with `error_status`
+        :param error_status: The status code of simulated failures
+        :param max_size: The largest request body accepted, in bytes. Larger ones get 413.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.max_size = max_size
+        self.store: Dict[str, Any] = {}
+        self.stats = {"requests": 0, "posts": 0, "gets": 0, "errors": 0, "bytes_in": 0}
+        self.lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.mock = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    def config(self) -> Dict[str, Any]:
+        """The simulated conditions, for recording alongside results"""
+        return {
+            "latency": self.latency,
+            "jitter": self.jitter,
+            "error_rate": self.error_rate,
+            "error_status": self.error_status,
+            "max_size": self.max_size,
+        }
+
+    def start(self) -> "MockPasteServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-paste-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock hastebin/Mystbin/paste.ee server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering each request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests to fail")
+    parser.add_argument("--max-size", type=int, default=None, help="Largest accepted body, in bytes")
+    args = parser.parse_args()
+    server = MockPasteServer(
+        args.host,
+        args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        max_size=args.max_size,
+    )
+    print("Serving on %s" % server.url)
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
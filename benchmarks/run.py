@@ -0,0 +1,260 @@
+"""
+Benchmarks every backend, and the CLI, against a local mock server.
+
+Each case pastes `files` files of `size` bytes, `repeat` times, and fetches one of the pastes back. The results are
+written as JSON, one object per case, so they can be compared between runs:
+
+    python benchmarks/run.py --latency 0.01 --output results.json
+    python benchmarks/run.py --backends generic mystbin --modes async --files 1 5 --sizes 1024
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from importlib.metadata import version
+from typing import Any, Callable, Dict, List, Optional
+
+from mock_server import MockPasteServer
+
+from superpaste.backends import (
+    BaseBackend,
+    GenericBackend,
+    HastebinBackend,
+    MystbinBackend,
+    MystbinFile,
+    PasteEEBackend,
+    PasteEEFile,
+)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_backends(url: str) -> Dict[str, Callable[[], BaseBackend]]:
+    """Builds each backend, pointed at the mock server"""
+
+    def mystbin() -> MystbinBackend:
+        backend = MystbinBackend()
+        backend.post_url = url + "/api/paste"
+        backend.html_url = url + "/{key}"
+        return backend
+
+    def paste_ee() -> PasteEEBackend:
+        backend = PasteEEBackend("benchmark")
+        backend.base_url = backend.post_url = url + "/v1/pastes"
+        backend.html_url = url + "/p/{key}"
+        return backend
+
+    return {
+        "generic": lambda: GenericBackend(url),
+        "hastebin": lambda: HastebinBackend("benchmark", base_url=url),
+        "mystbin": mystbin,
+        "paste.ee": paste_ee,
+    }
+
+
+def make_content(size: int, seed: int) -> str:
+    """Builds `size` bytes of log-like text. The seed makes every file unique."""
+    line = "%08d the quick brown fox jumps over the lazy dog 0123456789\n" % seed
+    return (line * (size // len(line) + 1))[:size]
+
+
+def make_file(backend: BaseBackend, content: str, n: int) -> Any:
+    if isinstance(backend, PasteEEBackend):
+        return PasteEEFile(content, "file%d.txt" % n)
+    if isinstance(backend, MystbinBackend):
+        return MystbinFile(content, "file%d.txt" % n)
+    return backend.file_class(content)
+
+
+def fits(backend: BaseBackend, files: int, size: int) -> bool:
+    """Whether a case is within the backend's own limits"""
+    if backend.max_file_size is not None and size > backend.max_file_size:
+        return False
+    per_paste = min(files, backend.max_files_per_paste or 1)
+    return backend.max_paste_size is None or per_paste * size <= backend.max_paste_size
+
+
+def summarise(timings: List[float], errors: int, files: int, size: int) -> Dict[str, Any]:
+    timings = sorted(timings) or [float("nan")]
+    total = sum(timings)
+    return {
+        "runs": len(timings),
+        "errors": errors,
+        "mean_s": statistics.fmean(timings),
+        "median_s": statistics.median(timings),
+        "p95_s": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "min_s": timings[0],
+        "max_s": timings[-1],
+        "files_per_s": files * len(timings) / total if total else None,
+        "mb_per_s": files * size * len(timings) / total / 1e6 if total else None,
+    }
+
+
+def _first_key(result: Any) -> str:
+    if isinstance(result, list):
+        result = next(r for r in result if not isinstance(r, BaseException))
+    return result.key
+
+
+def bench_sync(backend: BaseBackend, files: int, size: int, repeat: int, concurrency: int) -> Dict[str, Dict]:
+    create, get, errors, get_errors = [], [], 0, 0
+    key: Optional[str] = None
+    for run in range(repeat):
+        batch = [make_file(backend, make_content(size, run * files + n), n) for n in range(files)]
+        start = time.perf_counter()
+        try:
+            result = backend.create_paste(*batch, max_concurrency=concurrency, return_exceptions=True)
+        except Exception:
+            errors += files
+            continue
+        create.append(time.perf_counter() - start)
+        results = result if isinstance(result, list) else [result]
+        errors += sum(isinstance(r, BaseException) for r in results)
+        try:
+            key = _first_key(result)
+        except StopIteration:
+            continue
+        start = time.perf_counter()
+        try:
+            backend.get_paste(key)
+        except Exception:
+            get_errors += 1
+            continue
+        get.append(time.perf_counter() - start)
+    return {"create": summarise(create, errors, files, size), "get": summarise(get, get_errors, 1, size)}
+
+
+async def bench_async(backend: BaseBackend, files: int, size: int, repeat: int, concurrency: int) -> Dict[str, Dict]:
+    create, get, errors, get_errors = [], [], 0, 0
+    for run in range(repeat):
+        batch = [make_file(backend, make_content(size, run * files + n), n) for n in range(files)]
+        start = time.perf_counter()
+        try:
+            result = await backend.async_create_paste(*batch, max_concurrency=concurrency, return_exceptions=True)
+        except Exception:
+            errors += files
+            continue
+        create.append(time.perf_counter() - start)
+        results = result if isinstance(result, list) else [result]
+        errors += sum(isinstance(r, BaseException) for r in results)
+        try:
+            key = _first_key(result)
+        except StopIteration:
+            continue
+        start = time.perf_counter()
+        try:
+            await backend.async_get_paste(key)
+        except Exception:
+            get_errors += 1
+            continue
+        get.append(time.perf_counter() - start)
+    await backend.aclose()
+    return {"create": summarise(create, errors, files, size), "get": summarise(get, get_errors, 1, size)}
+
+
+def bench_cli(url: str, backend: str, files: int, size: int, repeat: int) -> Dict[str, Any]:
+    """Runs the CLI in a subprocess, so the timings include interpreter and import start-up."""
+    timings, errors = [], 0
+    env = dict(os.environ, SUPERPASTE_BENCH_URL=url)
+    with tempfile.TemporaryDirectory() as tmp:
+        for run in range(repeat):
+            paths = []
+            for n in range(files):
+                path = os.path.join(tmp, "file%d.txt" % n)
+                with open(path, "w") as fd:
+                    fd.write(make_content(size, run * files + n))
+                paths.append(path)
+            start = time.perf_counter()
+            proc = subprocess.run(
+                [sys.executable, os.path.join(HERE, "cli_shim.py"), "--backend", backend, *paths],
+                env=env,
+                capture_output=True,
+            )
+            timings.append(time.perf_counter() - start)
+            errors += proc.returncode != 0
+    return summarise(timings, errors, files, size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark superpaste against a local mock server")
+    parser.add_argument("--backends", nargs="+", default=["generic", "hastebin", "mystbin", "paste.ee"])
+    parser.add_argument("--modes", nargs="+", choices=["sync", "async", "cli"], default=["sync", "async", "cli"])
+    parser.add_argument("--files", nargs="+", type=int, default=[1, 5, 20], help="File counts to paste at once")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1024, 64 * 1024, 1024 * 1024], help="File sizes")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per case")
+    parser.add_argument("--concurrency", type=int, default=8, help="max_concurrency for multi-paste uploads")
+    parser.add_argument("--cli-backends", nargs="+", default=["hst.sh", "mystb.in"], help="CLI --backend values")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated server latency, in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random server latency, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests the server fails")
+    parser.add_argument("--max-size", type=int, default=None, help="Largest body the server accepts, in bytes")
+    parser.add_argument("--output", "-o", default="-", help="Where to write the JSON results. `-` is stdout.")
+    args = parser.parse_args()
+
+    server = MockPasteServer(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, max_size=args.max_size
+    ).start()
+    factories = make_backends(server.url)
+    results = []
+
+    def record(case: Dict[str, Any], op: str, stats: Dict[str, Any]) -> None:
+        results.append({**case, "op": op, **stats})
+        print(
+            "%-9s %-5s %-6s files=%-3d size=%-8d median=%.4fs errors=%d"
+            % (case["backend"], case["mode"], op, case["files"], case["size"], stats["median_s"], stats["errors"]),
+            file=sys.stderr,
+        )
+
+    try:
+        for name in args.backends:
+            for mode in (m for m in args.modes if m != "cli"):
+                for files in args.files:
+                    for size in args.sizes:
+                        backend = factories[name]()
+                        case = {"backend": name, "mode": mode, "files": files, "size": size}
+                        if not fits(backend, files, size):
+                            results.append({**case, "skipped": "exceeds backend limits"})
+                            continue
+                        if mode == "sync":
+                            with backend:
+                                stats = bench_sync(backend, files, size, args.repeat, args.concurrency)
+                        else:
+                            stats = asyncio.run(bench_async(backend, files, size, args.repeat, args.concurrency))
+                        for op, op_stats in stats.items():
+                            record(case, op, op_stats)
+        if "cli" in args.modes:
+            for name in args.cli_backends:
+                for files in args.files:
+                    for size in args.sizes:
+                        case = {"backend": name, "mode": "cli", "files": files, "size": size}
+                        record(case, "create", bench_cli(server.url, name, files, size, args.repeat))
+    finally:
+        server.stop()
+
+    report = {
+        "superpaste": version("superpaste"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "server": {**server.config(), **server.stats},
+        "repeat": args.repeat,
+        "concurrency": args.concurrency,
+        "results": results,
+    }
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as fd:
+            json.dump(report, fd, indent=2)
+
+
+if __name__ == "__main__":
+    main()
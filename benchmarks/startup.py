@@ -0,0 +1,89 @@
+"""
+Measures CLI start-up time, against importing every backend up front (which is what the CLI used to do), and against
+forwarding to a running `superpaste daemon`.
+
+    python benchmarks/startup.py --repeat 20 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from mock_server import MockPasteServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EAGER = "import superpaste.backends as b; [getattr(b, name) for name in b.__all__]"
+
+
+def measure(command: List[str], repeat: int, env: Dict[str, str] = None) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return {"median_s": statistics.median(timings), "min_s": min(timings), "max_s": max(timings)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark superpaste CLI start-up")
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per command")
+    parser.add_argument("--output", "-o", default="-", help="Where to write the JSON results. `-` is stdout.")
+    args = parser.parse_args()
+
+    python = sys.executable
+    results = {
+        "interpreter": measure([python, "-c", "pass"], args.repeat),
+        "eager_import": measure([python, "-c", EAGER], args.repeat),
+        "cli_help": measure([python, "-m", "superpaste", "--help"], args.repeat),
+    }
+    with MockPasteServer() as server, tempfile.NamedTemporaryFile("w", suffix=".txt") as file:
+        file.write("hello world\n")
+        file.flush()
+        env = dict(os.environ, SUPERPASTE_BENCH_URL=server.url)
+        shim = os.path.join(HERE, "cli_shim.py")
+        results["cli_paste"] = measure([python, shim, "--backend", "hst.sh", file.name], args.repeat, env)
+        eager_env = dict(env, SUPERPASTE_BENCH_EAGER="1")
+        results["cli_paste_eager"] = measure([python, shim, "--backend", "hst.sh", file.name], args.repeat, eager_env)
+
+        # The same paste, forwarded to a daemon (which is pointed at the mock server by the shim)
+        daemon_env = dict(env, SUPERPASTE_SOCKET=os.path.join(tempfile.mkdtemp(), "superpaste.sock"))
+        daemon = subprocess.Popen(
+            [python, shim, "daemon", "--backend", "hst.sh"], env=daemon_env, stderr=subprocess.DEVNULL
+        )
+        try:
+            while not os.path.exists(daemon_env["SUPERPASTE_SOCKET"]):
+                time.sleep(0.05)
+            cli = [python, "-m", "superpaste", "--backend", "hst.sh", file.name]
+            results["cli_paste_daemon"] = measure(cli, args.repeat, daemon_env)
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+    for name, stats in results.items():
+        print(
+            "%-16s median=%.1fms min=%.1fms" % (name, stats["median_s"] * 1000, stats["min_s"] * 1000), file=sys.stderr
+        )
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as fd:
+            json.dump(report, fd, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,9 @@
-from .backends import *
+from typing import Any
+
+from . import backends
+from .backends import __all__ as __all__
+
+
+def __getattr__(name: str) -> Any:
+    # Backends are imported on first use, see `superpaste.backends`.
+    return getattr(backends, name)
@@ -1,52 +1,792 @@
 import argparse
+import fnmatch
+import glob
+import json
+import os
 import pathlib
 import sys
-from typing import Dict, Type
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Set
 
 
-def main():
+def _is_glob(pattern: str) -> bool:
+    return any(c in pattern for c in "*?[")
+
+
+def _matches(path: str, patterns: Sequence[str]) -> bool:
+    """Matches patterns containing a `/` against the whole (relative) path, and the rest against the file name."""
+    path = path.replace(os.sep, "/")
+    name = path.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatchcase(path if "/" in pattern else name, pattern) for pattern in patterns)
+
+
+def expand_inputs(
+    inputs: Sequence[str],
+    recursive: bool = False,
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = (),
+) -> Iterator[str]:
+    """
+    Expands the CLI's inputs into file paths, lazily, so that the first files can be pasted while the rest are found.
+
+    Globs are expanded (`**` matches any number of directories), and directories are walked if `recursive` is set.
+    Files found this way are filtered by `include` and `exclude`, relative to the directory or glob that found them.
+    Files named directly are always used. Every file is only yielded once.
+
+    :param inputs: The paths, globs and directories given, or `-` for stdin
+    :param recursive: Whether to walk directories
+    :param include: If given, only files matching one of these patterns are used
+    :param exclude: Files (and directories) matching one of these patterns are skipped
+    """
+    seen = set()
+
+    def wanted(relative: str) -> bool:
+        return (not include or _matches(relative, include)) and not _matches(relative, exclude)
+
+    def once(path: str) -> bool:
+        real = os.path.realpath(path)
+        if real in seen:
+            return False
+        seen.add(real)
+        return True
+
+    for item in inputs:
+        if item == "-":
+            yield item
+        elif _is_glob(item) and not os.path.exists(item):
+            for path in sorted(glob.iglob(item, recursive=True)):
+                if os.path.isfile(path) and wanted(path) and once(path):
+                    yield path
+        elif os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs[:] = sorted(d for d in dirs if not _matches(os.path.relpath(os.path.join(root, d), item), exclude))
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    if wanted(os.path.relpath(path, item)) and once(path):
+                        yield path
+        elif once(item):
+            yield item
+
+
+def _result_line(name: str, result, size: Optional[int], elapsed: float) -> dict:
+    line = {"file": name, "url": result.url, "key": result.key, "size": size, "seconds": round(elapsed, 4)}
+    if getattr(result, "parts", None):
+        line["parts"] = [part.url for part in result.parts]
+    return line
+
+
+def _reporter(json_lines: bool = False, bare: bool = False) -> Callable[..., bool]:
+    """
+    Builds the function that prints each file's result (or error) as it finishes.
+
+    :param json_lines: Whether to print lines of JSON
+    :param bare: Whether to print just the URL, as for a single file
+    """
+
+    def report(name: str, result=None, error: Exception = None, size: int = None, elapsed: float = 0.0) -> bool:
+        if error is not None:
+            error_name = getattr(error, "type_name", type(error).__name__)
+            if json_lines:
+                line = {"file": name, "error": "%s: %s" % (error_name, error), "seconds": round(elapsed, 4)}
+                print(json.dumps(line), flush=True)
+            else:
+                reason = str(error).splitlines()[0] if str(error) else ""
+                print("File %s: failed: %s: %s" % (name, error_name, reason), file=sys.stderr, flush=True)
+            return False
+        if json_lines:
+            print(json.dumps(_result_line(name, result, size, elapsed)), flush=True)
+        elif bare:
+            print(result.url, flush=True)
+        else:
+            print("File %s: %s" % (name, result.url), flush=True)
+        return True
+
+    return report
+
+
+def _run_each(
+    paths: Iterator[str],
+    jobs: int,
+    open_file: Callable[[str], Any],
+    upload: Callable[[Any], Any],
+    report: Callable[..., bool],
+) -> int:
+    """
+    The pipeline behind `paste_each` and `forward_each`.
+
+    Files are opened on this thread while up to `jobs` uploads run in a thread pool, and at most `jobs` more files
+    are opened ahead of them. A file that fails is reported, and the rest carry on.
+
+    :return: The number of files that failed
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    failures = 0
+
+    def timed_upload(file) -> tuple:
+        started = time.perf_counter()
+        size = getattr(file, "size", None)
+        try:
+            result = upload(file)
+        except Exception as e:
+            return None, e, size, time.perf_counter() - started
+        return result, None, size, time.perf_counter() - started
+
+    def finish(done) -> None:
+        nonlocal failures
+        for future in done:
+            name = pending.pop(future)
+            if not report(name, *future.result()):
+                failures += 1
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="superpaste-upload") as pool:
+        for name in paths:
+            started = time.perf_counter()
+            try:
+                file = open_file(name)
+            except (OSError, ValueError) as e:
+                report(name, error=e, elapsed=time.perf_counter() - started)
+                failures += 1
+                continue
+            pending[pool.submit(timed_upload, file)] = name
+            if len(pending) >= jobs * 2:
+                finish(wait(pending, return_when=FIRST_COMPLETED).done)
+        while pending:
+            finish(wait(pending, return_when=FIRST_COMPLETED).done)
+    return failures
+
+
+def paste_each(
+    backend,
+    paths: Iterator[str],
+    *,
+    jobs: int = 4,
+    split: bool = False,
+    json_lines: bool = False,
+    metrics=None,
+    bare: bool = False,
+) -> int:
+    """
+    Pastes every file separately, printing each result as soon as it is done.
+
+    Files are opened on this thread while up to `jobs` uploads run in a thread pool, and at most `jobs` more files
+    are read ahead of them. A file that fails is reported, and the rest carry on.
+
+    :return: The number of files that failed
+    """
+    from . import backends
+
+    part_size = backend.max_file_size or backend.max_paste_size
+
+    def upload(file):
+        size = getattr(file, "size", None)
+        if split or (size and part_size and size > part_size):
+            return backends.create_split_paste(backend, file)
+        return backend.create_paste(file)
+
+    return _run_each(paths, jobs, _opener(backend, metrics), upload, _reporter(json_lines, bare))
+
+
+def _opener(backend, metrics=None) -> Callable[[str], Any]:
+    """Builds the function that opens each file (or `-` for stdin) the way `backend` takes it"""
+    from . import backends
+
+    def open_file(name: str):
+        started = time.perf_counter()
+        if name == "-":
+            if backend.supports_streaming:
+                file = backends.StreamFile.from_stream(sys.stdin.buffer)
+            else:
+                file = backend.file_class(content=sys.stdin.buffer.read().decode("utf-8"))
+        elif backend.supports_streaming:
+            file = backends.MappedFile.from_file(name)
+        else:
+            file = backend.file_class.from_file(pathlib.Path(name))
+        if metrics is not None:
+            metrics.record_phase(backend.name, "read", time.perf_counter() - started)
+        return file
+
+    return open_file
+
+
+def bundle_each(backend, paths: Iterator[str], *, jobs: int = 4, json_lines: bool = False, metrics=None) -> int:
+    """
+    Pastes small files together, bundled into as few pastes as the backend's limits allow (see
+    `create_bundled_paste`), then prints each file's result.
+
+    :return: The number of files that failed
+    """
+    from . import backends
+
+    open_file = _opener(backend, metrics)
+    report = _reporter(json_lines)
+    names, files, failures = [], [], 0
+    started = time.perf_counter()
+    for name in paths:
+        try:
+            files.append(open_file(name))
+        except (OSError, ValueError) as e:
+            report(name, error=e, elapsed=time.perf_counter() - started)
+            failures += 1
+            continue
+        names.append(name)
+    bundle_names = ["stdin" if name == "-" else name for name in names]
+    results = backends.create_bundled_paste(
+        backend, *files, names=bundle_names, max_concurrency=jobs, return_exceptions=True
+    )
+    elapsed = time.perf_counter() - started
+    done = set()
+    for result in results:
+        if isinstance(result, BaseException):
+            continue
+        for i in result.files:
+            report(names[i], result, size=getattr(files[i], "size", None), elapsed=elapsed)
+            done.add(i)
+    error = next((result for result in results if isinstance(result, BaseException)), None)
+    for i, name in enumerate(names):
+        if i not in done:
+            report(name, error=error, elapsed=elapsed)
+            failures += 1
+    return failures
+
+
+class _Forwarded:
+    """An open file, to be forwarded to the daemon"""
+
+    __slots__ = ("fd", "filename", "size")
+
+    def __init__(self, fd, filename: Optional[str], size: Optional[int]):
+        self.fd = fd
+        self.filename = filename
+        self.size = size
+
+
+def forward_each(
+    daemon,
+    backend: str,
+    paths: Iterator[str],
+    *,
+    jobs: int = 4,
+    split: bool = False,
+    json_lines: bool = False,
+    bare: bool = False,
+) -> int:
+    """
+    Like `paste_each`, but pastes through a running daemon (see `superpaste._daemon`), streaming each file to it.
+
+    :param daemon: The `DaemonClient` to use
+    :param backend: The name of the backend to paste to
+    :return: The number of files that failed
+    """
+
+    def open_file(name: str) -> _Forwarded:
+        if name == "-":
+            return _Forwarded(sys.stdin.buffer, None, None)
+        fd = open(name, "rb")
+        return _Forwarded(fd, os.path.basename(name), os.fstat(fd.fileno()).st_size)
+
+    def upload(file: _Forwarded):
+        try:
+            reply = daemon.paste(backend, file.fd, file.filename, split)
+        finally:
+            if file.fd is not sys.stdin.buffer:
+                file.fd.close()
+        parts = [SimpleNamespace(url=url) for url in reply.get("parts", ())]
+        return SimpleNamespace(key=reply["key"], url=reply["url"], parts=parts)
+
+    return _run_each(paths, jobs, open_file, upload, _reporter(json_lines, bare))
+
+
+def _pool_kwargs(backend_class, jobs: int) -> dict:
+    """Backend keyword arguments that make its connection pool big enough for `jobs` requests at once"""
+    if jobs <= backend_class.limits.max_connections:
+        return {}
+    import httpx
+
+    return {"limits": httpx.Limits(max_connections=jobs, max_keepalive_connections=jobs)}
+
+
+def _read_keys(keys: Sequence[str]) -> Iterator[str]:
+    """Yields the given keys, reading keys from stdin (one per line) in place of `-`"""
+    for key in keys:
+        if key != "-":
+            yield key
+            continue
+        for line in sys.stdin:
+            if line.strip():
+                yield line.strip()
+
+
+def get_main(argv: List[str]) -> int:
+    """`superpaste get`: downloads pastes."""
+    import itertools
+    import threading
+
+    from . import backends
+
+    parser = argparse.ArgumentParser(description="SuperPaste - download pastes")
+    parser.prog += " get"
+    parser.add_argument(
+        "--backend",
+        "-b",
+        type=str,
+        help="Backend to use: %s, or any installed plugin" % ", ".join(backends.backend_names(plugins=False)),
+    )
+    parser.add_argument(
+        "keys",
+        metavar="KEY",
+        type=str,
+        nargs="+",
+        help="Keys of the pastes to download. `-` reads keys from stdin, one per line.",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        metavar="DIR",
+        help="Download the pastes into this directory, each named after its key, streaming them to disk where the "
+        "backend allows it. Without this, pastes are written to stdout one after another.",
+    )
+    parser.add_argument("--jobs", "-j", type=int, default=4, help="How many pastes to download at once. Default: 4")
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print each download as a line of JSON, with the key, path, bytes and seconds taken (or the error).",
+    )
+    parser.add_argument(
+        "--unbundle",
+        action="store_true",
+        help="Split pastes made with `superpaste --bundle` back into their files, in --output. Files that would "
+        "share a name are prefixed with their paste's key (and numbered).",
+    )
+    parser.add_argument("--timings", action="store_true", help="Print a breakdown of where the time went to stderr.")
+    args = parser.parse_args(argv)
+
+    if not args.backend:
+        parser.error("No backend specified")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.json and not args.output:
+        parser.error("--json needs --output")
+    if args.unbundle and not args.output:
+        parser.error("--unbundle needs --output")
+    try:
+        backend_class = backends.load_backend(args.backend)
+    except KeyError as e:
+        parser.error(e.args[0])
+
+    started = time.perf_counter()
+    metrics = backends.InMemoryMetrics() if args.timings else None
+    failures = 0
+    with backend_class(metrics=metrics, **_pool_kwargs(backend_class, args.jobs)) as backend:
+        if not args.output:
+            for key in _read_keys(args.keys):
+                try:
+                    files = backend.get_paste(key)
+                except Exception as e:
+                    failures += 1
+                    reason = str(e).splitlines()[0] if str(e) else ""
+                    print("Key %s: failed: %s: %s" % (key, type(e).__name__, reason), file=sys.stderr)
+                    continue
+                for file in files if isinstance(files, list) else [files]:
+                    content = file.content
+                    sys.stdout.buffer.write(content.encode("utf-8") if isinstance(content, str) else content)
+                sys.stdout.buffer.flush()
+        else:
+            os.makedirs(args.output, exist_ok=True)
+            taken: Set[str] = set()
+            taken_lock = threading.Lock()
+
+            def claim(name: str, key: str) -> str:
+                """Picks a path for `name` that no other paste or bundle member in this run is written to."""
+                base = backends.base._download_name(name)
+                prefixed = "%s-%s" % (backends.base._download_name(key), base)
+                stem, ext = os.path.splitext(prefixed)
+                numbered = ("%s-%d%s" % (stem, n, ext) for n in itertools.count(2))
+                with taken_lock:
+                    chosen = next(c for c in itertools.chain((base, prefixed), numbered) if c not in taken)
+                    taken.add(chosen)
+                return os.path.join(args.output, chosen)
+
+            def download(key: str) -> List[tuple]:
+                begun = time.perf_counter()
+                if not args.unbundle:
+                    path = claim(key, key)
+                    return [(None, path, backend.download_paste(key, path), time.perf_counter() - begun)]
+                written = []
+                for name, content in backends.get_bundled_paste(backend, key):
+                    # Members named e.g. `a/app.log` and `b/app.log` would otherwise overwrite each other.
+                    path = claim(name, key)
+                    with backends.base._atomic_write(path) as fd:
+                        fd.write(content)
+                    written.append((name, path, len(content), time.perf_counter() - begun))
+                return written
+
+            for key, result in backends.iter_concurrently(download, _read_keys(args.keys), args.jobs, True):
+                if isinstance(result, Exception):
+                    failures += 1
+                    if args.json:
+                        print(json.dumps({"key": key, "error": "%s: %s" % (type(result).__name__, result)}), flush=True)
+                    else:
+                        reason = str(result).splitlines()[0] if str(result) else ""
+                        print("Key %s: failed: %s: %s" % (key, type(result).__name__, reason), file=sys.stderr)
+                    continue
+                for member, path, size, elapsed in result:
+                    if args.json:
+                        line = {"key": key, "path": path, "bytes": size, "seconds": round(elapsed, 4)}
+                        if member is not None:
+                            line["member"] = member
+                        print(json.dumps(line), flush=True)
+                    elif member is not None:
+                        print("Key %s: %s -> %s (%d bytes)" % (key, member, path, size), flush=True)
+                    else:
+                        print("Key %s: %s (%d bytes)" % (key, path, size), flush=True)
+    if metrics is not None:
+        print(metrics.format(), file=sys.stderr)
+        print("wall time: %.2f ms" % ((time.perf_counter() - started) * 1000), file=sys.stderr)
+    return 1 if failures else 0
+
+
+def _redactor(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    """Builds the `Redactor` asked for by --redact and --redact-pattern, if any"""
+    if not args.redact and not args.redact_pattern:
+        return None
+    import re
+
+    from . import backends
+
+    patterns = {}
+    for item in args.redact_pattern:
+        name, sep, pattern = item.partition("=")
+        if not sep or not name:
+            parser.error("--redact-pattern takes NAME=REGEX, not %r" % item)
+        try:
+            re.compile(pattern.encode("utf-8"))
+        except re.error as e:
+            parser.error("--redact-pattern %s: %s" % (name, e))
+        patterns[name] = pattern
+    return backends.Redactor(patterns, workers=os.cpu_count() or 1)
+
+
+def _report_redactions(redactor) -> None:
+    if redactor is None:
+        return
+    redactor.close()
+    total = sum(redactor.counts.values())
+    counts = ", ".join("%s %d" % item for item in sorted(redactor.counts.items()))
+    print("Redacted %d secret(s)%s" % (total, ": " + counts if counts else ""), file=sys.stderr)
+
+
+def follow_main(backend_class, args: argparse.Namespace, redactor=None) -> int:
+    """`superpaste --follow`: uploads what is appended to a file, printing each new paste (and the index)."""
+    import signal
+    import threading
+
+    from . import backends
+
+    def report(segment) -> None:
+        if args.json:
+            line = {"file": args.files[0], "url": segment.url, "key": segment.key}
+            line.update(start=segment.start, end=segment.end, size=segment.end - segment.start)
+            print(json.dumps(line), flush=True)
+        else:
+            print("%s bytes %d-%d: %s" % (args.files[0], segment.start, segment.end, segment.url), flush=True)
+
+    shown = []
+
+    def show_index() -> None:
+        if follower.index is not None and follower.index not in shown:
+            url = follower.index.url
+            print(json.dumps({"file": args.files[0], "index": url}) if args.json else "index: %s" % url, flush=True)
+            shown[:] = [follower.index]
+
+    stop = threading.Event()
+    with backend_class(redactor=redactor) as backend:
+        try:
+            follower = backends.LogFollower(
+                backend,
+                args.files[0],
+                state_path=args.state,
+                batch_size=args.batch_size,
+                batch_interval=args.interval,
+                index=not args.no_index,
+                max_concurrency=args.jobs or 4,
+                on_segment=report,
+            )
+        except ValueError as e:  # the state file belongs to another backend
+            print("superpaste: %s" % e, file=sys.stderr)
+            return 2
+        shown.append(follower.index)
+        if args.once:
+            try:
+                follower.flush()
+            except Exception as e:
+                print("%s: failed: %s: %s" % (args.files[0], type(e).__name__, e), file=sys.stderr)
+                return 1
+            finally:
+                show_index()
+            return 0
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        try:
+            for _ in follower.follow(stop):
+                show_index()
+        except KeyboardInterrupt:
+            follower.flush()
+        show_index()
+    return 0
+
+
+def main(argv: Optional[List[str]] = None):
+    # Only the registry is imported up front. The chosen backend (and httpx) is imported once the arguments are
+    # parsed, so `--help` and typos stay fast.
     from . import backends
 
-    backend_list: Dict[str, Type[backends.BaseBackend]] = {
-        x.name: x
-        for x in backends.__dict__.values()
-        if isinstance(x, type) and issubclass(x, backends.BaseBackend) and x != backends.BaseBackend
-    }
-    # This is so ugly. I love it.
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "get":
+        return get_main(argv[1:])
+    if argv and argv[0] == "daemon":
+        from ._daemon import daemon_main
 
-    parser = argparse.ArgumentParser(description="SuperPaste - paste anywhere")
-    parser.add_argument("--backend", "-b", type=str, choices=list(backend_list.keys()), help="Backend to use")
+        return daemon_main(argv[1:])
+    if argv and argv[0] == "serve":
+        from ._server import serve_main
+
+        return serve_main(argv[1:])
+
+    parser = argparse.ArgumentParser(
+        description="SuperPaste - paste anywhere. Use `%(prog)s get --help` to download pastes, "
+        "`%(prog)s daemon --help` to keep connections warm between runs, and `%(prog)s serve --help` to run a "
+        "paste server of your own."
+    )
+    parser.add_argument(
+        "--backend",
+        "-b",
+        type=str,
+        help="Backend to use: %s, or any installed plugin" % ", ".join(backends.backend_names(plugins=False)),
+    )
     parser.add_argument(
         "files",
         metavar="FILE",
         type=str,
         nargs="+",
-        help="Files to paste. `-` reads from stdin, everything else resolves to file paths.",
+        help="Files to paste. `-` reads from stdin, everything else resolves to file paths. Globs (quoted, so that "
+        "the shell does not expand them) and, with --recursive, directories are expanded.",
+    )
+    parser.add_argument(
+        "--split",
+        action="store_true",
+        help="Split content that is too large for the backend into multiple pastes, linked by a manifest paste. "
+        "Files that are known to be too large are always split.",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Print a breakdown of where the time went (reading, connecting, uploading, ...) to stderr.",
+    )
+    batch = parser.add_argument_group(
+        "batches",
+        "Any of these options pastes every file separately, in parallel, printing each result as soon as it is done. "
+        "Files that fail are reported without stopping the rest, and the exit status is 1 if any did.",
+    )
+    batch.add_argument("--jobs", "-j", type=int, help="How many files to upload at once. Default: 4")
+    batch.add_argument("--recursive", "-r", action="store_true", help="Paste every file in the given directories.")
+    batch.add_argument(
+        "--include",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="Only paste files (found in directories or by globs) matching this pattern, e.g. `*.log`. "
+        "Patterns with a `/` match the path relative to the directory. Can be given more than once.",
+    )
+    batch.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="Skip files and directories matching this pattern. Can be given more than once.",
+    )
+    batch.add_argument(
+        "--json",
+        action="store_true",
+        help="Print each result as a line of JSON, with the file, url, key, size and seconds taken (or the error).",
+    )
+    batch.add_argument(
+        "--bundle",
+        action="store_true",
+        help="Bundle small files together into as few pastes as the backend allows, rather than one paste each. "
+        "`%(prog)s get --unbundle` splits them up again.",
+    )
+    forwarding = parser.add_argument_group(
+        "daemon",
+        "If a daemon (`superpaste daemon`) is running, files are pasted through it, reusing its warm connections. "
+        "Otherwise, they are pasted from this process.",
+    )
+    forwarding.add_argument(
+        "--socket", help="The daemon's socket. Defaults to $SUPERPASTE_SOCKET, or a per-user socket."
     )
-    args = parser.parse_args()
+    forwarding.add_argument("--no-daemon", action="store_true", help="Never paste through the daemon.")
+    following = parser.add_argument_group(
+        "follow",
+        "With --follow or --once, FILE is tailed from where the last run stopped, and only what was appended is "
+        "uploaded, in new pastes that fit the backend's limits. An index paste lists every one of them.",
+    )
+    following.add_argument(
+        "--follow", "-f", action="store_true", help="Keep uploading whatever is appended to FILE, until interrupted."
+    )
+    following.add_argument(
+        "--once", action="store_true", help="Like --follow, but upload what was appended since the last run, and exit."
+    )
+    following.add_argument(
+        "--state",
+        metavar="PATH",
+        help="Where to keep the offset and pastes. Default: per file, in ~/.cache/superpaste.",
+    )
+    following.add_argument(
+        "--batch-size", type=int, metavar="BYTES", help="Upload once this many bytes are waiting. Default: a full paste"
+    )
+    following.add_argument(
+        "--interval",
+        type=float,
+        default=10.0,
+        metavar="SECONDS",
+        help="Upload whatever is waiting once it has waited this long. Default: 10",
+    )
+    following.add_argument("--no-index", action="store_true", help="Do not keep an index paste.")
+    redaction = parser.add_argument_group(
+        "redaction",
+        "Scrub secrets out of every file before it is uploaded, replacing each with `[REDACTED:<pattern>]`. "
+        "How many were redacted is printed to stderr.",
+    )
+    redaction.add_argument(
+        "--redact",
+        action="store_true",
+        help="Redact tokens and keys (AWS, GitHub, Slack, Stripe, Google, JWTs, private keys, bearer tokens), "
+        "password/secret/api_key values and email addresses.",
+    )
+    redaction.add_argument(
+        "--redact-pattern",
+        action="append",
+        default=[],
+        metavar="NAME=REGEX",
+        help="Also redact matches of this regular expression. Implies --redact. Can be given more than once.",
+    )
+    args = parser.parse_args(argv)
     if not args.files:
         parser.error("No files specified")
 
-    backend = backend_list[args.backend]()
+    if not args.backend:
+        parser.error("No backend specified")
+    redactor = _redactor(parser, args)
+    if args.follow or args.once:
+        if len(args.files) != 1 or args.files[0] == "-" or not os.path.isfile(args.files[0]):
+            parser.error("--follow takes exactly one file")
+        try:
+            backend_class = backends.load_backend(args.backend)
+        except KeyError as e:
+            parser.error(e.args[0])
+        try:
+            return follow_main(backend_class, args, redactor)
+        finally:
+            _report_redactions(redactor)
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.files.count("-") > 1:
+        parser.error("stdin (`-`) can only be read once")
+    for file in args.files:
+        if file == "-" or (_is_glob(file) and not os.path.exists(file)):
+            continue
+        if not os.path.exists(file):
+            parser.error(f"File {file} does not exist")
+        if os.path.isdir(file) and not args.recursive:
+            parser.error(f"{file} is a directory (use --recursive to paste the files in it)")
+    batched = bool(
+        args.jobs
+        or args.recursive
+        or args.include
+        or args.exclude
+        or args.json
+        or args.bundle
+        or any(map(_is_glob, args.files))
+    )
+
+    # The daemon pastes files as they are, so bundling and redacting happen here.
+    if not args.no_daemon and not args.timings and not args.bundle and redactor is None:
+        from ._daemon import DaemonClient
+
+        client = DaemonClient(args.socket)
+        if client.available():
+            if args.backend not in backends.backend_names():
+                parser.error("Unknown backend %r. Available: %s" % (args.backend, ", ".join(backends.backend_names())))
+            # Files are sent at once, so that the daemon can put them in the same paste where the backend allows it.
+            jobs = args.jobs or (4 if batched else min(len(args.files), 16))
+            paths = expand_inputs(args.files, args.recursive, args.include, args.exclude)
+            bare = not batched and len(args.files) == 1
+            failures = forward_each(
+                client, args.backend, paths, jobs=jobs, split=args.split, json_lines=args.json, bare=bare
+            )
+            return 1 if failures else 0
+
+    try:
+        backend_class = backends.load_backend(args.backend)
+    except KeyError as e:
+        parser.error(e.args[0])
+
+    started = time.perf_counter()
+    metrics = backends.InMemoryMetrics() if args.timings else None
+    if batched:
+        jobs = args.jobs or 4
+        paths = expand_inputs(args.files, args.recursive, args.include, args.exclude)
+        with backend_class(metrics=metrics, redactor=redactor, **_pool_kwargs(backend_class, jobs)) as backend:
+            if args.bundle:
+                failures = bundle_each(backend, paths, jobs=jobs, json_lines=args.json, metrics=metrics)
+            else:
+                failures = paste_each(
+                    backend, paths, jobs=jobs, split=args.split, json_lines=args.json, metrics=metrics
+                )
+        _report_redactions(redactor)
+        if metrics is not None:
+            print(metrics.format(), file=sys.stderr)
+            print("wall time: %.2f ms" % ((time.perf_counter() - started) * 1000), file=sys.stderr)
+        return 1 if failures else 0
+
+    backend = backend_class(metrics=metrics, redactor=redactor)
     parsed_files = []
     for file in args.files:
         if file == "-":
-            content = sys.stdin.buffer.read().decode("utf-8")
-            parsed_files.append(backend.file_class(content=content))
+            if backend.supports_streaming:
+                parsed_files.append(backends.StreamFile.from_stream(sys.stdin.buffer))
+            else:
+                content = sys.stdin.buffer.read().decode("utf-8")
+                parsed_files.append(backend.file_class(content=content))
         else:
             pf = pathlib.Path(file)
-            if not pf.exists():
-                parser.error(f"File {file} does not exist")
-            parsed_files.append(backend.file_class.from_file(pf))
+            if backend.supports_streaming:
+                parsed_files.append(backends.MappedFile.from_file(pf))
+            else:
+                parsed_files.append(backend.file_class.from_file(pf))
+    if metrics is not None:
+        metrics.record_phase(backend.name, "read", time.perf_counter() - started)
 
     print("Posting %d file(s)..." % len(parsed_files), end="\r")
-    result = backend.create_paste(*parsed_files)
+    part_size = backend.max_file_size or backend.max_paste_size
+    if args.split or any(getattr(f, "size", None) and f.size > (part_size or f.size) for f in parsed_files):
+        result = [backends.create_split_paste(backend, f) for f in parsed_files]
+        if len(result) == 1:
+            result = result[0]
+    else:
+        result = backend.create_paste(*parsed_files)
     if isinstance(result, list):
         for i, x in enumerate(result):
             print(f"File {args.files[i]}: {x.url}")
     else:
         print(result.url)
+    _report_redactions(redactor)
+    if metrics is not None:
+        print(metrics.format(), file=sys.stderr)
+        print("wall time: %.2f ms" % ((time.perf_counter() - started) * 1000), file=sys.stderr)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,436 @@
+"""
+A local daemon that keeps backends (and their warm, pooled connections) alive between CLI invocations.
+
+The CLI forwards pastes to it over a Unix socket, streaming each file's content, and the daemon uploads them through
+a `PasteQueue` per backend, so that files sent by concurrent clients can share pastes.
+
+The protocol is deliberately small. A client sends a JSON header line, e.g.
+``{"op": "paste", "backend": "hst.sh", "filename": "build.log", "split": false}``, followed (for pastes) by the
+content as frames of a 4-byte big-endian length and that many bytes, ended by an empty frame. The daemon answers
+with a single JSON line: the result (``key``, ``url`` and, for split pastes, ``parts``), or ``error``.
+
+This module must stay cheap to import: the client side runs in every CLI invocation, so only the daemon imports the
+backends.
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import struct
+import tempfile
+import threading
+import time
+from typing import IO, Any, Dict, Iterable, List, Optional
+
+__all__ = ("DaemonClient", "DaemonError", "PasteDaemon", "default_socket_path")
+
+_FRAME = struct.Struct("!I")
+_PEERCRED = struct.Struct("3i")  # struct ucred: pid, uid, gid
+CHUNK_SIZE = 64 * 1024
+SPOOL_SIZE = 1024 * 1024
+
+_log = logging.getLogger("superpaste.daemon")
+
+
+def default_socket_path() -> str:
+    """
+    The socket the daemon listens on, and the CLI looks for it on: ``$SUPERPASTE_SOCKET``, else ``superpaste.sock``
+    in ``$XDG_RUNTIME_DIR``, else ``superpaste.sock`` in a per-user directory (only its owner may enter) in the
+    temporary directory.
+    """
+    if os.environ.get("SUPERPASTE_SOCKET"):
+        return os.environ["SUPERPASTE_SOCKET"]
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "superpaste.sock")
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(tempfile.gettempdir(), "superpaste-%d" % uid, "superpaste.sock")
+
+
+def _private_dir(path: str) -> None:
+    """
+    Creates the directory a socket goes in, readable only by this user, and refuses one that another user could
+    have put a socket in.
+
+    :raises PermissionError: If the directory belongs to another user, or others may write to it
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if not hasattr(os, "getuid"):
+        return
+    st = os.stat(path)
+    if st.st_mode & stat.S_ISVTX:
+        return  # e.g. /tmp itself: others cannot replace this user's socket, and clients check who serves it
+    if st.st_uid != os.getuid():
+        raise PermissionError("%s belongs to another user" % path)
+    if st.st_mode & 0o022:
+        raise PermissionError("%s can be written to by other users" % path)
+
+
+def _check_peer(sock: socket.socket, path: str) -> None:
+    """
+    Refuses a socket that is not served by this user. Anyone could otherwise listen on the path first, and be sent
+    whatever is pasted.
+
+    :raises PermissionError: If the socket is served by another user
+    """
+    if not hasattr(os, "getuid"):
+        return
+    if hasattr(socket, "SO_PEERCRED"):
+        _, uid, _ = _PEERCRED.unpack(sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, _PEERCRED.size))
+    else:
+        uid = os.stat(path).st_uid
+    if uid != os.getuid():
+        raise PermissionError("%s is served by another user (uid %d), refusing to use it" % (path, uid))
+
+
+class DaemonError(RuntimeError):
+    """An error the daemon reported for a request"""
+
+    def __init__(self, message: str, type_name: str = "DaemonError"):
+        super().__init__(message)
+        self.type_name = type_name
+        """The name of the exception the daemon raised"""
+
+
+def _read_exactly(fd: IO[bytes], size: int) -> bytes:
+    data = fd.read(size)
+    if len(data) != size:
+        raise ConnectionError("Connection closed mid-request")
+    return data
+
+
+def _read_frames(fd: IO[bytes]) -> Iterable[bytes]:
+    while True:
+        (size,) = _FRAME.unpack(_read_exactly(fd, _FRAME.size))
+        if not size:
+            return
+        yield _read_exactly(fd, size)
+
+
+class DaemonClient:
+    """
+    Talks to a running `PasteDaemon`. Every request uses its own connection, so one client can be shared by threads.
+    """
+
+    def __init__(self, path: Optional[str] = None, timeout: Optional[float] = 300.0):
+        """
+        :param path: The daemon's socket. Defaults to `default_socket_path()`.
+        :param timeout: How long to wait for the daemon to answer, in seconds
+        """
+        self.path = path or default_socket_path()
+        self.timeout = timeout
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            _check_peer(sock, self.path)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def available(self) -> bool:
+        """Whether a daemon is listening on the socket"""
+        if not hasattr(socket, "AF_UNIX"):
+            return False
+        try:
+            self._connect().close()
+        except OSError:
+            return False
+        return True
+
+    def request(self, header: Dict[str, Any], chunks: Optional[Iterable[bytes]] = None) -> Dict[str, Any]:
+        """
+        Sends a request, and waits for the answer.
+
+        :param header: The request header
+        :param chunks: The content to stream after the header, if any
+        :raises DaemonError: If the daemon reports an error
+        :raises OSError: If the daemon cannot be reached
+        """
+        with self._connect() as sock, sock.makefile("rb") as reader:
+            sock.sendall(json.dumps(header).encode("utf-8") + b"\n")
+            if chunks is not None:
+                for chunk in chunks:
+                    if chunk:
+                        sock.sendall(_FRAME.pack(len(chunk)) + chunk)
+                sock.sendall(_FRAME.pack(0))
+            line = reader.readline()
+        if not line:
+            raise ConnectionError("The daemon closed the connection without answering")
+        reply = json.loads(line)
+        if "error" in reply:
+            raise DaemonError(reply["error"], reply.get("type", "DaemonError"))
+        return reply
+
+    def paste(self, backend: str, fd: IO[bytes], filename: Optional[str] = None, split: bool = False) -> Dict[str, Any]:
+        """
+        Pastes the content of a binary file object through the daemon.
+
+        :param backend: The name of the backend to use
+        :param fd: The content to paste. It is read in chunks, and streamed to the daemon.
+        :param filename: The name of the file, if any
+        :param split: Whether to split content that is too large for the backend into multiple pastes
+        :return: The result's ``key`` and ``url``, and ``parts`` for split pastes
+        """
+        header = {"op": "paste", "backend": backend, "filename": filename, "split": split}
+        return self.request(header, iter(lambda: fd.read(CHUNK_SIZE), b""))
+
+    def status(self) -> Dict[str, Any]:
+        """The daemon's backends and counters"""
+        return self.request({"op": "status"})
+
+    def stop(self) -> None:
+        """Asks the daemon to finish its pending pastes and exit"""
+        self.request({"op": "stop"})
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "_Server"
+
+    def handle(self) -> None:
+        try:
+            header = json.loads(self.rfile.readline() or b"{}")
+            reply = self.server.daemon.handle(header, self.rfile)
+        except Exception as e:
+            _log.debug("Request failed", exc_info=True)
+            reply = {"error": str(e).splitlines()[0] if str(e) else "", "type": type(e).__name__}
+        try:
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+        except OSError:
+            _log.debug("Client went away before its answer", exc_info=True)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+    daemon: "PasteDaemon"
+
+
+class PasteDaemon:
+    """
+    Serves pastes for `DaemonClient`s on a Unix socket, from warm backends that live as long as it does.
+
+    Each backend is created on first use (or up front, for those given to `__init__`) and fronted by a `PasteQueue`,
+    so that files from concurrent clients are uploaded together where the backend allows several files per paste.
+    Received content is spooled (in memory up to a point, then on disk), so that it can be retried.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        backends: Iterable[str] = (),
+        *,
+        max_delay: float = 0.05,
+        max_concurrency: int = 16,
+    ):
+        """
+        :param path: The socket to listen on. Defaults to `default_socket_path()`.
+        :param backends: Names of backends to create and connect to up front
+        :param max_delay: How long a file waits for others to share its paste, in seconds
+        :param max_concurrency: How many pastes to upload at once, per backend
+        """
+        self.path = path or default_socket_path()
+        self.max_delay = max_delay
+        self.max_concurrency = max_concurrency
+        self.started = time.time()
+        self.pastes = 0
+        """How many pastes have been requested"""
+        self.failed = 0
+        """How many of those failed"""
+        self._backends: Dict[str, Any] = {}
+        self._queues: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[_Server] = None
+        self._warm = list(backends)
+
+    def _warm_up(self) -> None:
+        """Creates and connects the backends given to `__init__`, without holding up the first clients"""
+        for name in self._warm:
+            try:
+                self.backend(name).warm_up()
+            except Exception as e:
+                _log.warning("Could not connect to %s ahead of time: %s", name, e)
+
+    def backend(self, name: str) -> Any:
+        """Gets the backend by the given name, creating it on first use. It stays connected from then on."""
+        with self._lock:
+            if name in self._backends:
+                return self._backends[name]
+            from .backends import PasteQueue, load_backend
+
+            backend = load_backend(name)(**self._backend_kwargs())
+            self._backends[name] = backend
+            self._queues[name] = PasteQueue(backend, max_delay=self.max_delay, max_concurrency=self.max_concurrency)
+            _log.info("Loaded backend %s", name)
+            return backend
+
+    def _backend_kwargs(self) -> Dict[str, Any]:
+        import httpx
+
+        limits = httpx.Limits(max_connections=self.max_concurrency * 2, keepalive_expiry=300.0)
+        return {"limits": limits}
+
+    def handle(self, header: Dict[str, Any], fd: IO[bytes]) -> Dict[str, Any]:
+        """
+        Handles a single request.
+
+        :param header: The request header
+        :param fd: The connection, to read any content from
+        :return: The reply
+        """
+        op = header.get("op")
+        if op == "paste":
+            return self._paste(header, fd)
+        if op == "status":
+            return {
+                "pid": os.getpid(),
+                "uptime": round(time.time() - self.started, 1),
+                "backends": sorted(self._backends),
+                "pending": sum(queue.pending for queue in self._queues.values()),
+                "pastes": self.pastes,
+                "failed": self.failed,
+                "requests": sum(queue.requests for queue in self._queues.values()),
+            }
+        if op == "stop":
+            threading.Thread(target=self.stop, name="superpaste-daemon-stop").start()
+            return {"stopping": True}
+        raise ValueError("Unknown operation %r" % op)
+
+    def _paste(self, header: Dict[str, Any], fd: IO[bytes]) -> Dict[str, Any]:
+        from .backends import StreamFile, create_split_paste
+
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        try:
+            for chunk in _read_frames(fd):
+                spool.write(chunk)
+            size = spool.tell()
+            with self._lock:
+                self.pastes += 1
+            backend = self.backend(header["backend"])
+
+            def read_spool() -> Iterable[bytes]:
+                spool.seek(0)
+                return iter(lambda: spool.read(CHUNK_SIZE), b"")
+
+            file = StreamFile(read_spool, filename=header.get("filename"), size=size)
+            part_size = backend.max_file_size or backend.max_paste_size
+            try:
+                if header.get("split") or (part_size and size > part_size):
+                    result = create_split_paste(backend, file)
+                else:
+                    result = self._queues[header["backend"]].submit(file).result()
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+                raise
+        finally:
+            spool.close()
+        reply = {"key": result.key, "url": result.url}
+        if getattr(result, "parts", None):
+            reply["parts"] = [part.url for part in result.parts]
+        return reply
+
+    def serve_forever(self) -> None:
+        """
+        Listens on the socket until `stop` is called.
+
+        :raises RuntimeError: If another daemon is already listening on the socket
+        :raises PermissionError: If the socket's directory could let another user take the socket over
+        """
+        _private_dir(os.path.dirname(os.path.abspath(self.path)))
+        if os.path.exists(self.path):
+            if DaemonClient(self.path).available():
+                raise RuntimeError("A daemon is already listening on %s" % self.path)
+            os.remove(self.path)  # left behind by a daemon that did not exit cleanly
+        old_umask = os.umask(0o177)  # only this user may connect
+        try:
+            self._server = _Server(self.path, _Handler)
+        finally:
+            os.umask(old_umask)
+        self._server.daemon = self
+        _log.info("Listening on %s", self.path)
+        threading.Thread(target=self._warm_up, name="superpaste-daemon-warm-up", daemon=True).start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            with self._lock:
+                queues, backends = list(self._queues.values()), list(self._backends.values())
+            for queue in queues:
+                queue.close()
+            for backend in backends:
+                backend.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            _log.info("Stopped")
+
+    def stop(self) -> None:
+        """Stops `serve_forever`, after which pending pastes are finished. Call this from another thread."""
+        if self._server is not None:
+            self._server.shutdown()
+
+
+def daemon_main(argv: List[str]) -> int:
+    """`superpaste daemon`: runs the daemon in the foreground."""
+    import argparse
+    import signal
+
+    from . import backends
+
+    parser = argparse.ArgumentParser(
+        description="Run a daemon that keeps warm connections to paste backends, for the CLI to forward to."
+    )
+    parser.prog += " daemon"
+    parser.add_argument("--socket", "-s", help="The socket to listen on. Default: %s" % default_socket_path())
+    parser.add_argument(
+        "--backend",
+        "-b",
+        action="append",
+        default=[],
+        help="A backend to connect to up front: %s. Can be given more than once. Others are loaded when first "
+        "used." % ", ".join(backends.backend_names(plugins=False)),
+    )
+    parser.add_argument(
+        "--max-delay",
+        type=float,
+        default=0.05,
+        help="How long a file waits for files from other clients to share its paste, in seconds. Default: 0.05",
+    )
+    parser.add_argument("--jobs", "-j", type=int, default=16, help="How many pastes to upload at once, per backend.")
+    parser.add_argument("--status", action="store_true", help="Print the running daemon's status, and exit.")
+    parser.add_argument("--stop", action="store_true", help="Stop the running daemon, and exit.")
+    args = parser.parse_args(argv)
+
+    if args.status or args.stop:
+        client = DaemonClient(args.socket)
+        try:
+            if args.stop:
+                client.stop()
+            else:
+                print(json.dumps(client.status(), indent=2))
+        except OSError:
+            print("No daemon is listening on %s" % client.path)
+            return 1
+        return 0
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # one line per request is too much for a daemon
+    for name in args.backend:
+        try:
+            backends.load_backend(name)
+        except KeyError as e:
+            parser.error(e.args[0])
+    daemon = PasteDaemon(args.socket, args.backend, max_delay=args.max_delay, max_concurrency=args.jobs)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=daemon.stop).start())
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        parser.error(str(e))
+    return 0
@@ -0,0 +1,718 @@
+"""
+A hastebin-compatible paste server, for `GenericBackend` (or any other hastebin client) to paste to.
+
+    superpaste serve --port 7777 --data /var/lib/superpaste --ttl 604800
+
+- ``POST /documents`` stores the request body (sent with a ``Content-Length`` or chunked, and optionally compressed
+  with a ``Content-Encoding``), and answers ``{"key": "..."}``.
+- ``GET /raw/{key}`` (or ``GET /{key}``) answers the paste's content. ``HEAD`` works too.
+- ``GET /documents/{key}`` answers ``{"key": "...", "data": "..."}``, like hastebin.
+
+Pastes are content-addressed: a key is the start of the SHA-256 of its content, so the same content is only stored
+once, and a paste never changes (so it is served with a strong ETag, and clients may cache it for as long as it
+lives). Each is stored in a sharded directory (``<data>/ab/cd/abcd...``), gzip-compressed unless it is tiny. Clients
+that accept gzip are sent the stored file as it is with ``sendfile``, without copying it through Python. Others have
+it decompressed as it is sent. Small pastes that are fetched are also kept in an in-memory LRU cache.
+"""
+
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+
+__all__ = ("PasteServer", "PasteStore", "PasteTooLarge", "StoredPaste", "default_data_dir")
+
+CHUNK_SIZE = 64 * 1024
+KEY_LENGTH = 16
+_KEY = re.compile(r"[0-9a-f]{%d}" % KEY_LENGTH)
+_REASONS = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    415: "Unsupported Media Type",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+}
+
+_log = logging.getLogger("superpaste.server")
+
+
+def default_data_dir() -> str:
+    """Where `superpaste serve` stores pastes by default: ``$XDG_DATA_HOME/superpaste/pastes``"""
+    data = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(data, "superpaste", "pastes")
+
+
+class PasteTooLarge(ValueError):
+    """A paste is larger than the store's `max_size`"""
+
+
+@dataclass
+class StoredPaste:
+    """A paste on disk"""
+
+    key: str
+    path: str
+    encoding: Optional[str]
+    """`gzip` if the file is compressed, else None"""
+    size: int
+    """The size of the file, which is the compressed size if `encoding` is set"""
+    expires: Optional[float]
+    """When the paste expires, as a Unix timestamp, if the store has a `ttl`"""
+
+
+class _Writer:
+    """Receives a paste's content into a temporary file, hashing (and compressing) it as it arrives"""
+
+    def __init__(self, store: "PasteStore", compress: bool):
+        self._store = store
+        self._fd = tempfile.NamedTemporaryFile(dir=store.tmp_dir, delete=False)
+        self._digest = hashlib.sha256()
+        self._compressor = zlib.compressobj(store.compression_level, zlib.DEFLATED, 31) if compress else None
+        self.size = 0
+        """How many (uncompressed) bytes have been written"""
+
+    def write(self, chunk: bytes) -> None:
+        """
+        :raises PasteTooLarge: If the paste has grown past the store's `max_size`
+        """
+        self.size += len(chunk)
+        if self._store.max_size is not None and self.size > self._store.max_size:
+            raise PasteTooLarge("Pastes can be at most %d bytes" % self._store.max_size)
+        self._digest.update(chunk)
+        self._fd.write(self._compressor.compress(chunk) if self._compressor is not None else chunk)
+
+    def commit(self) -> str:
+        """Moves the paste into place, and returns its key"""
+        if self._compressor is not None:
+            self._fd.write(self._compressor.flush())
+        self._fd.close()
+        key = self._digest.hexdigest()[:KEY_LENGTH]
+        return self._store._put(key, self._fd.name, "gzip" if self._compressor is not None else None)
+
+    def abort(self) -> None:
+        """Throws away what was written"""
+        self._fd.close()
+        with suppress(FileNotFoundError):
+            os.remove(self._fd.name)
+
+
+class PasteStore:
+    """
+    Content-addressed, sharded storage for pastes, which are compressed and expire (if configured) on disk, and kept
+    in an in-memory LRU cache while they are being read (if they are small).
+
+    The store is safe to use from several threads at once, and by several processes sharing the same directory.
+
+    Example:
+    >>> store = PasteStore("/var/lib/superpaste", ttl=7 * 24 * 3600)
+    >>> key = store.put(b"content here")
+    >>> b"".join(store.iter_content(store.lookup(key)))
+    b'content here'
+    """
+
+    def __init__(
+        self,
+        root: Union[str, os.PathLike],
+        *,
+        max_size: Optional[int] = 16 * 1024 * 1024,
+        ttl: Optional[float] = None,
+        compression: bool = True,
+        compression_level: int = 6,
+        min_compress_size: int = 1024,
+        cache_size: int = 64 * 1024 * 1024,
+        cache_item_size: int = 256 * 1024,
+    ):
+        """
+        :param root: The directory to store pastes in. It is created if it does not exist.
+        :param max_size: The largest paste, in (uncompressed) bytes. None for no limit.
+        :param ttl: How long a paste lives after it was last uploaded, in seconds. None for forever.
+        :param compression: Whether to store pastes gzip-compressed
+        :param compression_level: The gzip compression level
+        :param min_compress_size: Pastes known to be smaller than this are not worth compressing
+        :param cache_size: The most bytes to keep in the in-memory cache
+        :param cache_item_size: The largest (stored) paste to keep in the in-memory cache
+        """
+        self.root = os.fspath(root)
+        self.tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.max_size = max_size
+        self.ttl = ttl
+        self.compression = compression
+        self.compression_level = compression_level
+        self.min_compress_size = min_compress_size
+        self.cache_size = cache_size
+        self.cache_item_size = cache_item_size
+        self._cache: "collections.OrderedDict[str, Tuple[bytes, Optional[str], Optional[float]]]"
+        self._cache = collections.OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<PasteStore root=%r ttl=%r cached=%d>" % (self.root, self.ttl, len(self._cache))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def writer(self, size: Optional[int] = None) -> _Writer:
+        """
+        Starts receiving a paste. Call `write` with each chunk of its content, then `commit` (which returns its key),
+        or `abort`.
+
+        :param size: The size of the content, if it is known up front
+        :raises PasteTooLarge: If `size` is larger than `max_size`
+        """
+        if size is not None and self.max_size is not None and size > self.max_size:
+            raise PasteTooLarge("Pastes can be at most %d bytes" % self.max_size)
+        return _Writer(self, self.compression and (size is None or size >= self.min_compress_size))
+
+    def put(self, content: bytes) -> str:
+        """
+        Stores a paste all at once.
+
+        :return: Its key
+        :raises PasteTooLarge: If the content is larger than `max_size`
+        """
+        writer = self.writer(len(content))
+        try:
+            writer.write(content)
+            return writer.commit()
+        except BaseException:
+            writer.abort()
+            raise
+
+    def _put(self, key: str, temp: str, encoding: Optional[str]) -> str:
+        existing = self.lookup(key)
+        if existing is not None:
+            # The same content was pasted again. Keep the stored copy, and let it live another `ttl`.
+            os.remove(temp)
+            os.utime(existing.path)
+            self._forget(key)
+            return key
+        path = self._path(key) + (".gz" if encoding else "")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp, path)
+        return key
+
+    def lookup(self, key: str) -> Optional[StoredPaste]:
+        """
+        Finds a paste on disk. Expired pastes are deleted, and not found.
+
+        :return: The paste, or None if there is no such (live) paste
+        """
+        if not _KEY.fullmatch(key):
+            return None
+        base = self._path(key)
+        for path, encoding in ((base + ".gz", "gzip"), (base, None)):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            expires = stat.st_mtime + self.ttl if self.ttl is not None else None
+            if expires is not None and expires <= time.time():
+                self._forget(key)
+                with suppress(FileNotFoundError):
+                    os.remove(path)
+                return None
+            return StoredPaste(key, path, encoding, stat.st_size, expires)
+        return None
+
+    def cached(self, key: str) -> Optional[Tuple[bytes, Optional[str], Optional[float]]]:
+        """
+        Gets a paste from the in-memory cache.
+
+        :return: Its stored content, encoding and expiry, or None if it is not cached (or has expired)
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if entry[2] is not None and entry[2] <= time.time():
+                self._cache_bytes -= len(self._cache.pop(key)[0])
+                return None
+            self._cache.move_to_end(key)
+            return entry
+
+    def read(self, paste: StoredPaste) -> bytes:
+        """
+        Reads a paste's file, as it is stored (i.e. compressed, if `paste.encoding` is set). Small pastes are kept in
+        the in-memory cache.
+        """
+        with open(paste.path, "rb") as fd:
+            data = fd.read()
+        if len(data) <= self.cache_item_size:
+            with self._lock:
+                if paste.key not in self._cache:
+                    self._cache[paste.key] = (data, paste.encoding, paste.expires)
+                    self._cache_bytes += len(data)
+                while self._cache_bytes > self.cache_size:
+                    self._cache_bytes -= len(self._cache.popitem(last=False)[1][0])
+        return data
+
+    def _forget(self, key: str) -> None:
+        with self._lock:
+            entry = self._cache.pop(key, None)
+            if entry is not None:
+                self._cache_bytes -= len(entry[0])
+
+    def iter_content(self, paste: StoredPaste) -> Iterator[bytes]:
+        """
+        Reads a paste's content, decompressing it as it is read.
+        """
+        decompressor = zlib.decompressobj(31) if paste.encoding == "gzip" else None
+        with open(paste.path, "rb") as fd:
+            for chunk in iter(lambda: fd.read(CHUNK_SIZE), b""):
+                chunk = decompressor.decompress(chunk) if decompressor is not None else chunk
+                if chunk:
+                    yield chunk
+        if decompressor is not None:
+            tail = decompressor.flush()
+            if tail:
+                yield tail
+
+    def sweep(self) -> int:
+        """
+        Deletes expired pastes, and temporary files left behind by uploads that never finished.
+
+        :return: How many pastes were deleted
+        """
+        now, removed = time.time(), 0
+        for directory, _, files in os.walk(self.root):
+            temporary = os.path.samefile(directory, self.tmp_dir)
+            for name in files:
+                path = os.path.join(directory, name)
+                with suppress(FileNotFoundError):
+                    age = now - os.stat(path).st_mtime
+                    if temporary and age > 24 * 3600:
+                        os.remove(path)
+                    elif not temporary and self.ttl is not None and age >= self.ttl:
+                        os.remove(path)
+                        self._forget(name.split(".", 1)[0])
+                        removed += 1
+        return removed
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class _Request:
+    method: str
+    path: str
+    version: str
+    headers: Dict[str, str]
+
+    @classmethod
+    def parse(cls, head: bytes) -> "_Request":
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split(" ")
+        if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+            raise _HTTPError(400, "Malformed request line.")
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        return cls(parts[0].upper(), parts[1].split("?", 1)[0], parts[2], headers)
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    @property
+    def has_body(self) -> bool:
+        return "transfer-encoding" in self.headers or self.headers.get("content-length", "0") != "0"
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+async def _iter_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> AsyncIterator[bytes]:
+    """Reads a request body, sent with a Content-Length or chunked"""
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        while True:
+            line = await reader.readline()
+            try:
+                size = int(line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise _HTTPError(400, "Malformed chunked body.")
+            if size == 0:
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass  # trailers
+                return
+            while size > 0:
+                chunk = await reader.read(min(size, CHUNK_SIZE))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b"", size)
+                size -= len(chunk)
+                yield chunk
+            await reader.readexactly(2)
+    else:
+        remaining = int(headers.get("content-length", "0"))
+        while remaining > 0:
+            chunk = await reader.read(min(remaining, CHUNK_SIZE))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b"", remaining)
+            remaining -= len(chunk)
+            yield chunk
+
+
+class PasteServer:
+    """
+    Serves a `PasteStore` over HTTP/1.1 (with keep-alive), speaking the hastebin API.
+
+    Small uploads are stored on the event loop. Larger ones are hashed, compressed and written in a thread, a chunk
+    at a time, so that they never hold up other requests.
+
+    Example:
+    >>> async with PasteServer(PasteStore("pastes"), port=0) as server:
+    ...     backend = GenericBackend(server.url)
+    ...     key = (await backend.async_create_paste(GenericFile("content here"))).key
+    """
+
+    def __init__(
+        self,
+        store: PasteStore,
+        host: str = "127.0.0.1",
+        port: int = 7777,
+        *,
+        idle_timeout: float = 75.0,
+    ):
+        """
+        :param store: The store to serve
+        :param host: The address to listen on
+        :param port: The port to listen on. 0 picks a free one.
+        :param idle_timeout: How long to keep an idle connection open, in seconds
+        """
+        self.store = store
+        self.host = host
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._sweeper: Optional["asyncio.Task[None]"] = None
+        self._connections: Dict[asyncio.StreamWriter, "asyncio.Task[None]"] = {}
+
+    @property
+    def url(self) -> str:
+        """The base URL to give `GenericBackend`"""
+        return "http://%s:%d" % (self.host, self.port)
+
+    async def start(self) -> None:
+        """Starts listening"""
+        self._server = await asyncio.start_server(self._serve, self.host, self.port, limit=CHUNK_SIZE)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.store.ttl is not None:
+            self._sweeper = asyncio.ensure_future(self._sweep(min(self.store.ttl, 3600.0)))
+
+    async def close(self) -> None:
+        """Stops listening, and closes every connection"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        if self._server is not None:
+            self._server.close()
+            # Closing each connection ends its handler, rather than it being cancelled mid-request.
+            handlers = list(self._connections.values())
+            for writer in list(self._connections):
+                writer.close()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def __aenter__(self) -> "PasteServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def _sweep(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await asyncio.to_thread(self.store.sweep)
+            except Exception:
+                _log.exception("Could not sweep expired pastes")
+            else:
+                if removed:
+                    _log.info("Deleted %d expired paste(s)", removed)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.idle_timeout)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self._send_json(writer, 431, {"message": "Request headers are too large."}, False)
+                    return
+                try:
+                    request = _Request.parse(head)
+                except _HTTPError as e:
+                    await self._send_json(writer, e.status, {"message": str(e)}, False)
+                    return
+                if not await self._dispatch(request, reader, writer):
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception:
+            _log.exception("Error serving a connection")
+        finally:
+            del self._connections[writer]
+            writer.close()
+
+    async def _dispatch(self, request: _Request, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        """Handles one request. Returns whether the connection can be reused."""
+        keep_alive = request.keep_alive
+        method, path = request.method, request.path
+        try:
+            if method == "POST" and path == "/documents":
+                keep_alive = False  # until the whole body has been read
+                key = await self._receive(request, reader, writer)
+                keep_alive = request.keep_alive
+                await self._send_json(writer, 200, {"key": key}, keep_alive)
+            elif method not in ("GET", "HEAD"):
+                raise _HTTPError(405, "Method not allowed.")
+            elif request.has_body:
+                raise _HTTPError(400, "GET and HEAD requests cannot have a body.")
+            elif path == "/":
+                await self._send(writer, 200, b"superpaste\n", {"Content-Type": "text/plain"}, keep_alive, method)
+            elif path.startswith("/documents/"):
+                await self._send_document(writer, path[len("/documents/") :], keep_alive, method)
+            else:
+                key = path[len("/raw/") :] if path.startswith("/raw/") else path[1:]
+                await self._send_paste(request, writer, key, keep_alive)
+        except _HTTPError as e:
+            keep_alive = keep_alive and not request.has_body  # an unread body would be taken for the next request
+            await self._send_json(writer, e.status, {"message": str(e)}, keep_alive, method)
+        _log.debug("%s %s", method, path)
+        return keep_alive
+
+    async def _receive(self, request: _Request, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> str:
+        """Stores a request body as a paste, and returns its key"""
+        from .backends._compression import Decompressor
+
+        headers = request.headers
+        chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        if not chunked and "content-length" not in headers:
+            raise _HTTPError(411, "A Content-Length is required.")
+        try:
+            length = None if chunked else int(headers["content-length"])
+        except ValueError:
+            raise _HTTPError(400, "Malformed Content-Length.")
+        encoding = headers.get("content-encoding", "identity").lower()
+        try:
+            decompressor = Decompressor(encoding) if encoding != "identity" else None
+        except ValueError as e:
+            raise _HTTPError(415, str(e))
+        try:
+            paste = self.store.writer(length if decompressor is None else None)
+        except PasteTooLarge as e:
+            raise _HTTPError(413, str(e))
+        if headers.get("expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+        def write(chunk: bytes) -> None:
+            if decompressor is None:
+                paste.write(chunk)
+                return
+            decompressor.decompress(chunk, paste.write)
+
+        # A small body is stored straight away, as a hop to a thread would cost more than the work itself.
+        inline = decompressor is None and length is not None and length <= CHUNK_SIZE
+        try:
+            async for chunk in _iter_body(reader, headers):
+                if inline:
+                    write(chunk)
+                else:
+                    await asyncio.to_thread(write, chunk)
+            if decompressor is not None:
+                paste.write(decompressor.flush())
+            return paste.commit() if inline else await asyncio.to_thread(paste.commit)
+        except PasteTooLarge as e:
+            paste.abort()
+            raise _HTTPError(413, str(e))
+        except ValueError as e:
+            paste.abort()
+            raise _HTTPError(400, str(e))
+        except BaseException:
+            paste.abort()
+            raise
+
+    async def _send_paste(self, request: _Request, writer: asyncio.StreamWriter, key: str, keep_alive: bool) -> None:
+        head_only = request.method == "HEAD"
+        cached = self.store.cached(key)
+        paste = None if cached is not None else self.store.lookup(key)
+        if cached is None and paste is None:
+            raise _HTTPError(404, "Document not found.")
+        expires = cached[2] if cached is not None else paste.expires
+        etag = '"%s"' % key
+        max_age = int(expires - time.time()) if expires is not None else 365 * 24 * 3600
+        headers = {
+            "Content-Type": "text/plain; charset=utf-8",
+            "ETag": etag,
+            "Cache-Control": "public, max-age=%d, immutable" % max(max_age, 0),
+            "Vary": "Accept-Encoding",
+        }
+        if etag in request.headers.get("if-none-match", ""):
+            await self._send(writer, 304, b"", headers, keep_alive, "HEAD")
+            return
+        gzip_ok = _accepts_gzip(request.headers.get("accept-encoding", ""))
+
+        if cached is None and paste.size <= self.store.cache_item_size:
+            cached = (await asyncio.to_thread(self.store.read, paste), paste.encoding, paste.expires)
+        if cached is not None:
+            data, encoding, _ = cached
+            if encoding is not None and not gzip_ok:
+                # As with uploads, only a small paste is worth decompressing without a hop to a thread.
+                if len(data) <= CHUNK_SIZE:
+                    data = zlib.decompress(data, 31)
+                else:
+                    data = await asyncio.to_thread(zlib.decompress, data, 31)
+                encoding = None
+            if encoding is not None:
+                headers["Content-Encoding"] = encoding
+            await self._send(writer, 200, data, headers, keep_alive, request.method)
+            return
+
+        if paste.encoding is None or gzip_ok:
+            # The file is sent as it is stored, straight from the page cache to the socket.
+            if paste.encoding is not None:
+                headers["Content-Encoding"] = paste.encoding
+            headers["Content-Length"] = str(paste.size)
+            writer.write(self._head(200, headers, keep_alive))
+            await writer.drain()
+            if not head_only:
+                with open(paste.path, "rb") as fd:
+                    await asyncio.get_running_loop().sendfile(writer.transport, fd, 0, paste.size)
+            return
+
+        from .backends._streaming import aiter_sync
+
+        headers["Transfer-Encoding"] = "chunked"
+        writer.write(self._head(200, headers, keep_alive))
+        if not head_only:
+            async for chunk in aiter_sync(self.store.iter_content(paste)):
+                writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _send_document(self, writer: asyncio.StreamWriter, key: str, keep_alive: bool, method: str) -> None:
+        paste = self.store.lookup(key)
+        if paste is None:
+            raise _HTTPError(404, "Document not found.")
+        data = b"".join(await asyncio.to_thread(lambda: list(self.store.iter_content(paste))))
+        body = {"key": key, "data": data.decode("utf-8", "replace")}
+        await self._send_json(writer, 200, body, keep_alive, method)
+
+    @staticmethod
+    def _head(status: int, headers: Dict[str, str], keep_alive: bool) -> bytes:
+        lines: List[str] = ["HTTP/1.1 %d %s" % (status, _REASONS.get(status, "Unknown")), "Server: superpaste"]
+        lines.extend("%s: %s" % item for item in headers.items())
+        lines.append("Connection: %s" % ("keep-alive" if keep_alive else "close"))
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _send(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        body: bytes,
+        headers: Dict[str, str],
+        keep_alive: bool,
+        method: str = "GET",
+    ) -> None:
+        if status != 304:
+            headers["Content-Length"] = str(len(body))
+        writer.write(self._head(status, headers, keep_alive) + (body if method != "HEAD" else b""))
+        await writer.drain()
+
+    async def _send_json(
+        self, writer: asyncio.StreamWriter, status: int, body: dict, keep_alive: bool, method: str = "GET"
+    ) -> None:
+        data = json.dumps(body).encode("utf-8")
+        await self._send(writer, status, data, {"Content-Type": "application/json"}, keep_alive, method)
+
+
+def serve_main(argv: List[str]) -> int:
+    """`superpaste serve`: runs a hastebin-compatible server in the foreground."""
+    import argparse
+    import signal
+
+    parser = argparse.ArgumentParser(
+        description="Run a hastebin-compatible paste server. Paste to it with `superpaste --backend` and a "
+        "`GenericBackend` pointed at it."
+    )
+    parser.prog += " serve"
+    parser.add_argument("--host", default="127.0.0.1", help="The address to listen on. Default: 127.0.0.1")
+    parser.add_argument("--port", "-p", type=int, default=7777, help="The port to listen on. Default: 7777")
+    parser.add_argument("--data", "-d", default=default_data_dir(), help="Where to store pastes. Default: %(default)s")
+    parser.add_argument(
+        "--max-size",
+        type=int,
+        default=16 * 1024 * 1024,
+        metavar="BYTES",
+        help="The largest paste, in bytes. 0 for no limit. Default: 16 MiB",
+    )
+    parser.add_argument(
+        "--ttl",
+        type=float,
+        metavar="SECONDS",
+        help="Delete pastes this long after they were last uploaded. Default: never",
+    )
+    parser.add_argument("--no-compression", action="store_true", help="Store pastes uncompressed.")
+    parser.add_argument(
+        "--cache-size", type=int, default=64, metavar="MIB", help="The size of the in-memory cache. Default: 64 MiB"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    store = PasteStore(
+        args.data,
+        max_size=args.max_size or None,
+        ttl=args.ttl,
+        compression=not args.no_compression,
+        cache_size=args.cache_size * 1024 * 1024,
+    )
+
+    async def run() -> None:
+        stop = asyncio.Event()
+        with suppress(NotImplementedError):  # not on Windows
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        async with PasteServer(store, args.host, args.port) as server:
+            _log.info("Serving on %s, storing pastes in %s", server.url, store.root)
+            await stop.wait()
+        _log.info("Stopped")
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        parser.error(str(e))
+    return 0
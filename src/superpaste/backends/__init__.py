@@ -1,7 +1,111 @@
-from ._generic import *
-from .base import *
-from .hastebin_com import *
-from .hastebin_skyra_pw import *
-from .hst_sh import *
-from .mystb_in import *
-from .paste_ee import *
+"""
+Every backend, and the helpers around them.
+
+Names are imported lazily, on first access, so that importing one backend does not pay for importing all of them.
+Add new public names to `_EXPORTS`, under the module that defines them.
+"""
+
+from typing import TYPE_CHECKING, Any, Dict, List
+
+_EXPORTS: Dict[str, List[str]] = {
+    "_cache": [
+        "ResultCache",
+        "MemoryResultCache",
+        "SQLiteResultCache",
+        "FetchCacheEntry",
+        "FetchCache",
+        "MemoryFetchCache",
+        "DiskFetchCache",
+    ],
+    "_composite": ["BackendHealth", "CompositeBackend"],
+    "_follow": ["FollowSegment", "LogFollower", "default_follow_state"],
+    "_generic": ["GenericBackend", "GenericFile", "GenericResult"],
+    "_handler": ["PasteHandler"],
+    "_metrics": ["RequestMetrics", "MetricsSink", "Histogram", "InMemoryMetrics", "OpenTelemetryMetrics"],
+    "_planner": [
+        "plan_pastes",
+        "BundleResult",
+        "bundle_files",
+        "unbundle",
+        "create_bundled_paste",
+        "async_create_bundled_paste",
+        "get_bundled_paste",
+        "async_get_bundled_paste",
+    ],
+    "_queue": ["PasteQueue"],
+    "_redact": ["BUILTIN_PATTERNS", "Redactor"],
+    "_registry": ["backend_names", "load_backend", "register_backend"],
+    "_retry": ["RetryPolicy", "TokenBucket", "RateLimiter", "RetryTransport", "AsyncRetryTransport"],
+    "_split": [
+        "SplitResult",
+        "split_lines",
+        "create_split_paste",
+        "async_create_split_paste",
+        "iter_split_paste",
+        "async_iter_split_paste",
+        "parse_manifest",
+    ],
+    "_spool": ["SpooledPaste", "PasteSpool"],
+    "_streaming": ["StreamFile", "MappedFile", "spool_json"],
+    "base": [
+        "BaseFile",
+        "BaseResult",
+        "BaseBackend",
+        "__author__",
+        "__user_agent__",
+        "as_chunks",
+        "run_concurrently",
+        "async_run_concurrently",
+        "iter_concurrently",
+        "async_iter_concurrently",
+        "Utf8Validator",
+        "validate_utf8",
+        "check_utf8",
+    ],
+    "hastebin_com": ["HastebinBackend", "HastebinFile", "HastebinResult"],
+    "hastebin_skyra_pw": ["HastebinSkyraPWBackend", "HastebinSkyraPWFile", "HastebinSkyraPWResult"],
+    "hst_sh": ["HstSHBackend", "HstFile", "HstResult"],
+    "mystb_in": ["MystbinBackend", "MystbinFile", "MystbinResult"],
+    "paste_ee": ["PasteEEFile", "PasteEEBackend", "PasteEEResult"],
+}
+_LOCATIONS = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = tuple(_LOCATIONS)
+
+
+def __getattr__(name: str) -> Any:
+    module = _LOCATIONS.get(name)
+    if module is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    import importlib
+
+    value = getattr(importlib.import_module("." + module, __name__), name)
+    globals()[name] = value  # so later lookups skip this function
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
+
+
+if TYPE_CHECKING:
+    from ._cache import *
+    from ._composite import *
+    from ._follow import *
+    from ._generic import *
+    from ._handler import *
+    from ._metrics import *
+    from ._planner import *
+    from ._queue import *
+    from ._redact import *
+    from ._registry import *
+    from ._retry import *
+    from ._split import *
+    from ._spool import *
+    from ._streaming import *
+    from .base import *
+    from .hastebin_com import *
+    from .hastebin_skyra_pw import *
+    from .hst_sh import *
+    from .mystb_in import *
+    from .paste_ee import *
@@ -0,0 +1,460 @@
+"""
+Caches for paste results, so that identical content is never uploaded twice, and for fetched pastes, so that
+they are not downloaded again.
+"""
+
+import abc
+import hashlib
+import json
+import os
+import pathlib
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple, Union
+
+import httpx
+
+from .base import BaseResult
+
+__all__ = (
+    "ResultCache",
+    "MemoryResultCache",
+    "SQLiteResultCache",
+    "FetchCacheEntry",
+    "FetchCache",
+    "MemoryFetchCache",
+    "DiskFetchCache",
+)
+
+
+class ResultCache(abc.ABC):
+    """
+    A cache mapping content keys (see `BaseBackend.result_cache_key`) to the paste that was created for them.
+
+    Pass an instance to a backend's `result_cache` option to enable it. Entries expire after `ttl` seconds, or when
+    the paste itself expires (for results with an `expires` attribute, such as `MystbinResult`), whichever is first.
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        """
+        :param ttl: How many seconds to keep results for. `None` keeps them until the paste expires, or forever.
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+
+    def _expires_at(self, result: BaseResult) -> Optional[float]:
+        """Works out when an entry for the given result should be evicted, as a unix timestamp."""
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        paste_expires = getattr(result, "expires", None)
+        if paste_expires is not None:
+            paste_expires = paste_expires.timestamp()
+            expires_at = paste_expires if expires_at is None else min(expires_at, paste_expires)
+        return expires_at
+
+    def get(self, key: str) -> Optional[BaseResult]:
+        """
+        Gets a cached result, counting the hit or miss.
+
+        :param key: The cache key
+        :return: The cached result, or None if there is not a live one.
+        """
+        with self._lock:
+            result = self._get(key, time.time())
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return result
+
+    def set(self, key: str, result: BaseResult) -> None:
+        """
+        Stores a result.
+
+        :param key: The cache key
+        :param result: The result of creating the paste
+        """
+        expires_at = self._expires_at(result)
+        if expires_at is not None and expires_at <= time.time():
+            return
+        with self._lock:
+            self._set(key, result, expires_at)
+
+    @abc.abstractmethod
+    def _get(self, key: str, now: float) -> Optional[BaseResult]:
+        """Gets an entry that has not expired by `now`, evicting it if it has."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _set(self, key: str, result: BaseResult, expires_at: Optional[float]) -> None:
+        """Stores an entry, to be evicted at `expires_at`."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        """Removes every entry from the cache."""
+        raise NotImplementedError
+
+    @property
+    def hit_ratio(self) -> float:
+        """The fraction of lookups that were hits"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class MemoryResultCache(ResultCache):
+    """
+    An in-memory, least-recently-used result cache.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        """
+        :param maxsize: The maximum number of results to hold. The least recently used are evicted first.
+        :param ttl: How many seconds to keep results for. `None` keeps them until the paste expires, or forever.
+        """
+        super().__init__(ttl)
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[BaseResult, Optional[float]]]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key: str, now: float) -> Optional[BaseResult]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        result, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def _set(self, key: str, result: BaseResult, expires_at: Optional[float]) -> None:
+        self._entries[key] = (result, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteResultCache(ResultCache):
+    """
+    A persistent result cache, stored in an SQLite database.
+
+    .. warning::
+        Results are stored pickled. Only point this at a database that you trust.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike], ttl: Optional[float] = None):
+        """
+        :param path: The path to the database file. It is created if it does not exist.
+        :param ttl: How many seconds to keep results for. `None` keeps them until the paste expires, or forever.
+        """
+        super().__init__(ttl)
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result BLOB NOT NULL, expires_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_expires_at ON results (expires_at)")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def _get(self, key: str, now: float) -> Optional[BaseResult]:
+        row = self._db.execute("SELECT result, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= now:
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            return None
+        return pickle.loads(row[0])
+
+    def _set(self, key: str, result: BaseResult, expires_at: Optional[float]) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO results (key, result, expires_at) VALUES (?, ?, ?)",
+            (key, pickle.dumps(result), expires_at),
+        )
+        self.evict_expired()
+
+    def evict_expired(self) -> int:
+        """
+        Removes every expired entry.
+
+        :return: The number of entries removed
+        """
+        with self._lock:
+            return self._db.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM results")
+
+    def close(self) -> None:
+        """Closes the database connection"""
+        with self._lock:
+            self._db.close()
+
+
+@dataclass
+class FetchCacheEntry:
+    """
+    A cached response body, along with the headers needed to revalidate it.
+    """
+
+    content: bytes
+    headers: Dict[str, str] = field(default_factory=dict)
+    stored_at: float = field(default_factory=time.time)
+
+    CACHED_HEADERS = ("content-type", "etag", "last-modified")
+
+    @classmethod
+    def from_response(cls, response: httpx.Response) -> "FetchCacheEntry":
+        """Creates an entry from a (successful, fully read) response"""
+        headers = {k: response.headers[k] for k in cls.CACHED_HEADERS if k in response.headers}
+        return cls(response.content, headers)
+
+    @property
+    def validators(self) -> Dict[str, str]:
+        """The conditional request headers that revalidate this entry, if the server gave any validators"""
+        h = {}
+        if "etag" in self.headers:
+            h["If-None-Match"] = self.headers["etag"]
+        if "last-modified" in self.headers:
+            h["If-Modified-Since"] = self.headers["last-modified"]
+        return h
+
+    def to_response(self, url: str) -> httpx.Response:
+        """Rebuilds the response this entry was created from, so that it can be parsed like a fresh one"""
+        return httpx.Response(
+            200,
+            headers={**self.headers, "x-superpaste-cache": "hit"},
+            content=self.content,
+            request=httpx.Request("GET", url),
+        )
+
+
+class FetchCache(abc.ABC):
+    """
+    A read-through cache for fetched pastes, keyed by URL.
+
+    Pass an instance to a backend's `fetch_cache` option to enable it. Entries younger than `max_age` seconds, and
+    entries for backends whose pastes are immutable (`BaseBackend.immutable_pastes`), are served without a round trip.
+    Older entries are revalidated with `If-None-Match`/`If-Modified-Since` where the server gave an ETag or
+    Last-Modified header.
+    """
+
+    def __init__(self, max_age: float = 0):
+        """
+        :param max_age: How many seconds an entry is served for before it has to be revalidated.
+        """
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._lock = threading.RLock()
+
+    def is_fresh(self, entry: FetchCacheEntry) -> bool:
+        """Whether an entry can be served without revalidating it"""
+        return time.time() - entry.stored_at < self.max_age
+
+    def get(self, key: str) -> Optional[FetchCacheEntry]:
+        """
+        Gets a cached entry, without counting a hit or miss. See `lookup`.
+
+        :param key: The cache key
+        :return: The entry, if there is one.
+        """
+        with self._lock:
+            return self._get(key)
+
+    def lookup(self, key: str, immutable: bool = False) -> Tuple[Optional[FetchCacheEntry], bool]:
+        """
+        Looks up the entry for a request that is about to be made.
+
+        :param key: The cache key
+        :param immutable: Whether the cached content is known to never change
+        :return: The entry, if any, and whether it can be served without a request. If it can, it is counted as a hit.
+        """
+        entry = self.get(key)
+        fresh = entry is not None and (immutable or self.is_fresh(entry))
+        if fresh:
+            with self._lock:
+                self.hits += 1
+        return entry, fresh
+
+    def update(self, key: str, entry: Optional[FetchCacheEntry], response: httpx.Response) -> httpx.Response:
+        """
+        Updates the cache with the response to a (possibly conditional) request.
+
+        :param key: The cache key
+        :param entry: The entry that was being revalidated, if any
+        :param response: The response
+        :return: The response to use. If the server confirmed the cached entry is unchanged, this is rebuilt from it.
+        """
+        if response.status_code == 304 and entry is not None:
+            headers = dict(entry.headers)
+            headers.update({k: response.headers[k] for k in ("etag", "last-modified") if k in response.headers})
+            entry = FetchCacheEntry(entry.content, headers)
+            self.set(key, entry)
+            with self._lock:
+                self.hits += 1
+                self.revalidations += 1
+            return entry.to_response(str(response.request.url))
+
+        with self._lock:
+            self.misses += 1
+        if response.is_success:
+            self.set(key, FetchCacheEntry.from_response(response))
+        elif response.status_code in (404, 410):
+            self.discard(key)
+        return response
+
+    def set(self, key: str, entry: FetchCacheEntry) -> None:
+        """
+        Stores an entry.
+
+        :param key: The cache key
+        :param entry: The entry to store
+        """
+        with self._lock:
+            self._set(key, entry)
+
+    @abc.abstractmethod
+    def _get(self, key: str) -> Optional[FetchCacheEntry]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _set(self, key: str, entry: FetchCacheEntry) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def discard(self, key: str) -> None:
+        """Removes an entry, if it exists"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        """Removes every entry from the cache."""
+        raise NotImplementedError
+
+
+class MemoryFetchCache(FetchCache):
+    """
+    An in-memory, least-recently-used fetch cache, bounded by the total size of the cached bodies.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_age: float = 0):
+        """
+        :param max_bytes: The maximum total size of the cached bodies. The least recently used are evicted first.
+        :param max_age: How many seconds an entry is served for before it has to be revalidated.
+        """
+        super().__init__(max_age)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, FetchCacheEntry]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key: str) -> Optional[FetchCacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _set(self, key: str, entry: FetchCacheEntry) -> None:
+        self.discard(key)
+        if len(entry.content) > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self.size += len(entry.content)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted.content)
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry.content)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class DiskFetchCache(FetchCache):
+    """
+    A persistent fetch cache, storing each body and its metadata as files in a directory.
+    """
+
+    def __init__(self, directory: Union[str, os.PathLike], max_bytes: Optional[int] = None, max_age: float = 0):
+        """
+        :param directory: The directory to store entries in. It is created if it does not exist.
+        :param max_bytes: The maximum total size of the cached bodies. The least recently stored are evicted first.
+            `None` means unbounded.
+        :param max_age: How many seconds an entry is served for before it has to be revalidated.
+        """
+        super().__init__(max_age)
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def _paths(self, key: str) -> Tuple[pathlib.Path, pathlib.Path]:
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.directory / (name + ".body"), self.directory / (name + ".json")
+
+    def _get(self, key: str) -> Optional[FetchCacheEntry]:
+        body, meta = self._paths(key)
+        try:
+            metadata = json.loads(meta.read_text())
+            return FetchCacheEntry(body.read_bytes(), metadata["headers"], metadata["stored_at"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _set(self, key: str, entry: FetchCacheEntry) -> None:
+        body, meta = self._paths(key)
+        # Write to temporary files first, so that a crash never leaves a half-written entry behind.
+        tmp_body, tmp_meta = body.with_suffix(".body.tmp"), meta.with_suffix(".json.tmp")
+        tmp_body.write_bytes(entry.content)
+        tmp_meta.write_text(json.dumps({"key": key, "headers": entry.headers, "stored_at": entry.stored_at}))
+        os.replace(tmp_body, body)
+        os.replace(tmp_meta, meta)
+        if self.max_bytes is not None:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Removes the oldest entries until the cache fits in `max_bytes`"""
+        bodies = sorted(self.directory.glob("*.body"), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in bodies)
+        for path in bodies:
+            if total <= self.max_bytes:
+                break
+            total -= path.stat().st_size
+            path.unlink(missing_ok=True)
+            path.with_suffix(".json").unlink(missing_ok=True)
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            for path in self._paths(key):
+                path.unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            for path in self.directory.glob("*.body"):
+                path.unlink(missing_ok=True)
+            for path in self.directory.glob("*.json"):
+                path.unlink(missing_ok=True)
@@ -0,0 +1,348 @@
+"""
+A backend that spreads pastes over several other backends, failing over or hedging between them.
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterator, List, Literal, Optional, Tuple, TypeVar, Union
+
+from ._streaming import StreamFile
+from .base import BaseBackend, BaseFile, BaseResult
+
+__all__ = ("BackendHealth", "CompositeBackend")
+
+T = TypeVar("T")
+
+ORIGINS_SIZE = 4096
+"""How many recently created pastes a `CompositeBackend` remembers the backend of"""
+
+
+class BackendHealth:
+    """
+    Tracks the health of one backend: an exponentially weighted moving average of its latency, and a circuit breaker.
+
+    After `failure_threshold` consecutive failures the circuit opens, and the backend is skipped. Once
+    `reset_timeout` seconds have passed, a single trial request is let through (half-open). If it succeeds the
+    circuit closes again, otherwise it re-opens.
+    """
+
+    def __init__(self, alpha: float = 0.2, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        """
+        :param alpha: The weight of each new sample in the latency average, between 0 and 1.
+        :param failure_threshold: How many consecutive failures open the circuit
+        :param reset_timeout: How many seconds the circuit stays open before a trial request is allowed.
+        """
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.latency: Optional[float] = None
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<BackendHealth state=%s latency=%s failures=%d>" % (self.state, self.latency, self.failures)
+
+    @property
+    def state(self) -> Literal["closed", "open", "half-open"]:
+        """The state of the circuit breaker"""
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def acquire(self) -> bool:
+        """
+        Checks whether a request may be sent to this backend. In the half-open state, only one trial is allowed.
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release(self) -> None:
+        """Gives up a trial request without recording its outcome, e.g. because it was cancelled."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self, latency: float) -> None:
+        """Records a successful request that took `latency` seconds, closing the circuit."""
+        with self._lock:
+            self.latency = latency if self.latency is None else self.alpha * latency + (1 - self.alpha) * self.latency
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        """Records a failed request, opening the circuit if there have been too many."""
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class CompositeBackend(BaseBackend):
+    """
+    Wraps several backends, to keep pasting when one of them is slow or down.
+
+    In `failover` mode, backends are tried in order until one succeeds. In `hedge` mode, the first backend is tried,
+    and if it has not answered within the hedge delay, the next one is started too; the first success wins. Either
+    way, backends whose circuit breaker is open (see `BackendHealth`) are skipped, unless every backend's is.
+
+    .. warning::
+        Keyword arguments are passed to every backend, so only use ones that all of them accept.
+        In hedge mode, the losing backends may still create their pastes.
+    """
+
+    name = "composite"
+
+    def __init__(
+        self,
+        *backends: BaseBackend,
+        mode: Literal["failover", "hedge"] = "failover",
+        hedge_delay: Optional[float] = None,
+        max_hedges: int = 1,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+    ):
+        """
+        :param backends: The backends to use, in order of preference
+        :param mode: `failover` or `hedge`
+        :param hedge_delay: How many seconds to wait for a backend before starting the next one, in hedge mode.
+            Defaults to twice the backend's average latency, or 1 second until that is known.
+        :param max_hedges: How many extra backends can be started in hedge mode, on top of the first.
+        :param failure_threshold: How many consecutive failures open a backend's circuit breaker
+        :param reset_timeout: How many seconds a backend's circuit breaker stays open
+        """
+        super().__init__()
+        if not backends:
+            raise ValueError("CompositeBackend needs at least one backend")
+        if mode not in ("failover", "hedge"):
+            raise ValueError("mode must be 'failover' or 'hedge'")
+        self.backends = list(backends)
+        self.mode = mode
+        self.hedge_delay = hedge_delay
+        self.max_hedges = max_hedges
+        self.health = {
+            id(b): BackendHealth(failure_threshold=failure_threshold, reset_timeout=reset_timeout) for b in backends
+        }
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._origins: "OrderedDict[str, Tuple[BaseBackend, str]]" = OrderedDict()
+        self._origins_lock = threading.Lock()
+
+    def close(self) -> None:
+        for backend in self.backends:
+            backend.close()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    async def aclose(self) -> None:
+        for backend in self.backends:
+            await backend.aclose()
+        self.close()
+
+    def _delay_for(self, backend: BaseBackend) -> float:
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        latency = self.health[id(backend)].latency
+        return 1.0 if latency is None else 2 * latency
+
+    def _candidates(self) -> Iterator[BaseBackend]:
+        """
+        The backends to try, in order. Ones with an open circuit are left out, unless all of them are.
+        This is lazy, so that a half-open backend's trial is only taken if it is actually tried.
+        """
+        tried = False
+        for backend in self.backends:
+            if self.health[id(backend)].acquire():
+                tried = True
+                yield backend
+        if not tried:
+            yield from self.backends
+
+    def _remember(self, backend: BaseBackend, result: Union[BaseResult, List[BaseResult]]) -> None:
+        """Records which backend created a paste, so that `get_paste` does not have to work it out from its URL"""
+        with self._origins_lock:
+            for r in result if isinstance(result, list) else [result]:
+                self._origins[r.url] = (backend, r.key)
+                self._origins.move_to_end(r.url)
+            while len(self._origins) > ORIGINS_SIZE:
+                self._origins.popitem(last=False)
+
+    @staticmethod
+    def _check_files(files: Tuple[Any, ...]) -> None:
+        for file in files:
+            if isinstance(file, StreamFile) and not file.reusable:
+                raise ValueError(
+                    "CompositeBackend may send a file more than once, so single-use streams are not supported"
+                )
+
+    def _attempt(self, backend: BaseBackend, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.health[id(backend)].record_failure()
+            self._logger.warning("Backend %s failed", backend.name, exc_info=True)
+            raise
+        self.health[id(backend)].record_success(time.perf_counter() - start)
+        return result
+
+    async def _async_attempt(self, backend: BaseBackend, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            result = await func(*args, **kwargs)
+        except asyncio.CancelledError:
+            self.health[id(backend)].release()
+            raise
+        except Exception:
+            self.health[id(backend)].record_failure()
+            self._logger.warning("Backend %s failed", backend.name, exc_info=True)
+            raise
+        self.health[id(backend)].record_success(time.perf_counter() - start)
+        return result
+
+    def _failover(self, call: Callable[[BaseBackend], T]) -> T:
+        errors = []
+        for backend in self._candidates():
+            try:
+                return self._attempt(backend, call, backend)
+            except Exception as e:
+                errors.append(e)
+        raise RuntimeError("Every backend failed: %r" % errors) from errors[-1]
+
+    def _hedge(self, call: Callable[[BaseBackend], T]) -> T:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(thread_name_prefix="superpaste-hedge")
+        candidates = itertools.islice(self._candidates(), self.max_hedges + 1)
+        backend = next(candidates)
+        pending = set()
+        errors = []
+        while backend is not None or pending:
+            if backend is not None:
+                pending.add(self._pool.submit(self._attempt, backend, call, backend))
+                timeout = self._delay_for(backend)
+                backend = next(candidates, None)
+            # Wait for the hedge delay before starting the next backend, unless there is no next backend,
+            # or one fails first (in which case the next one is started straight away).
+            done, pending = wait(pending, timeout=timeout if backend is not None else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                errors.append(future.exception())
+        raise RuntimeError("Every backend failed: %r" % errors) from errors[-1]
+
+    async def _async_failover(self, call: Callable[[BaseBackend], Any]) -> Any:
+        errors = []
+        for backend in self._candidates():
+            try:
+                return await self._async_attempt(backend, call, backend)
+            except Exception as e:
+                errors.append(e)
+        raise RuntimeError("Every backend failed: %r" % errors) from errors[-1]
+
+    async def _async_hedge(self, call: Callable[[BaseBackend], Any]) -> Any:
+        candidates = itertools.islice(self._candidates(), self.max_hedges + 1)
+        backend = next(candidates)
+        pending = set()
+        errors = []
+        try:
+            while backend is not None or pending:
+                if backend is not None:
+                    pending.add(asyncio.ensure_future(self._async_attempt(backend, call, backend)))
+                    timeout = self._delay_for(backend)
+                    backend = next(candidates, None)
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout if backend is not None else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(task.exception())
+        finally:
+            for task in pending:
+                task.cancel()
+        raise RuntimeError("Every backend failed: %r" % errors) from errors[-1]
+
+    def create_paste(self, *files: Union[BaseFile, str], **kwargs: Any) -> Union[BaseResult, List[BaseResult]]:
+        """
+        Creates a paste on the first backend to succeed.
+
+        :param files: The files to upload. Single-use `StreamFile`s are not supported.
+        :param kwargs: Extra keyword arguments, passed to each backend's `create_paste`.
+        :return: The paste result(s) from whichever backend succeeded.
+        :raises RuntimeError: If every backend failed
+        """
+        self._check_files(files)
+        files = self._redact(files)
+
+        def call(backend: BaseBackend) -> Union[BaseResult, List[BaseResult]]:
+            result = backend.create_paste(*files, **kwargs)
+            self._remember(backend, result)
+            return result
+
+        return self._hedge(call) if self.mode == "hedge" else self._failover(call)
+
+    async def async_create_paste(
+        self, *files: Union[BaseFile, str], **kwargs: Any
+    ) -> Union[BaseResult, List[BaseResult]]:
+        """
+        Async version of `create_paste`. In hedge mode, the losing backends are cancelled.
+        """
+        self._check_files(files)
+        files = self._redact(files)
+
+        async def call(backend: BaseBackend) -> Union[BaseResult, List[BaseResult]]:
+            result = await backend.async_create_paste(*files, **kwargs)
+            self._remember(backend, result)
+            return result
+
+        return await (self._async_hedge(call) if self.mode == "hedge" else self._async_failover(call))
+
+    def _member_for(self, url: str) -> Tuple[BaseBackend, str]:
+        """
+        Works out which backend a paste URL belongs to, and its key: the backend that created it, if this
+        CompositeBackend did so recently, else the backend with the longest `html_url` that the URL starts with.
+        """
+        with self._origins_lock:
+            origin = self._origins.get(url)
+        if origin is not None:
+            return origin
+        matches = []
+        for backend in self.backends:
+            prefix = getattr(backend, "html_url", "").split("{key}")[0]
+            if prefix and url.startswith(prefix):
+                matches.append((len(prefix), backend, url[len(prefix) :].strip("/")))
+        if matches:
+            _, backend, key = max(matches, key=lambda match: match[0])
+            return backend, key
+        raise ValueError("%r is not a paste URL for any of this CompositeBackend's backends" % url)
+
+    def get_paste(self, key: str, **kwargs: Any) -> Union[BaseFile, List[BaseFile]]:
+        """
+        Gets a paste from whichever backend it was created on.
+
+        :param key: The paste's URL (`BaseResult.url`). Bare keys are ambiguous, so are not accepted.
+        :param kwargs: Extra keyword arguments for the backend's `get_paste`
+        """
+        backend, key = self._member_for(key)
+        return self._attempt(backend, backend.get_paste, key, **kwargs)
+
+    async def async_get_paste(self, key: str, **kwargs: Any) -> Union[BaseFile, List[BaseFile]]:
+        """
+        Async version of `get_paste`.
+        """
+        backend, key = self._member_for(key)
+        return await self._async_attempt(backend, backend.async_get_paste, key, **kwargs)
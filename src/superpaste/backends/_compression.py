@@ -0,0 +1,183 @@
+"""
+Streaming request body compression (and decompression). gzip is always available, zstd and brotli are used if they
+are installed.
+"""
+
+import zlib
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+__all__ = ("available_encodings",)
+
+
+def available_encodings() -> List[str]:
+    """
+    Lists the content encodings that request bodies can be compressed with, in order of preference.
+    """
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+class _Compressor:
+    """A uniform `compress`/`flush` interface over each compression library"""
+
+    def __init__(self, encoding: str, level: Optional[int] = None):
+        if encoding == "gzip":
+            self._obj = zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 31)
+            self.compress, self.flush = self._obj.compress, self._obj.flush
+        elif encoding == "zstd":
+            if zstandard is None:
+                raise RuntimeError("zstd compression requires the `zstandard` package (pip install superpaste[zstd])")
+            self._obj = zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+            self.compress, self.flush = self._obj.compress, self._obj.flush
+        elif encoding == "br":
+            if brotli is None:
+                raise RuntimeError("brotli compression requires the `brotli` package (pip install superpaste[brotli])")
+            self._obj = brotli.Compressor(quality=5 if level is None else level)
+            self.compress, self.flush = self._obj.process, self._obj.finish
+        else:
+            raise ValueError("Unsupported content encoding %r. Available: %s" % (encoding, available_encodings()))
+
+
+def check_encoding(encoding: str) -> str:
+    """
+    Checks that a content encoding can be used to compress bodies.
+
+    :raises ValueError: If the encoding is not known
+    :raises RuntimeError: If the library needed for the encoding is not installed
+    """
+    _Compressor(encoding)
+    return encoding
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """Compresses a whole body at once"""
+    compressor = _Compressor(encoding, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def iter_compressed(chunks: Iterable[bytes], encoding: str, level: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Compresses a stream of chunks as it is read.
+
+    :param chunks: The uncompressed chunks
+    :param encoding: The content encoding to compress with (`gzip`, `zstd` or `br`)
+    :param level: The compression level. Defaults to a fast level suited to text.
+    :return: The compressed chunks
+    """
+    compressor = _Compressor(encoding, level)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    out = compressor.flush()
+    if out:
+        yield out
+
+
+class _Sink:
+    """The file-like destination of a zstd `stream_writer`, passing each piece on to a function"""
+
+    def __init__(self):
+        self.write_to: Callable[[bytes], Any] = lambda data: None
+
+    def write(self, data: bytes) -> int:
+        self.write_to(data)
+        return len(data)
+
+
+class Decompressor:
+    """
+    Decompresses a body as it is received, in pieces of at most `max_length` bytes, so that a small compressed body
+    cannot expand into a huge buffer all at once.
+    """
+
+    def __init__(self, encoding: str, max_length: int = 64 * 1024):
+        """
+        :param encoding: The content encoding the body was compressed with (`gzip`, `deflate`, `zstd` or `br`)
+        :param max_length: The largest piece to decompress at once
+        :raises ValueError: If the encoding is not known, or its library is not installed (or cannot limit the size of
+            each piece)
+        """
+        self.max_length = max_length
+        self._zlib = self._brotli = self._zstd = None
+        if encoding in ("gzip", "x-gzip"):
+            self._zlib = zlib.decompressobj(31)
+        elif encoding == "deflate":
+            self._zlib = zlib.decompressobj()
+        elif encoding == "zstd" and zstandard is not None:
+            # zstd's decompressobj returns everything a chunk expands to at once, but its stream_writer hands the
+            # output on in `write_size` pieces.
+            self._sink = _Sink()
+            self._zstd = zstandard.ZstdDecompressor().stream_writer(self._sink, write_size=max_length)
+        elif encoding == "br" and brotli is not None and hasattr(brotli.Decompressor, "can_accept_more_data"):
+            self._brotli = brotli.Decompressor()  # brotli>=1.1.0, which can limit each piece
+        else:
+            raise ValueError("Unsupported content encoding %r" % encoding)
+
+    def decompress(self, chunk: bytes, write: Callable[[bytes], Any]) -> None:
+        """
+        Decompresses the next chunk of the body, passing it to `write` a piece at a time.
+
+        :raises ValueError: If the body is not validly compressed
+        """
+        try:
+            if self._zstd is not None:
+                self._sink.write_to = write
+                self._zstd.write(chunk)
+            elif self._brotli is not None:
+                out = self._brotli.process(chunk, output_buffer_limit=self.max_length)
+                # The decoder can hold back output even once it can take more input, so drain it until it has none.
+                while out or not self._brotli.can_accept_more_data():
+                    write(out)
+                    if self._brotli.is_finished():
+                        break
+                    out = self._brotli.process(b"", output_buffer_limit=self.max_length)
+            else:
+                while chunk:
+                    out = self._zlib.decompress(chunk, self.max_length)
+                    if out:
+                        write(out)
+                    chunk = self._zlib.unconsumed_tail
+        except zlib.error as e:
+            raise ValueError("Invalid compressed body: %s" % e) from e
+        except Exception as e:
+            if zstandard is not None and isinstance(e, zstandard.ZstdError):
+                raise ValueError("Invalid compressed body: %s" % e) from e
+            if brotli is not None and isinstance(e, brotli.error):
+                raise ValueError("Invalid compressed body: %s" % e) from e
+            raise
+
+    def flush(self) -> bytes:
+        """
+        Returns whatever is left, once the whole body has been given to `decompress`.
+
+        :raises ValueError: If the body was cut short
+        """
+        if self._brotli is not None:
+            if not self._brotli.is_finished():
+                raise ValueError("Invalid compressed body: it was cut short")
+            return b""
+        if self._zlib is None:
+            return b""
+        out = self._zlib.flush()
+        if not self._zlib.eof:
+            raise ValueError("Invalid compressed body: it was cut short")
+        return out
@@ -0,0 +1,301 @@
+"""
+Following a growing file (such as a service log), uploading only what was appended since the last upload.
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple, Union
+
+from ._split import _build_manifest, _make_file, _part_size, split_lines
+from .base import BaseBackend, BaseResult, _atomic_write
+
+__all__ = ("FollowSegment", "LogFollower", "default_follow_state")
+
+_log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_SEGMENT_SIZE = 8 * 1024 * 1024
+"""The largest segment, for backends that do not limit the size of a paste"""
+
+
+@dataclass
+class FollowSegment:
+    """
+    One paste, holding the bytes `start` to `end` of the followed file.
+    """
+
+    key: str
+    url: str
+    start: int
+    end: int
+    created: float
+
+
+def default_follow_state(path: Union[str, os.PathLike], backend: str) -> str:
+    """
+    Where `LogFollower` keeps its state for the given file and backend, by default.
+
+    That is `$XDG_CACHE_HOME/superpaste/follow/` (or `~/.cache/...`), in a file named after the file's real path.
+
+    :param path: The followed file
+    :param backend: The name of the backend
+    """
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    digest = hashlib.sha256(os.path.realpath(path).encode("utf-8", "surrogateescape")).hexdigest()[:16]
+    return os.path.join(cache, "superpaste", "follow", "%s-%s.json" % (digest, backend))
+
+
+class LogFollower:
+    """
+    Tails a file from a saved offset, uploading only the bytes appended since the last upload.
+
+    New content is uploaded once `batch_size` bytes are waiting, or once the oldest of them has waited
+    `batch_interval` seconds. It is cut on line boundaries into segments that fit the backend's limits (such as
+    `MystbinBackend.max_file_size`), and each segment becomes a paste of its own, so the cost of an upload depends
+    on how much was appended, not on the size of the file. A line that is still being written is held back until it
+    is finished.
+
+    The offset and every segment are saved to `state_path` after each upload, so a follower picks up where the last
+    one stopped, even in another process. If the file is truncated or replaced (e.g. rotated), following starts again
+    from its beginning.
+
+    Unless `index` is False, an index paste listing every segment (in the `create_split_paste` manifest format) is
+    re-created after each batch, so `iter_split_paste(backend, follower.index.key)` reassembles the whole file.
+
+    Example:
+    >>> follower = LogFollower(MystbinBackend(), "/var/log/service.log", on_segment=lambda s: print(s.url))
+    >>> follower.flush()  # upload whatever is new once, e.g. from cron
+    >>> for segment in follower.follow(stop_event):  # or keep going until `stop_event` is set
+    ...     pass
+    """
+
+    def __init__(
+        self,
+        backend: BaseBackend,
+        path: Union[str, os.PathLike],
+        *,
+        state_path: Optional[Union[str, os.PathLike]] = None,
+        batch_size: Optional[int] = None,
+        batch_interval: Optional[float] = 10.0,
+        segment_size: Optional[int] = None,
+        index: bool = True,
+        filename: Optional[str] = None,
+        max_concurrency: int = 4,
+        on_segment: Optional[Callable[[FollowSegment], None]] = None,
+    ):
+        """
+        :param backend: The backend to upload to
+        :param path: The file to follow
+        :param state_path: Where to save the offset and segments. Defaults to `default_follow_state`.
+        :param batch_size: Upload once this many bytes are waiting. Defaults to `segment_size`.
+        :param batch_interval: Upload whatever is waiting once it has waited this many seconds. None to only upload
+            full batches (and on `flush`).
+        :param segment_size: The largest segment in bytes. Defaults to the backend's limits.
+        :param index: Whether to keep an index paste listing every segment
+        :param filename: The filename given to each segment, where the backend supports one. Numbered per segment.
+            Defaults to the name of the file.
+        :param max_concurrency: How many segments to upload at once, when catching up on a lot of new content
+        :param on_segment: Called with each segment, once it has been uploaded (and saved).
+        """
+        if max_concurrency <= 0:
+            raise ValueError("max_concurrency must be greater than 0")
+        self.backend = backend
+        self.path = os.fspath(path)
+        self.state_path = os.fspath(state_path or default_follow_state(path, backend.name))
+        self.segment_size = _part_size(backend, segment_size) or DEFAULT_SEGMENT_SIZE
+        self.batch_size = batch_size or self.segment_size
+        self.batch_interval = batch_interval
+        self.use_index = index
+        self.filename = filename or os.path.basename(self.path)
+        self.max_concurrency = max_concurrency
+        self.on_segment = on_segment
+
+        self.offset = 0
+        """How far into the file has been uploaded"""
+        self.segments: List[FollowSegment] = []
+        """Every segment uploaded so far, in order"""
+        self.index: Optional[BaseResult] = None
+        """The latest index paste, if any"""
+        self.last_error: Optional[BaseException] = None
+        """The most recent upload error, when following"""
+        self._identity: Optional[Tuple[int, int]] = None
+        self._index_stale = False
+        self._waiting_since: Optional[float] = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def __repr__(self):
+        return "<LogFollower path=%r backend=%r offset=%d segments=%d>" % (
+            self.path,
+            self.backend.name,
+            self.offset,
+            len(self.segments),
+        )
+
+    def _load(self) -> None:
+        try:
+            with open(self.state_path, "rb") as fd:
+                state = json.load(fd)
+        except FileNotFoundError:
+            return
+        if state.get("backend") != self.backend.name:
+            raise ValueError(
+                "%s holds the state of following with %r, not %r"
+                % (self.state_path, state.get("backend"), self.backend.name)
+            )
+        self.offset = state["offset"]
+        self._identity = tuple(state["identity"]) if state.get("identity") else None
+        self.segments = [FollowSegment(**segment) for segment in state["segments"]]
+        if state.get("index"):
+            self.index = BaseResult(state["index"]["key"], state["index"]["url"])
+        self._index_stale = state.get("index_stale", False)
+
+    def _save(self) -> None:
+        state: Dict[str, Any] = {
+            "path": os.path.realpath(self.path),
+            "backend": self.backend.name,
+            "identity": self._identity,
+            "offset": self.offset,
+            "segments": [asdict(segment) for segment in self.segments],
+            "index": {"key": self.index.key, "url": self.index.url} if self.index is not None else None,
+            "index_stale": self._index_stale,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        with _atomic_write(self.state_path) as fd:
+            fd.write(json.dumps(state).encode("utf-8"))
+
+    def pending(self) -> int:
+        """
+        How many bytes have been appended since the last upload.
+
+        If the file shrank or was replaced since then, the offset is reset to its beginning first.
+        """
+        stat = os.stat(self.path)
+        identity = (stat.st_dev, stat.st_ino)
+        if self._identity is None:
+            self._identity = identity
+        elif identity != self._identity or stat.st_size < self.offset:
+            _log.info("%s was truncated or replaced, following it from the start", self.path)
+            self._identity, self.offset = identity, 0
+            self._save()
+        return stat.st_size - self.offset
+
+    def _read(self, start: int, end: int) -> Iterator[bytes]:
+        with open(self.path, "rb") as fd:
+            fd.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = fd.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def _segments(self, end: int, partial: bool) -> Iterator[Tuple[int, bytes]]:
+        """Cuts the new content into segments, with their offsets, holding back an unfinished last line."""
+        start, held = self.offset, None
+        for part in split_lines(self._read(self.offset, end), self.segment_size):
+            if held is not None:
+                yield start, held
+                start += len(held)
+            held = part
+        if held and (partial or held.endswith(b"\n") or len(held) >= self.segment_size):
+            yield start, held
+
+    def _commit(self, start: int, data: bytes, future: "Future[BaseResult]") -> FollowSegment:
+        result = future.result()
+        segment = FollowSegment(result.key, result.url, start, start + len(data), time.time())
+        self.segments.append(segment)
+        self.offset = segment.end
+        self._index_stale = True
+        self._save()
+        if self.on_segment is not None:
+            self.on_segment(segment)
+        return segment
+
+    def _update_index(self) -> None:
+        results = [BaseResult(segment.key, segment.url) for segment in self.segments]
+        manifest = _build_manifest(self.filename, results)
+        self.index = self.backend.create_paste(_make_file(self.backend, manifest, self.filename))
+        self._index_stale = False
+        self._save()
+
+    def flush(self, partial: bool = False) -> List[FollowSegment]:
+        """
+        Uploads everything appended since the last upload now, and updates the index paste.
+
+        Segments are uploaded in parallel, but saved in order: if one fails, the offset stops at its start, and it
+        (along with everything after it) is uploaded again next time.
+
+        :param partial: Whether to upload an unfinished last line too, rather than waiting for the rest of it
+        :return: The new segments
+        """
+        with self._lock:
+            end = self.offset + self.pending()
+            new: List[FollowSegment] = []
+            waiting: Deque[Tuple[int, bytes, "Future[BaseResult]"]] = collections.deque()
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+                try:
+                    for n, (start, data) in enumerate(self._segments(end, partial), start=len(self.segments) + 1):
+                        file = _make_file(self.backend, data, "%s.seg%04d" % (self.filename, n))
+                        waiting.append((start, data, pool.submit(self.backend.create_paste, file)))
+                        while waiting and (len(waiting) >= self.max_concurrency or waiting[0][2].done()):
+                            new.append(self._commit(*waiting.popleft()))
+                    while waiting:
+                        new.append(self._commit(*waiting.popleft()))
+                finally:
+                    for _, _, future in waiting:
+                        future.cancel()
+            if self.use_index and self._index_stale and self.segments:
+                self._update_index()
+            self._waiting_since = time.monotonic() if self.offset < end else None
+            return new
+
+    def poll(self) -> List[FollowSegment]:
+        """
+        Uploads what has been appended, if a full batch is waiting or the oldest of it has waited `batch_interval`.
+
+        :return: The new segments, if any were uploaded
+        """
+        waiting = self.pending()
+        if waiting <= 0:
+            self._waiting_since = None
+            return []
+        now = time.monotonic()
+        if self._waiting_since is None:
+            self._waiting_since = now
+        if waiting < self.batch_size and (
+            self.batch_interval is None or now - self._waiting_since < self.batch_interval
+        ):
+            return []
+        return self.flush()
+
+    def follow(self, stop: Optional[threading.Event] = None, poll_interval: float = 1.0) -> Iterator[FollowSegment]:
+        """
+        Keeps polling the file, yielding each segment as it is uploaded, until `stop` is set (or forever).
+
+        Failed uploads are logged and kept in `last_error`, then retried on the next poll. Once stopped, whatever
+        complete lines are still waiting are uploaded.
+
+        :param stop: Stops following once set
+        :param poll_interval: How often to check the file for new content, in seconds
+        """
+        stop = stop or threading.Event()
+        while True:
+            try:
+                yield from self.poll()
+            except FileNotFoundError:
+                pass  # between a rotation and the new file being created
+            except Exception as e:
+                self.last_error = e
+                _log.warning("Could not upload the new content of %s: %s", self.path, e)
+            if stop.wait(poll_interval):
+                break
+        yield from self.flush()
@@ -1,14 +1,20 @@
+import hashlib
 import os
-from typing import Dict, List, Literal, Union, overload
+import threading
+from typing import Any, Dict, List, Literal, Optional, Set, Tuple, Union, overload
 
 import httpx
 
-from .base import BaseBackend, BaseFile, BaseResult
+from ._compression import check_encoding, compress, iter_compressed
+from ._streaming import StreamFile, as_async_kwargs
+from .base import BaseBackend, BaseFile, BaseResult, async_run_concurrently, run_concurrently
 
 __all__ = ("GenericBackend", "GenericFile", "GenericResult")
 
 
 class GenericFile(BaseFile):
+    __slots__ = ("_content",)
+
     def __init__(self, content: Union[str, bytes]):
         self._content = content
 
@@ -33,54 +39,247 @@ class GenericBackend(BaseBackend):
     name: str
     file_class = GenericFile
     result_class = GenericResult
+    supports_streaming = True
+    immutable_pastes = True
+    max_files_per_paste = 1
+
+    compression: Optional[str] = None
+    """The content encoding to compress request bodies with (`gzip`, `zstd` or `br`), or None to send them as-is."""
+    compression_level: Optional[int] = None
+    """The compression level to use. Defaults to a fast level suited to text."""
+
+    # Whether each (base URL, encoding) decodes compressed bodies, learned by checking the first compressed upload to
+    # it. Shared by every instance (hence the class-level lock), so each server is only checked once per process.
+    _compression_support: Dict[Tuple[str, str], bool] = {}
+    _compression_checking: Set[Tuple[str, str]] = set()
+    _compression_lock = threading.Lock()
 
-    def __init__(self, base_url: str = None):
+    def __init__(
+        self, base_url: str = None, compression: Optional[str] = None, compression_level: Optional[int] = None, **kwargs
+    ):
+        """
+        :param base_url: The base URL of the hastebin-compatible server. Defaults to the class' `base_url`.
+        :param compression: The content encoding to compress request bodies with (`gzip`, `zstd` or `br`).
+            The first compressed paste is fetched back to check that the server decoded it. If it did not (or
+            rejected it), the paste is sent again uncompressed, and so is every later one.
+        :param compression_level: The compression level to use.
+        :param kwargs: Extra connection options, passed to `BaseBackend.__init__`.
+        """
+        super().__init__(**kwargs)
         if base_url:
             self.base_url = base_url  # override class var
+        if compression:
+            self.compression = check_encoding(compression)
+        if compression_level is not None:
+            self.compression_level = compression_level
         self.post_url = self.base_url + "/documents"
         self.html_url = self.base_url + "/{key}"
 
     def get_headers(self) -> Dict[str, str]:
         return super().get_headers()
 
+    def _coerce_files(self, files) -> List[GenericFile]:
+        """Converts any raw strings in the given files into instances of `file_class`"""
+        return [self.file_class(file) if isinstance(file, (str, bytes)) else file for file in files]
+
+    def _post_kwargs(self, file: Union[GenericFile, StreamFile]) -> Dict[str, Any]:
+        """
+        Builds the keyword arguments passed to `session.post` when uploading a single file.
+
+        Subclasses can override this to validate or transform the file before it is sent.
+        `StreamFile`s are sent as a streamed request body.
+        """
+        if isinstance(file, StreamFile):
+            kwargs = {"content": file.iter_chunks()}
+            if file.size is not None:
+                kwargs["headers"] = {"Content-Length": str(file.size)}
+            return kwargs
+        return {"content": file.content}
+
+    def _compress_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Compresses the body in the given request keyword arguments with `compression`"""
+        headers = {k: v for k, v in kwargs.get("headers", {}).items() if k.lower() != "content-length"}
+        headers["Content-Encoding"] = self.compression
+        content = kwargs["content"]
+        if isinstance(content, (str, bytes)):
+            if isinstance(content, str):
+                content = content.encode("utf-8")
+            content = compress(content, self.compression, self.compression_level)
+        else:
+            content = iter_compressed(content, self.compression, self.compression_level)
+        return {**kwargs, "content": content, "headers": headers}
+
+    def _compression_plan(self, file: Union[GenericFile, StreamFile]) -> Optional[bool]:
+        """
+        Decides whether to send the given file compressed.
+
+        :return: True or False, or None to send it compressed and check (with `_learn_compression`) whether the server
+            decoded it. Until that check is done, other uploads to the server go uncompressed. Single-use streams are
+            never the upload checked, as they could not be sent again.
+        """
+        if not self.compression:
+            return False
+        key = (self.base_url, self.compression)
+        with self._compression_lock:
+            supported = self._compression_support.get(key)
+            if supported is not None:
+                return supported
+            if key in self._compression_checking or (isinstance(file, StreamFile) and not file.reusable):
+                return False
+            self._compression_checking.add(key)
+            return None
+
+    def _learn_compression(
+        self, file: Union[GenericFile, StreamFile], response: httpx.Response, fetched: Optional[httpx.Response]
+    ) -> Optional[bool]:
+        """
+        Learns whether the server decodes compressed bodies, from its response to the compressed upload being checked,
+        and the paste fetched back from it. A server that ignores `Content-Encoding` stores the compressed bytes.
+
+        :return: Whether the server decoded the body, or None if the upload failed for some other reason
+        """
+        if response.status_code in (400, 415):
+            supported = False
+        elif fetched is not None and fetched.is_success:
+            supported = hashlib.sha256(fetched.content).hexdigest() == file.digest()
+        else:
+            return None
+        self._logger.info(
+            "%s %s %s-compressed request bodies",
+            self.base_url,
+            "decodes" if supported else "does not decode",
+            self.compression,
+        )
+        with self._compression_lock:
+            self._compression_support[(self.base_url, self.compression)] = supported
+        return supported
+
+    def _end_compression_check(self) -> None:
+        with self._compression_lock:
+            self._compression_checking.discard((self.base_url, self.compression))
+
+    def _parse_post(self, response: httpx.Response) -> GenericResult:
+        """Converts the response from `post_url` into a result"""
+        response.raise_for_status()
+        data = response.json()
+        return GenericResult(data["key"], self.html_url.format(key=data["key"]))
+
+    def _parse_get(self, response: httpx.Response) -> GenericFile:
+        """Converts the response from the raw endpoint into a file"""
+        response.raise_for_status()
+        return GenericFile(response.text)
+
     @overload
     def create_paste(self, files: GenericFile) -> GenericResult: ...
 
     @overload
     def create_paste(self, *files: GenericFile) -> List[GenericResult]: ...
 
-    def create_paste(self, *files: Union[GenericFile, str]) -> Union[GenericResult, List[GenericResult]]:
+    def create_paste(
+        self, *files: Union[GenericFile, str], max_concurrency: int = 1, return_exceptions: bool = False
+    ) -> Union[GenericResult, List[GenericResult]]:
         """
         Creates a paste.
 
         :param files: The files to upload
+        :param max_concurrency: How many files to upload at once, if multiple files were given.
+        :param return_exceptions: If True, a file that fails to upload has its exception returned in place of its
+            result, instead of aborting the whole upload.
         :return: The paste result. Can be multiple if multiple files were uploaded.
         """
-        files = list(files)
-        for n, file in enumerate(files):
-            if isinstance(file, str):
-                files[n] = BaseFile()
+        files = self._coerce_files(files)
         if len(files) > 1:
-            results = []
-            for file in files:
-                results.append(self.create_paste(file))
-            return results
+            return run_concurrently(self.create_paste, files, max_concurrency, return_exceptions)
 
-        file = files[0]
+        files = self._redact(files)
+        cache_key, cached = self._cached_result(files)
+        if cached is not None:
+            return cached
         with self.with_session() as session:
-            response: httpx.Response = session.post(self.post_url, data=file.content)
-            response.raise_for_status()
-            data = response.json()
-            return GenericResult(data["key"], self.html_url.format(key=data["key"]))
+            compressed = self._compression_plan(files[0])
+            try:
+                with self._timed("prepare"):
+                    kwargs = self._post_kwargs(files[0])
+                    if compressed is not False:
+                        kwargs = self._compress_kwargs(kwargs)
+                response: httpx.Response = session.post(self.post_url, **kwargs)
+                if compressed is None:
+                    fetched = session.get(self.raw_url(response.json()["key"])) if response.is_success else None
+                    if self._learn_compression(files[0], response, fetched) is False:
+                        response = session.post(self.post_url, **self._post_kwargs(files[0]))
+            finally:
+                if compressed is None:
+                    self._end_compression_check()
+            with self._timed("parse"):
+                return self._cache_result(cache_key, self._parse_post(response))
+
+    @overload
+    async def async_create_paste(self, files: GenericFile) -> GenericResult: ...
+
+    @overload
+    async def async_create_paste(self, *files: GenericFile) -> List[GenericResult]: ...
+
+    async def async_create_paste(
+        self, *files: Union[GenericFile, str], max_concurrency: int = 1, return_exceptions: bool = False
+    ) -> Union[GenericResult, List[GenericResult]]:
+        """
+        Creates a paste asynchronously.
+
+        :param files: The files to upload
+        :param max_concurrency: How many files to upload at once, if multiple files were given.
+        :param return_exceptions: If True, a file that fails to upload has its exception returned in place of its
+            result, instead of aborting the whole upload.
+        :return: The paste result. Can be multiple if multiple files were uploaded.
+        """
+        files = self._coerce_files(files)
+        if len(files) > 1:
+            return await async_run_concurrently(self.async_create_paste, files, max_concurrency, return_exceptions)
+
+        files = self._redact(files)
+        cache_key, cached = self._cached_result(files)
+        if cached is not None:
+            return cached
+        async with self.with_async_session() as session:
+            compressed = self._compression_plan(files[0])
+            try:
+                with self._timed("prepare"):
+                    kwargs = self._post_kwargs(files[0])
+                    if compressed is not False:
+                        kwargs = self._compress_kwargs(kwargs)
+                response: httpx.Response = await session.post(self.post_url, **as_async_kwargs(kwargs))
+                if compressed is None:
+                    fetched = await session.get(self.raw_url(response.json()["key"])) if response.is_success else None
+                    if self._learn_compression(files[0], response, fetched) is False:
+                        response = await session.post(self.post_url, **as_async_kwargs(self._post_kwargs(files[0])))
+            finally:
+                if compressed is None:
+                    self._end_compression_check()
+            with self._timed("parse"):
+                return self._cache_result(cache_key, self._parse_post(response))
+
+    def raw_url(self, key: str) -> str:
+        return self.base_url + "/raw/" + key
 
     def get_paste(self, key: str) -> GenericFile:
         """
-        Gets a paste
+        Gets a paste. Compressed responses are always accepted (httpx advertises every encoding it can decode).
 
         :param key: The paste's key
         :return: The file
         """
         with self.with_session() as session:
-            response: httpx.Response = session.get(self.base_url + "/raw/" + key)
-            response.raise_for_status()
-            return GenericFile(response.text)
+            response: httpx.Response = self.cached_get(session, self.raw_url(key))
+            with self._timed("parse"):
+                return self._parse_get(response)
+
+    async def async_get_paste(self, key: str) -> GenericFile:
+        """
+        Gets a paste asynchronously
+
+        :param key: The paste's key
+        :return: The file
+        """
+        async with self.with_async_session() as session:
+            response: httpx.Response = await self.async_cached_get(session, self.raw_url(key))
+            with self._timed("parse"):
+                return self._parse_get(response)
@@ -0,0 +1,225 @@
+"""
+A logging handler that uploads buffered log records to a paste backend in the background.
+"""
+
+import collections
+import logging
+import threading
+from typing import Callable, Deque, Iterable, Iterator, Optional, Tuple
+
+from ._split import _make_file, split_lines
+from .base import BaseBackend, BaseResult
+
+__all__ = ("PasteHandler",)
+
+
+class PasteHandler(logging.Handler):
+    """
+    Buffers log records in a bounded ring buffer, and uploads them as pastes from a background thread.
+
+    `emit` only appends to the buffer, so it never blocks on the network. A batch is uploaded when a record of
+    `flush_level` or above is logged, when `flush_records` records are waiting, or every `flush_interval` seconds.
+    If records arrive faster than they can be uploaded, the oldest are dropped, and counted in `dropped`.
+
+    Records logged while a batch is being uploaded (e.g. by httpx itself) are ignored, so the handler never feeds
+    on its own traffic.
+
+    Example:
+    >>> handler = PasteHandler(HstSHBackend(), on_paste=lambda result, n: print("%d records at %s" % (n, result.url)))
+    >>> logging.getLogger().addHandler(handler)
+    """
+
+    def __init__(
+        self,
+        backend: BaseBackend,
+        *,
+        capacity: int = 10_000,
+        flush_level: int = logging.ERROR,
+        flush_records: int = 1_000,
+        flush_interval: Optional[float] = 60.0,
+        max_size: Optional[int] = None,
+        filename: str = "log.txt",
+        on_paste: Optional[Callable[[BaseResult, int], None]] = None,
+        level: int = logging.NOTSET,
+    ):
+        """
+        :param backend: The backend to upload to
+        :param capacity: The most records to buffer. Past this, the oldest are dropped.
+        :param flush_level: Records of this level or above trigger an upload straight away.
+        :param flush_records: Trigger an upload once this many records are waiting.
+        :param flush_interval: Upload whatever is waiting every this many seconds. None to disable.
+        :param max_size: The largest paste in bytes. Bigger batches are split over several pastes.
+            Defaults to the backend's limits.
+        :param filename: The filename given to each paste, where the backend supports one
+        :param on_paste: Called from the worker thread with each paste's result, and the number of records in it.
+        :param level: The minimum level of records to handle
+        """
+        super().__init__(level)
+        if capacity <= 0:
+            raise ValueError("capacity must be greater than 0")
+        self.backend = backend
+        self.capacity = capacity
+        self.flush_level = flush_level
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        limits = [x for x in (max_size, backend.max_file_size, backend.max_paste_size) if x is not None]
+        self.max_size = min(limits) if limits else None
+        self.filename = filename
+        self.on_paste = on_paste
+
+        self.emitted = 0
+        """How many records have been buffered"""
+        self.dropped = 0
+        """How many records were dropped because the buffer was full"""
+        self.shipped = 0
+        """How many records have been uploaded"""
+        self.failed = 0
+        """How many records were lost because their upload failed"""
+        self.pastes = 0
+        """How many pastes have been created"""
+        self.last_error: Optional[BaseException] = None
+        """The most recent upload (or `on_paste`) error, if any"""
+
+        self._buffer: Deque[logging.LogRecord] = collections.deque()
+        # The worker never takes `self.lock`, as `flush` and `close` can be called with it held (`logging.shutdown`
+        # does so) while they wait for the worker. The buffer has its own lock instead.
+        self._buffer_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = False
+        self._local = threading.local()
+        self._done = threading.Condition()
+        self._requested = 0
+        self._completed = 0
+        self._thread = threading.Thread(target=self._run, name="superpaste-log-handler", daemon=True)
+        self._thread.start()
+
+    def __repr__(self):
+        return "<PasteHandler backend=%r buffered=%d shipped=%d dropped=%d failed=%d>" % (
+            self.backend.name,
+            len(self._buffer),
+            self.shipped,
+            self.dropped,
+            self.failed,
+        )
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # Checked before `Handler.handle` takes `self.lock`, so the worker's own records (e.g. from httpx) never wait
+        # on it.
+        if getattr(self._local, "shipping", False):
+            return False
+        return super().handle(record)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.exc_info and not record.exc_text:
+            # Tracebacks keep their frames alive, so render them now rather than holding on to them.
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        with self._buffer_lock:
+            if len(self._buffer) >= self.capacity:
+                self._buffer.popleft()
+                self.dropped += 1
+            self._buffer.append(record)
+            self.emitted += 1
+            wake = record.levelno >= self.flush_level or len(self._buffer) >= self.flush_records
+        if wake:
+            self._wake.set()
+
+    def _take(self) -> Deque[logging.LogRecord]:
+        """Swaps the buffer out for an empty one, so emitters wait no longer than the swap."""
+        with self._buffer_lock:
+            records, self._buffer = self._buffer, collections.deque()
+        return records
+
+    def _parts(self, records: Iterable[logging.LogRecord]) -> Iterator[Tuple[bytes, int]]:
+        """Formats records into pastes of at most `max_size` bytes, with how many records each holds."""
+        part, count = bytearray(), 0
+        for record in records:
+            line = self.format(record).encode("utf-8", "replace") + b"\n"
+            if self.max_size is not None and part and len(part) + len(line) > self.max_size:
+                yield bytes(part), count
+                part, count = bytearray(), 0
+            if self.max_size is not None and len(line) > self.max_size:
+                # A single huge record (e.g. a long traceback) is cut over several pastes.
+                *head, tail = split_lines((line,), self.max_size)
+                for piece in head:
+                    yield piece, 0
+                line = tail
+            part += line
+            count += 1
+        if part:
+            yield bytes(part), count
+
+    def _ship(self) -> None:
+        """Formats and uploads everything in the buffer. Only runs in the worker, unless it has stopped."""
+        self._local.shipping = True
+        try:
+            records = self._take()
+            if not records:
+                return
+            for part, count in self._parts(records):
+                try:
+                    result = self.backend.create_paste(_make_file(self.backend, part, self.filename))
+                except Exception as e:
+                    self.failed += count
+                    self.last_error = e
+                    continue
+                self.pastes += 1
+                self.shipped += count
+                if self.on_paste is not None:
+                    try:
+                        self.on_paste(result, count)
+                    except Exception as e:
+                        self.last_error = e
+        finally:
+            self._local.shipping = False
+
+    def _run(self) -> None:
+        try:
+            while True:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                with self._done:
+                    requested = self._requested
+                self._ship()
+                with self._done:
+                    self._completed = requested
+                    self._done.notify_all()
+                if self._stop:
+                    return
+        finally:
+            with self._done:
+                self._completed = self._requested
+                self._done.notify_all()
+
+    @property
+    def _wait_timeout(self) -> float:
+        """How long `flush` and `close` wait for the worker"""
+        return max(self.backend.timeout.read or 30.0, 1.0) * 2
+
+    def flush(self) -> None:
+        """
+        Uploads everything in the buffer now, blocking until done.
+        """
+        if self._thread is threading.current_thread():
+            return  # e.g. from `on_paste`. The worker is already shipping.
+        if not self._thread.is_alive():
+            self._ship()
+            return
+        with self._done:
+            self._requested += 1
+            target = self._requested
+            self._wake.set()
+            self._done.wait_for(lambda: self._completed >= target, self._wait_timeout)
+
+    def close(self) -> None:
+        """
+        Stops the worker thread, uploading any records still in the buffer first.
+        """
+        self._stop = True
+        self._wake.set()
+        if self._thread is not threading.current_thread():
+            if self._thread.is_alive():
+                self._thread.join(self._wait_timeout)
+            else:
+                self._ship()
+        super().close()
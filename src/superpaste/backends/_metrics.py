@@ -0,0 +1,329 @@
+"""
+Per-request instrumentation: where the time goes in each request, how many bytes it moved, and how it ended.
+
+Backends record into a `MetricsSink`. `InMemoryMetrics` keeps histograms and counters in-process, and
+`OpenTelemetryMetrics` forwards everything to OpenTelemetry.
+"""
+
+import bisect
+import collections
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional
+
+import httpx
+
+try:
+    from opentelemetry import metrics as otel_metrics
+except ImportError:
+    otel_metrics = None
+
+__all__ = ("RequestMetrics", "MetricsSink", "Histogram", "InMemoryMetrics", "OpenTelemetryMetrics")
+
+# Maps httpcore trace steps to the phases we report
+TRACE_PHASES = {
+    "connect_tcp": "connect",
+    "connect_unix_socket": "connect",
+    "start_tls": "tls",
+    "send_request_headers": "send",
+    "send_request_body": "send",
+    "receive_response_headers": "wait",
+    "receive_response_body": "receive",
+}
+PHASES = ("read", "prepare", "connect", "tls", "send", "wait", "receive", "parse")
+"""
+Every phase, in the order they happen. `read` (loading files) is timed by the CLI, `prepare` (building the request
+body) and `parse` (reading the response) by the backends, and the rest by httpcore.
+"""
+
+
+@dataclass
+class RequestMetrics:
+    """
+    What happened during one HTTP request (including any retries of it).
+    """
+
+    backend: str
+    method: str
+    url: str
+    status: Optional[int] = None
+    """The final status code, or None if the request failed without a response"""
+    elapsed: float = 0.0
+    """Seconds from sending the request to closing the response"""
+    phases: Dict[str, float] = field(default_factory=dict)
+    """Seconds spent connecting, in the TLS handshake, sending, waiting for the response, and receiving it."""
+    bytes_sent: Optional[int] = None
+    bytes_received: int = 0
+    retries: int = 0
+    error: Optional[BaseException] = None
+
+
+class MetricsSink:
+    """
+    Receives metrics from backends. Subclass this and override the methods you are interested in.
+
+    These are called from whichever thread made the request, so implementations must be thread-safe.
+    """
+
+    def record_request(self, metrics: RequestMetrics) -> None:
+        """Records a finished HTTP request"""
+
+    def record_phase(self, backend: str, phase: str, seconds: float) -> None:
+        """Records time spent outside of HTTP, such as encoding a body (`prepare`) or parsing a response (`parse`)"""
+
+    def record_cache(self, backend: str, cache: str, outcome: str) -> None:
+        """
+        Records a cache lookup.
+
+        :param backend: The backend's name
+        :param cache: `result` or `fetch`
+        :param outcome: `hit`, `miss`, or (for fetch caches) `revalidated`
+        """
+
+
+class Histogram:
+    """
+    A thread-safe histogram with exponentially growing buckets, from 100 microseconds to ~100 seconds by default.
+    """
+
+    def __init__(self, buckets: Optional[List[float]] = None):
+        self.buckets = buckets or [0.0001 * 2**n for n in range(21)]
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def quantile(self, q: float) -> Optional[float]:
+        """An estimate of the `q` quantile (0-1): the upper bound of the bucket it falls in."""
+        if not self.count:
+            return None
+        target, seen = q * self.count, 0
+        for n, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.buckets[n], self.max) if n < len(self.buckets) else self.max
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.mean,
+            "min": self.min,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max,
+        }
+
+
+class InMemoryMetrics(MetricsSink):
+    """
+    Keeps histograms and counters in-process, plus the most recent requests.
+
+    Histograms are named after the phase (`connect`, `wait`, ...), with `total` for whole requests.
+    Counters include `requests`, `errors`, `retries`, `bytes_sent`, `bytes_received`, `status.<code>` and
+    `cache.<cache>.<outcome>`.
+    """
+
+    def __init__(self, keep: int = 1000):
+        """
+        :param keep: How many of the most recent requests to keep in `recent`
+        """
+        self.histograms: Dict[str, Histogram] = collections.defaultdict(Histogram)
+        self.counters: Dict[str, int] = collections.Counter()
+        self.recent: Deque[RequestMetrics] = collections.deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def record_request(self, metrics: RequestMetrics) -> None:
+        with self._lock:
+            self.recent.append(metrics)
+            self.counters["requests"] += 1
+            self.counters["retries"] += metrics.retries
+            self.counters["bytes_sent"] += metrics.bytes_sent or 0
+            self.counters["bytes_received"] += metrics.bytes_received
+            if metrics.error is not None:
+                self.counters["errors"] += 1
+            if metrics.status is not None:
+                self.counters["status.%d" % metrics.status] += 1
+            histograms = [(self.histograms[phase], seconds) for phase, seconds in metrics.phases.items()]
+            histograms.append((self.histograms["total"], metrics.elapsed))
+        for histogram, seconds in histograms:
+            histogram.observe(seconds)
+
+    def record_phase(self, backend: str, phase: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self.histograms[phase]
+        histogram.observe(seconds)
+
+    def record_cache(self, backend: str, cache: str, outcome: str) -> None:
+        with self._lock:
+            self.counters["cache.%s.%s" % (cache, outcome)] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """All histograms and counters, as plain data"""
+        with self._lock:
+            return {
+                "histograms": {name: h.summary() for name, h in self.histograms.items()},
+                "counters": dict(self.counters),
+            }
+
+    def format(self) -> str:
+        """A human-readable table of the phase breakdown and counters"""
+        lines = ["%-9s %6s %10s %10s %10s %10s" % ("phase", "count", "total ms", "mean ms", "p95 ms", "max ms")]
+        names = [p for p in PHASES if p in self.histograms] + [n for n in self.histograms if n not in PHASES]
+        for name in names:
+            h = self.histograms[name]
+            lines.append(
+                "%-9s %6d %10.2f %10.2f %10.2f %10.2f"
+                % (name, h.count, h.total * 1000, h.mean * 1000, h.quantile(0.95) * 1000, h.max * 1000)
+            )
+        if self.counters:
+            lines.append(", ".join("%s=%d" % item for item in sorted(self.counters.items())))
+        return "\n".join(lines)
+
+
+class OpenTelemetryMetrics(MetricsSink):
+    """
+    Forwards metrics to OpenTelemetry. Requires `opentelemetry-api` (`pip install superpaste[otel]`), and an SDK
+    to be configured for them to go anywhere.
+    """
+
+    def __init__(self, meter: Any = None):
+        """
+        :param meter: The OpenTelemetry meter to use. Defaults to a `superpaste` meter from the global provider.
+        """
+        if otel_metrics is None:
+            raise RuntimeError("OpenTelemetryMetrics requires `opentelemetry-api` (pip install superpaste[otel])")
+        meter = meter or otel_metrics.get_meter("superpaste")
+        self._duration = meter.create_histogram("superpaste.request.duration", unit="s")
+        self._phase = meter.create_histogram("superpaste.phase.duration", unit="s")
+        self._bytes_sent = meter.create_counter("superpaste.request.bytes_sent", unit="By")
+        self._bytes_received = meter.create_counter("superpaste.request.bytes_received", unit="By")
+        self._retries = meter.create_counter("superpaste.request.retries")
+        self._cache = meter.create_counter("superpaste.cache.lookups")
+
+    def record_request(self, metrics: RequestMetrics) -> None:
+        attributes = {"backend": metrics.backend, "method": metrics.method, "status": metrics.status or 0}
+        if metrics.error is not None:
+            attributes["error"] = type(metrics.error).__name__
+        self._duration.record(metrics.elapsed, attributes)
+        for phase, seconds in metrics.phases.items():
+            self._phase.record(seconds, {"backend": metrics.backend, "phase": phase})
+        self._bytes_sent.add(metrics.bytes_sent or 0, attributes)
+        self._bytes_received.add(metrics.bytes_received, attributes)
+        if metrics.retries:
+            self._retries.add(metrics.retries, attributes)
+
+    def record_phase(self, backend: str, phase: str, seconds: float) -> None:
+        self._phase.record(seconds, {"backend": backend, "phase": phase})
+
+    def record_cache(self, backend: str, cache: str, outcome: str) -> None:
+        self._cache.add(1, {"backend": backend, "cache": cache, "outcome": outcome})
+
+
+class _CountingStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """Counts the bytes of a request body whose length is not known up front"""
+
+    def __init__(self, stream: Any, trace: "RequestTrace"):
+        self._stream = stream
+        self._trace = trace
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._stream:
+            self._trace.bytes_sent += len(chunk)
+            yield chunk
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            self._trace.bytes_sent += len(chunk)
+            yield chunk
+
+    def close(self) -> None:
+        if hasattr(self._stream, "close"):
+            self._stream.close()
+
+    async def aclose(self) -> None:
+        if hasattr(self._stream, "aclose"):
+            await self._stream.aclose()
+
+
+class RequestTrace:
+    """
+    Collects the metrics of one request, from httpcore's `trace` extension, and reports them once it is closed.
+    """
+
+    def __init__(self, sink: MetricsSink, backend: str, request: httpx.Request):
+        self.sink = sink
+        self.backend = backend
+        self.request = request
+        self.response: Optional[httpx.Response] = None
+        self.start = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.bytes_sent = 0
+        self._started: Dict[str, float] = {}
+        self._done = False
+
+    @classmethod
+    def attach(cls, sink: MetricsSink, backend: str, request: httpx.Request, asynchronous: bool) -> "RequestTrace":
+        """Starts tracing a request. Must be called before it is sent, i.e. from a request event hook."""
+        trace = cls(sink, backend, request)
+        request.extensions["trace"] = trace.atrace if asynchronous else trace.trace
+        request.extensions["superpaste_metrics"] = trace
+        length = request.headers.get("content-length")
+        if length is not None:
+            trace.bytes_sent = int(length)
+        elif request.method not in ("GET", "HEAD"):
+            request.stream = _CountingStream(request.stream, trace)
+        return trace
+
+    def trace(self, name: str, info: Dict[str, Any]) -> None:
+        step, _, stage = name.partition(".")[2].rpartition(".")
+        now = time.perf_counter()
+        if stage == "started":
+            self._started[step] = now
+            return
+        started = self._started.pop(step, None)
+        phase = TRACE_PHASES.get(step)
+        if phase is not None and started is not None:
+            self.phases[phase] = self.phases.get(phase, 0.0) + now - started
+        # Responses to attempts that get retried are closed before the final response reaches the event hooks,
+        # so only the final one (which has been handed to `response`) finishes the trace.
+        if step == "response_closed" and self.response is not None:
+            self.finish()
+
+    async def atrace(self, name: str, info: Dict[str, Any]) -> None:
+        self.trace(name, info)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        """Reports the request to the sink. Only the first call has any effect."""
+        if self._done:
+            return
+        self._done = True
+        metrics = RequestMetrics(
+            self.backend,
+            self.request.method,
+            str(self.request.url),
+            self.response.status_code if self.response is not None else None,
+            time.perf_counter() - self.start,
+            self.phases,
+            self.bytes_sent,
+            self.response.num_bytes_downloaded if self.response is not None else 0,
+            self.request.extensions.get("superpaste_retries", 0),
+            error,
+        )
+        self.sink.record_request(metrics)
@@ -0,0 +1,318 @@
+"""
+Planning which files go into which paste, and bundling several files into one paste on backends that only take one.
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Sequence, Tuple, Union
+
+from ._split import _as_chunks, _join_files, _make_file
+from ._streaming import StreamFile
+from .base import BaseBackend, BaseFile, BaseResult, async_run_concurrently, run_concurrently
+
+__all__ = (
+    "plan_pastes",
+    "BundleResult",
+    "bundle_files",
+    "unbundle",
+    "create_bundled_paste",
+    "async_create_bundled_paste",
+    "get_bundled_paste",
+    "async_get_bundled_paste",
+)
+
+BUNDLE_HEADER = "superpaste-bundle/1"
+DEFAULT_BUNDLE_SIZE = 256 * 1024
+"""The largest bundle, for backends that do not limit the size of a paste"""
+_BUNDLE_OVERHEAD = 64
+"""Room for the bundle's header line and blank line"""
+
+
+@dataclass
+class BundleResult(BaseResult):
+    """
+    The result of one paste made by `create_bundled_paste`.
+    """
+
+    files: List[int] = field(default_factory=list)
+    """The positions (among the files given) of the files in this paste. More than one means it is a bundle."""
+
+
+def _file_size(file: Union[BaseFile, StreamFile]) -> Optional[int]:
+    """The size of a file in bytes, or None if it is a stream of unknown size"""
+    if isinstance(file, StreamFile):
+        return file.size
+    content = getattr(file, "content", file)
+    if isinstance(content, str):
+        return len(content) if content.isascii() else len(content.encode("utf-8"))
+    return len(content)
+
+
+def _pack(
+    sizes: Sequence[Optional[int]], max_files: Optional[int], max_size: Optional[int], keep_order: bool = False
+) -> List[List[int]]:
+    """
+    Packs items into as few bins as the limits allow. Items of unknown size, or too large to share, get a bin each.
+
+    Bins are filled in order where that takes no more bins than first-fit decreasing would, so that files stay in
+    the order they were given when sizes do not get in the way. With `keep_order`, they always are.
+    """
+
+    def fits(total: Optional[int], count: int, size: Optional[int]) -> bool:
+        if max_files is not None and count >= max_files:
+            return False
+        return max_size is None or (total is not None and size is not None and total + size <= max_size)
+
+    in_order: List[List[int]] = []
+    total: Optional[int] = 0
+    for i, size in enumerate(sizes):
+        if not in_order or not fits(total, len(in_order[-1]), size):
+            in_order.append([])
+            total = 0
+        in_order[-1].append(i)
+        total = None if total is None or size is None else total + size
+    if max_size is None or keep_order:
+        return in_order
+
+    # First-fit decreasing: largest first, each into the first bin it fits in.
+    bins: List[List[int]] = []
+    totals: List[int] = []
+    for i in sorted((i for i, size in enumerate(sizes) if size is not None), key=lambda i: -sizes[i]):
+        for n, items in enumerate(bins):
+            if fits(totals[n], len(items), sizes[i]):
+                items.append(i)
+                totals[n] += sizes[i]
+                break
+        else:
+            bins.append([i])
+            totals.append(sizes[i])
+    bins.extend([i] for i, size in enumerate(sizes) if size is None)
+    decreasing = sorted(sorted(items) for items in bins)
+    return in_order if len(in_order) <= len(decreasing) else decreasing
+
+
+def plan_pastes(
+    backend: BaseBackend,
+    files: Sequence[Union[BaseFile, StreamFile]],
+    *,
+    max_files: Optional[int] = None,
+    max_size: Optional[int] = None,
+    keep_order: bool = False,
+) -> List[List[int]]:
+    """
+    Plans the fewest pastes that the given files fit in, within the backend's limits.
+
+    Each paste holds at most `max_files_per_paste` files, totalling at most `max_paste_size` bytes. Files of unknown
+    size (streams without a `size`) get a paste of their own. A file larger than the backend's `max_file_size` also
+    gets one, and will be refused by the backend: use `create_split_paste` for those.
+
+    To fit in fewer pastes, files may be moved out of the order they were given in, unless `keep_order` is set.
+    Backends that split files over several pastes themselves keep the order, so their results line up with this
+    plan (with `keep_order=True`).
+
+    Example:
+    >>> files = [PasteEEFile("a" * 5_000_000), PasteEEFile("b"), PasteEEFile("c" * 2_000_000)]
+    >>> plan_pastes(PasteEEBackend(token), files)
+    [[0, 1], [2]]
+
+    :param backend: The backend the files will be pasted to
+    :param files: The files to paste
+    :param max_files: The most files per paste. Defaults to the backend's `max_files_per_paste`.
+    :param max_size: The largest total size of a paste in bytes. Defaults to the backend's `max_paste_size`.
+    :param keep_order: Whether each paste must hold the files that follow the previous paste's, in order.
+    :return: The positions of the files in each paste, in order.
+    """
+    return _pack(
+        [_file_size(file) for file in files],
+        max_files or backend.max_files_per_paste,
+        max_size or backend.max_paste_size,
+        keep_order,
+    )
+
+
+def _bundle_names(files: Sequence[Union[BaseFile, StreamFile]], names: Optional[Sequence[str]]) -> List[str]:
+    """Names each file, after `names` or the files' own filenames. A name cannot span lines of the header."""
+    if names is None:
+        names = [getattr(file, "filename", None) or "file%d" % n for n, file in enumerate(files, start=1)]
+    return [name.replace("\r", " ").replace("\n", " ") for name in names]
+
+
+def bundle_files(files: Sequence[Union[BaseFile, StreamFile]], names: Optional[Sequence[str]] = None) -> bytes:
+    """
+    Joins several files into the content of one paste, to be split up again by `unbundle`.
+
+    The bundle starts with a header listing the size and name of each file, followed by each file's content after a
+    `==> name <==` line (like `tail` prints), so it stays readable in a browser::
+
+        superpaste-bundle/1 files=2
+        6 build.log
+        3 test.log
+
+        ==> build.log <==
+        built
+        ==> test.log <==
+        ok
+
+    :param files: The files to bundle. They are read into memory, so bundles are meant for small files.
+    :param names: The name of each file. Defaults to the files' filenames, or `fileN`.
+    :return: The bundle
+    """
+    names = _bundle_names(files, names)
+    contents = [b"".join(_as_chunks(file)) for file in files]
+    header = ["%s files=%d" % (BUNDLE_HEADER, len(files))]
+    header.extend("%d %s" % (len(content), name) for content, name in zip(contents, names))
+    parts = [("\n".join(header) + "\n\n").encode("utf-8")]
+    for name, content in zip(names, contents):
+        parts.extend((("==> %s <==\n" % name).encode("utf-8"), content, b"\n"))
+    return b"".join(parts)
+
+
+def unbundle(content: Union[str, bytes]) -> Optional[List[Tuple[str, bytes]]]:
+    """
+    Splits a bundle made by `bundle_files` back into its files.
+
+    :param content: The content of the paste
+    :return: The name and content of each file, or None if the content is not a bundle.
+    :raises ValueError: If the content is a bundle, but has been cut short or altered
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    if not content.startswith(BUNDLE_HEADER.encode("utf-8")):
+        return None
+    head, sep, body = content.partition(b"\n\n")
+    if not sep:
+        raise ValueError("Corrupt bundle: it has no end of header")
+    entries = []
+    for line in head.decode("utf-8").splitlines()[1:]:
+        size, _, name = line.partition(" ")
+        entries.append((int(size), name))
+
+    files, position = [], 0
+    for size, name in entries:
+        marker = ("==> %s <==\n" % name).encode("utf-8")
+        if not body.startswith(marker, position):
+            raise ValueError("Corrupt bundle: expected %r at byte %d" % (marker, position))
+        start = position + len(marker)
+        data = body[start : start + size]
+        if len(data) != size:
+            raise ValueError("Corrupt bundle: %s is cut short" % name)
+        files.append((name, data))
+        position = start + size + 1  # the newline after the content, which may have been stripped from the last one
+    return files
+
+
+def _bundle_plan(
+    backend: BaseBackend,
+    files: Sequence[Union[BaseFile, StreamFile]],
+    names: Optional[Sequence[str]],
+    max_files: Optional[int],
+    max_size: Optional[int],
+) -> Tuple[List[List[int]], List[str]]:
+    names = _bundle_names(files, names)
+    limits = [x for x in (max_size, backend.max_file_size, backend.max_paste_size) if x is not None]
+    limit = (min(limits) if limits else DEFAULT_BUNDLE_SIZE) - _BUNDLE_OVERHEAD
+    # Each file also costs its header line and its `==> name <==` line in the bundle.
+    sizes = [
+        None if size is None else size + 2 * len(name.encode("utf-8")) + 32
+        for size, name in zip(map(_file_size, files), names)
+    ]
+    return _pack(sizes, max_files, limit), names
+
+
+def _bundled_file(
+    backend: BaseBackend, files: Sequence[Union[BaseFile, StreamFile]], names: List[str], group: List[int]
+) -> Union[BaseFile, StreamFile]:
+    if len(group) == 1:
+        return files[group[0]]
+    # Files are redacted before they are bundled, as the bundle's header records the size of each.
+    members = backend._redact([files[i] for i in group])
+    return _make_file(backend, bundle_files(members, [names[i] for i in group]), "bundle.txt")
+
+
+def create_bundled_paste(
+    backend: BaseBackend,
+    *files: Union[BaseFile, StreamFile],
+    names: Optional[Sequence[str]] = None,
+    max_files: Optional[int] = None,
+    max_size: Optional[int] = None,
+    max_concurrency: int = 1,
+    return_exceptions: bool = False,
+    **kwargs: Any,
+) -> List[BundleResult]:
+    """
+    Pastes many files in as few pastes as possible, on backends that only take one file per paste.
+
+    Files are packed (see `plan_pastes`) into bundles of at most `max_size` bytes, each uploaded as a single paste.
+    A file that does not share its paste is uploaded as it is. Use `get_bundled_paste` to fetch the files again.
+
+    Example:
+    >>> results = create_bundled_paste(HstSHBackend(), *(HstFile(open(name).read()) for name in logs))
+    >>> {logs[i]: result.url for result in results for i in result.files}
+
+    :param backend: The backend to paste to
+    :param files: The files to paste
+    :param names: The name of each file in its bundle. Defaults to the files' filenames, or `fileN`.
+    :param max_files: The most files per bundle. Default: no limit
+    :param max_size: The largest bundle in bytes. Defaults to the backend's limits, or 256 KiB if it has none.
+    :param max_concurrency: How many pastes to make at once
+    :param return_exceptions: If True, return a failed paste's exception in place of its result instead of raising.
+    :param kwargs: Extra keyword arguments for `create_paste`
+    :return: A result for each paste, with the positions of the files in it. With `return_exceptions`, a failed
+        paste's exception takes its place, and its files are those that no result lists.
+    """
+    plan, names = _bundle_plan(backend, files, names, max_files, max_size)
+
+    def post(group: List[int]) -> BundleResult:
+        result = backend.create_paste(_bundled_file(backend, files, names, group), **kwargs)
+        return BundleResult(result.key, result.url, group)
+
+    return run_concurrently(post, plan, max_concurrency, return_exceptions)
+
+
+async def async_create_bundled_paste(
+    backend: BaseBackend,
+    *files: Union[BaseFile, StreamFile],
+    names: Optional[Sequence[str]] = None,
+    max_files: Optional[int] = None,
+    max_size: Optional[int] = None,
+    max_concurrency: int = 1,
+    return_exceptions: bool = False,
+    **kwargs: Any,
+) -> List[BundleResult]:
+    """
+    Async version of `create_bundled_paste`.
+    """
+    plan, names = _bundle_plan(backend, files, names, max_files, max_size)
+
+    async def post(group: List[int]) -> BundleResult:
+        result = await backend.async_create_paste(_bundled_file(backend, files, names, group), **kwargs)
+        return BundleResult(result.key, result.url, group)
+
+    return await async_run_concurrently(post, plan, max_concurrency, return_exceptions)
+
+
+def _unbundled(key: str, content: bytes) -> List[Tuple[str, bytes]]:
+    files = unbundle(content)
+    return files if files is not None else [(os.path.basename(key.rstrip("/")) or key, content)]
+
+
+def get_bundled_paste(backend: BaseBackend, key: str, **kwargs: Any) -> List[Tuple[str, bytes]]:
+    """
+    Fetches a paste made by `create_bundled_paste`, and splits it back into its files.
+
+    A paste that is not a bundle is returned as a single file, named after its key, so this works for any paste.
+
+    :param backend: The backend the paste was created on
+    :param key: The key of the paste
+    :param kwargs: Extra keyword arguments for `get_paste`
+    :return: The name and content of each file
+    :raises ValueError: If the bundle has been cut short or altered
+    """
+    return _unbundled(key, _join_files(backend.get_paste(key, **kwargs)))
+
+
+async def async_get_bundled_paste(backend: BaseBackend, key: str, **kwargs: Any) -> List[Tuple[str, bytes]]:
+    """
+    Async version of `get_bundled_paste`.
+    """
+    return _unbundled(key, _join_files(await backend.async_get_paste(key, **kwargs)))
@@ -0,0 +1,264 @@
+"""
+A queue that coalesces individually submitted files into multi-file pastes.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Union
+
+from ._planner import plan_pastes
+from ._streaming import StreamFile
+from .base import BaseBackend, BaseFile, BaseResult, as_chunks
+
+__all__ = ("PasteQueue",)
+
+
+@dataclass
+class _Pending:
+    file: Union[BaseFile, StreamFile]
+    size: Optional[int]
+    queued_at: float = field(default_factory=time.monotonic)
+    future: Future = field(default_factory=Future)
+
+
+def _file_size(file: Union[BaseFile, str, StreamFile]) -> Optional[int]:
+    if isinstance(file, StreamFile):
+        return file.size
+    content = file if isinstance(file, str) else file.content
+    return len(content.encode("utf-8")) if isinstance(content, str) else len(content)
+
+
+class PasteQueue:
+    """
+    Sits in front of a backend, packing files submitted one at a time into as few pastes as possible.
+
+    Each call to `submit` returns a future straight away. A background thread collects pending files, and uploads
+    them together once there are `max_files` of them, once they would exceed `max_size` bytes, or once the oldest
+    has waited `max_delay` seconds, whichever comes first. Each future resolves to the result of the paste its
+    file ended up in (or that paste's exception).
+
+    Example:
+    >>> with PasteQueue(MystbinBackend(), max_delay=0.2) as queue:
+    ...     futures = [queue.submit(MystbinFile(text)) for text in texts]
+    >>> [f.result().url for f in futures]  # up to 5 files share each paste
+
+    It is safe to submit from any number of threads, and from asyncio code with `async_submit`.
+    """
+
+    def __init__(
+        self,
+        backend: BaseBackend,
+        *,
+        max_files: Optional[int] = None,
+        max_size: Optional[int] = None,
+        max_delay: float = 0.5,
+        max_concurrency: int = 4,
+        **paste_kwargs: Any,
+    ):
+        """
+        :param backend: The backend to paste to
+        :param max_files: The most files to put in one paste. Defaults to the backend's `max_files_per_paste`.
+        :param max_size: The largest total size of one paste in bytes. Defaults to the backend's `max_paste_size`.
+        :param max_delay: The longest a file waits for others to share its paste, in seconds.
+        :param max_concurrency: How many pastes to upload at once
+        :param paste_kwargs: Extra keyword arguments for `create_paste`, used for every paste.
+        """
+        if max_concurrency <= 0:
+            raise ValueError("max_concurrency must be greater than 0")
+        self.backend = backend
+        self.max_files = max_files or backend.max_files_per_paste or 1
+        self.max_size = max_size if max_size is not None else backend.max_paste_size
+        self.max_delay = max_delay
+        self.max_concurrency = max_concurrency
+        self.paste_kwargs = paste_kwargs
+        self.requests = 0
+        """How many pastes have been uploaded (or attempted)"""
+        self.files = 0
+        """How many files have been submitted"""
+
+        self._pending: List[_Pending] = []
+        self._pending_size = 0
+        self._flushing = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __repr__(self):
+        return "<PasteQueue backend=%r pending=%d files=%d requests=%d>" % (
+            self.backend.name,
+            len(self._pending),
+            self.files,
+            self.requests,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    @property
+    def pending(self) -> int:
+        """How many files are waiting to be uploaded"""
+        return len(self._pending)
+
+    def submit(self, file: Union[BaseFile, StreamFile]) -> "Future[BaseResult]":
+        """
+        Queues a file for upload. This never blocks on the network.
+
+        :param file: The file to paste
+        :return: A future that resolves to the result of the paste the file was uploaded in.
+        :raises RuntimeError: If the queue has been closed
+        """
+        item = _Pending(file, _file_size(file))
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Cannot submit to a closed PasteQueue")
+            if self._thread is None:
+                self._pool = ThreadPoolExecutor(self.max_concurrency, thread_name_prefix="superpaste-queue")
+                self._thread = threading.Thread(target=self._run, name="superpaste-queue-flusher", daemon=True)
+                self._thread.start()
+            self._pending.append(item)
+            self._pending_size += item.size or 0
+            self.files += 1
+            self._cond.notify()
+        return item.future
+
+    async def async_submit(self, file: Union[BaseFile, StreamFile]) -> BaseResult:
+        """
+        Queues a file for upload, and waits for its paste without blocking the event loop.
+
+        :param file: The file to paste
+        :return: The result of the paste the file was uploaded in
+        """
+        return await asyncio.wrap_future(self.submit(file))
+
+    def flush(self, wait_for: bool = True) -> None:
+        """
+        Uploads every pending file now, rather than waiting for their batches to fill up.
+
+        :param wait_for: Whether to wait until those uploads have finished
+        """
+        with self._cond:
+            futures = [item.future for item in self._pending]
+            self._flushing = bool(self._pending)
+            self._cond.notify()
+        if wait_for:
+            wait(futures)
+
+    def close(self, wait_for: bool = True) -> None:
+        """
+        Stops accepting files, and uploads the ones still pending.
+
+        :param wait_for: Whether to wait until every upload has finished
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            if wait_for:
+                self._thread.join()
+            self._pool.shutdown(wait=wait_for)
+
+    async def aclose(self) -> None:
+        """
+        Async version of `close`.
+        """
+        await asyncio.to_thread(self.close)
+
+    def _ready(self) -> bool:
+        """Whether a batch should be uploaded now. Must be called with the lock held."""
+        if not self._pending:
+            return False
+        return (
+            self._closed
+            or self._flushing
+            or len(self._pending) >= self.max_files
+            or (self.max_size is not None and self._pending_size >= self.max_size)
+            or time.monotonic() - self._pending[0].queued_at >= self.max_delay
+        )
+
+    def _take(self) -> List[List[_Pending]]:
+        """Removes the batches that are ready from the front of the queue. Must be called with the lock held."""
+        batches = []
+        for chunk in as_chunks(self._pending, self.max_files):
+            full = len(chunk) == self.max_files
+            batch, size = [], 0
+            for item in chunk:
+                # Files of unknown size go on their own, as they might be too large to share a paste.
+                too_big = self.max_size is not None and (item.size is None or size + item.size > self.max_size)
+                if batch and too_big:
+                    batches.append(batch)
+                    batch, size, full = [], 0, True
+                batch.append(item)
+                size += item.size or 0
+            if full or self._closed or self._flushing or not batches:
+                batches.append(batch)
+            else:
+                break  # the last batch is not full yet, and may still fill up before its deadline
+        taken = sum(len(batch) for batch in batches)
+        del self._pending[:taken]
+        self._pending_size = sum(item.size or 0 for item in self._pending)
+        if not self._pending:
+            self._flushing = False
+        return batches
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._ready():
+                    if self._closed and not self._pending:
+                        return
+                    timeout = None
+                    if self._pending:
+                        timeout = self._pending[0].queued_at + self.max_delay - time.monotonic()
+                    self._cond.wait(timeout)
+                batches = self._take()
+            for batch in batches:
+                # The queue plans each paste itself, so it knows which files end up in which, rather than leaving
+                # the backend to split (and maybe reorder) a batch that does not fit in one.
+                plan = plan_pastes(
+                    self.backend, [item.file for item in batch], max_files=self.max_files, max_size=self.max_size
+                )
+                for group in plan:
+                    self.requests += 1
+                    self._pool.submit(self._upload, [batch[i] for i in group])
+
+    def _upload(self, batch: List[_Pending]) -> None:
+        batch = [item for item in batch if item.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            result = self.backend.create_paste(*(item.file for item in batch), **self.paste_kwargs)
+        except Exception as e:
+            self.backend._logger.warning("Queued paste of %d file(s) failed", len(batch), exc_info=True)
+            for item in batch:
+                item.future.set_exception(e)
+            return
+        results = result if isinstance(result, list) else [result] * len(batch)
+        if len(results) != len(batch):
+            # The backend split the paste up in a way the plan did not expect, so which file went where is unknown.
+            # The pastes were still made, so their URLs are kept in the error.
+            error = RuntimeError(
+                "%s returned %d result(s) for a paste of %d file(s): %s"
+                % (self.backend.name, len(results), len(batch), ", ".join(getattr(r, "url", repr(r)) for r in results))
+            )
+            self.backend._logger.warning("%s", error)
+            for item in batch:
+                item.future.set_exception(error)
+            return
+        for item, item_result in zip(batch, results):
+            if isinstance(item_result, BaseException):  # with `return_exceptions`
+                item.future.set_exception(item_result)
+            else:
+                item.future.set_result(item_result)
@@ -0,0 +1,383 @@
+"""
+Scrubbing secrets (tokens, keys, passwords, email addresses) out of content before it is uploaded.
+"""
+
+import collections
+import copy
+import itertools
+import re
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+from ._generic import GenericFile
+from ._streaming import StreamFile
+from .base import BaseFile
+
+__all__ = ("BUILTIN_PATTERNS", "Redactor")
+
+BLOCK_SIZE = 1024 * 1024
+CONTEXT = 256
+"""How much content before a block is kept for lookbehinds"""
+DEFAULT_MAX_MATCH = 16 * 1024
+
+
+class _Rule(NamedTuple):
+    name: str
+    pattern: "re.Pattern[bytes]"
+    lowered: bool = False
+    """Whether the rule is case-insensitive, matching (lowercase) against the lowercased content"""
+    anchor: Optional[bytes] = None
+    """For rules that do not start with a literal: a literal in every match, at most `lead` bytes in"""
+    lead: int = 0
+    length: int = 0
+    """The longest match of an anchored rule"""
+
+
+def _rule(name: str, pattern: bytes, lowered: bool = False, **anchor) -> _Rule:
+    return _Rule(name, re.compile(pattern), lowered, **anchor)
+
+
+# A value that has already been redacted is left alone, so that redacting twice changes nothing.
+_VALUE = rb"""["']?\s{0,5}[:=]\s{0,5}["']?(?!\[redacted)(?P<secret>[^\s"',;&\x80-\xff]{1,256})"""
+
+# Each rule starts with a literal, so that `re` skips straight to the candidates with a fast substring search, or is
+# anchored on one. Only the part in the `secret` group (if any) is redacted. Case-insensitive rules are written in
+# lowercase, and matched against lowercased content.
+_BUILTIN_RULES: Tuple[_Rule, ...] = (
+    _rule("aws-access-key", rb"A[KS]IA[0-9A-Z]{16}(?![0-9A-Za-z])"),
+    _rule("github-token", rb"g(?:h[pousr]_[A-Za-z0-9]{36,255}|ithub_pat_[A-Za-z0-9_]{22,255})"),
+    _rule("slack-token", rb"xox[abprs]-[A-Za-z0-9-]{10,200}"),
+    _rule("stripe-key", rb"[rs]k_(?:live|test)_[A-Za-z0-9]{16,99}", anchor=b"k_", lead=1, length=128),
+    _rule("google-api-key", rb"AIza[0-9A-Za-z_-]{35}"),
+    _rule("jwt", rb"eyJ[A-Za-z0-9_-]{8,4096}\.eyJ[A-Za-z0-9_-]{8,4096}\.[A-Za-z0-9_-]{8,4096}"),
+    _rule(
+        "private-key",
+        rb"-----BEGIN [A-Z ]{0,32}PRIVATE KEY-----[\s\S]{0,8192}?-----END [A-Z ]{0,32}PRIVATE KEY-----",
+    ),
+    _rule("bearer-token", rb"bearer\s{1,5}(?P<secret>[a-z0-9._~+/-]{16,1024}={0,2})", lowered=True),
+    _rule("password", rb"passw(?:or)?d" + _VALUE, lowered=True),
+    _rule("secret", rb"secret" + _VALUE, lowered=True),
+    _rule("api-key", rb"api[_-]?key" + _VALUE, lowered=True),
+    _rule(
+        "email",
+        rb"(?<![\w.+-])[\w.+-]{1,64}@[A-Za-z0-9-]{1,63}(?:\.[A-Za-z0-9-]{1,63}){1,8}",
+        anchor=b"@",
+        lead=64,
+        length=1024,
+    ),
+)
+BUILTIN_PATTERNS: Tuple[str, ...] = tuple(rule.name for rule in _BUILTIN_RULES)
+"""The names of the built-in patterns"""
+
+
+def _scan(rules: Tuple[_Rule, ...], window: bytes, start: int, stop: int) -> List[Tuple[int, int, str]]:
+    """
+    Finds what to redact in `window`, among the matches that start between `start` and `stop`. The rest of the
+    window is only there as context.
+
+    :return: The (start, end, rule name) of each span, in order. Overlapping matches are merged into one span.
+    """
+    lowered = None
+    spans = []
+    for rule in rules:
+        if rule.lowered and lowered is None:
+            lowered = window.lower()
+        text = lowered if rule.lowered else window
+        if rule.anchor is None:
+            matches = rule.pattern.finditer(text, start)
+        else:
+            matches = _anchored(rule, text, start, stop)
+        for match in matches:
+            if match.start() >= stop:
+                break
+            span = match.span("secret") if "secret" in rule.pattern.groupindex else match.span()
+            if span[1] > span[0]:
+                spans.append((span[0], span[1], rule.name))
+
+    spans.sort()
+    merged: List[Tuple[int, int, str]] = []
+    for span in spans:
+        if merged and span[0] < merged[-1][1]:
+            if span[1] > merged[-1][1]:
+                merged[-1] = (merged[-1][0], span[1], merged[-1][2])
+        else:
+            merged.append(span)
+    return merged
+
+
+def _anchored(rule: _Rule, text: bytes, start: int, stop: int) -> Iterator["re.Match[bytes]"]:
+    """
+    Finds a rule's matches by looking for its anchor, and only trying the `lead` bytes before each one, which is far
+    faster than trying every position for patterns that start with a character class.
+    """
+    position = start
+    while True:
+        at = text.find(rule.anchor, position)
+        if at < 0 or max(position, at - rule.lead) >= stop:
+            return
+        match = rule.pattern.search(text, max(position, at - rule.lead), at + rule.length)
+        if match is None or match.start() > at:
+            position = at + 1
+            continue
+        yield match
+        position = max(match.end(), at + 1)
+
+
+_worker_rules: Tuple[_Rule, ...] = ()
+
+
+def _init_worker(rules: Tuple[_Rule, ...]) -> None:
+    global _worker_rules
+    _worker_rules = rules
+
+
+def _scan_in_worker(window: bytes, start: int, stop: int) -> List[Tuple[int, int, str]]:
+    return _scan(_worker_rules, window, start, stop)
+
+
+class Redactor:
+    """
+    Replaces secrets in content with `[REDACTED:<pattern name>]` before it is uploaded.
+
+    The built-in patterns (see `BUILTIN_PATTERNS`) cover cloud and SaaS tokens (AWS, GitHub, Slack, Stripe, Google),
+    JWTs, private keys, bearer tokens, `password=`/`secret=`/`api_key=` values and email addresses. Add your own
+    with `patterns`. Where a pattern has a group named `secret`, only that group is replaced.
+
+    Content is scanned in blocks, each with a little of its neighbours' content around it, so a match that spans two
+    blocks (or two chunks of a stream) is still found, as long as it is at most `max_match` bytes long. Every span
+    that any pattern matches is redacted. Each built-in pattern starts with (or is anchored on) a literal, so the
+    scan skips from candidate to candidate with a fast substring search rather than trying every position, which is
+    what a single alternation of every pattern does in `re`.
+
+    With `workers` greater than 1, large content is scanned by that many processes at once, while blocks are still
+    written out in order.
+
+    Example:
+    >>> redactor = Redactor({"internal-host": r"[a-z0-9-]+\\.corp\\.example\\.com"})
+    >>> redactor.redact("token=ghp_" + "a" * 36 + " on build-1.corp.example.com")
+    'token=[REDACTED:github-token] on [REDACTED:internal-host]'
+    >>> redactor.counts
+    {'github-token': 1, 'internal-host': 1}
+    >>> backend = HstSHBackend(redactor=redactor)  # redacts every file pasted
+    """
+
+    def __init__(
+        self,
+        patterns: Optional[Mapping[str, Union[str, bytes]]] = None,
+        *,
+        builtin: bool = True,
+        replacement: str = "[REDACTED:{name}]",
+        workers: int = 1,
+        block_size: int = BLOCK_SIZE,
+        max_match: int = DEFAULT_MAX_MATCH,
+    ):
+        """
+        :param patterns: Extra patterns to redact, by name. Patterns are compiled as bytes regular expressions, and
+            are fastest when they start with a literal.
+        :param builtin: Whether to redact the built-in patterns too
+        :param replacement: What each match is replaced with. `{name}` is replaced with the pattern's name.
+        :param workers: How many processes to scan large content with. 1 scans it in this process.
+        :param block_size: The size of each block scanned
+        :param max_match: The longest match that is certain to be found when it spans two blocks
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        rules = list(_BUILTIN_RULES) if builtin else []
+        for name, pattern in (patterns or {}).items():
+            if isinstance(pattern, str):
+                pattern = pattern.encode("utf-8")
+            rules.append(_Rule(name, re.compile(pattern)))
+        if not rules:
+            raise ValueError("There are no patterns to redact")
+        self.rules: Tuple[_Rule, ...] = tuple(rules)
+        self.replacement = replacement
+        self.workers = workers
+        self.block_size = block_size
+        self.max_match = max_match
+        self.counts: Dict[str, int] = {}
+        """How many matches of each pattern have been redacted so far"""
+        self._replacements = {rule.name: replacement.format(name=rule.name).encode("utf-8") for rule in rules}
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def __repr__(self):
+        return "<Redactor patterns=%d workers=%d redacted=%d>" % (
+            len(self.rules),
+            self.workers,
+            sum(self.counts.values()),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        """Stops the worker processes, if any were started"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                import multiprocessing
+
+                # Spawned rather than forked, as this is usually called from threads that are mid-upload.
+                self._pool = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.rules,),
+                )
+            return self._pool
+
+    def _count(self, counts: Dict[str, int], found: Dict[str, int]) -> None:
+        with self._lock:
+            for name, n in found.items():
+                self.counts[name] = self.counts.get(name, 0) + n
+        for name, n in found.items():
+            counts[name] = counts.get(name, 0) + n
+
+    def _blocks(self, chunks: Iterable[bytes]) -> Iterator[Tuple[bytes, int, int, int]]:
+        """
+        Cuts a stream into blocks, each in a window holding `CONTEXT` bytes before it and `max_match` bytes after it.
+
+        :return: Each window, its offset in the stream, and where the block starts and stops in it
+        """
+        buffer = bytearray()
+        base = block = 0  # the offsets of the buffer and of the next block in the stream
+
+        def window(stop: int) -> Tuple[bytes, int, int, int]:
+            low = max(block - CONTEXT, base)
+            data = bytes(buffer[low - base : stop + self.max_match - base])
+            return data, low, block - low, stop - low
+
+        for chunk in chunks:
+            buffer += chunk
+            while base + len(buffer) >= block + self.block_size + self.max_match:
+                yield window(block + self.block_size)
+                block += self.block_size
+                if block - CONTEXT - base >= self.block_size:
+                    del buffer[: block - CONTEXT - base]
+                    base = block - CONTEXT
+        end = base + len(buffer)
+        while block < end:
+            stop = min(block + self.block_size, end)
+            yield window(stop)
+            block = stop
+
+    def _scanned(self, chunks: Iterable[bytes]) -> Iterator[Tuple[bytes, int, int, int, List[Tuple[int, int, str]]]]:
+        """Scans each block, in worker processes once the content turns out to be large, and yields them in order"""
+        rules = self.rules
+        waiting: Deque[Tuple[bytes, int, int, int, "Future[List[Tuple[int, int, str]]]"]] = collections.deque()
+        try:
+            for n, (window, offset, start, stop) in enumerate(self._blocks(chunks)):
+                if self.workers == 1 or n < 2:
+                    yield window, offset, start, stop, _scan(rules, window, start, stop)
+                    continue
+                waiting.append(
+                    (window, offset, start, stop, self._get_pool().submit(_scan_in_worker, window, start, stop))
+                )
+                while waiting and (len(waiting) > self.workers * 2 or waiting[0][4].done()):
+                    *block, future = waiting.popleft()
+                    yield (*block, future.result())
+            while waiting:
+                *block, future = waiting.popleft()
+                yield (*block, future.result())
+        finally:
+            for *_, future in waiting:
+                future.cancel()
+
+    def _splice(
+        self, window: bytes, spans: List[Tuple[int, int, str]], position: int, stop: int, found: Dict[str, int]
+    ) -> Tuple[bytes, int]:
+        """
+        Writes out a block from `position`, with its spans replaced.
+
+        :return: The redacted block, and where it ended in the window (past `stop`, if a span crossed it)
+        """
+        parts = []
+        for start, end, name in spans:
+            if end <= position:
+                continue  # covered by a span from the previous block
+            parts.append(window[position : max(start, position)])
+            parts.append(self._replacements[name])
+            found[name] = found.get(name, 0) + 1
+            position = end
+        if position < stop:
+            parts.append(window[position:stop])
+            position = stop
+        return b"".join(parts), position
+
+    def redact_chunks(self, chunks: Iterable[bytes], counts: Optional[Dict[str, int]] = None) -> Iterator[bytes]:
+        """
+        Redacts a stream of content as it is read.
+
+        :param chunks: The content, as UTF-8 byte chunks
+        :param counts: If given, how many matches of each pattern were redacted is added to this, too
+        :return: The redacted content, a block at a time
+        """
+        found: Dict[str, int] = {}
+        emitted = 0  # how far into the stream has been written out
+        try:
+            for window, offset, start, stop, spans in self._scanned(chunks):
+                redacted, position = self._splice(window, spans, max(emitted - offset, start), stop, found)
+                emitted = offset + position
+                yield redacted
+        finally:
+            self._count(counts if counts is not None else {}, found)
+
+    def redact(self, content: Union[str, bytes], counts: Optional[Dict[str, int]] = None) -> Union[str, bytes]:
+        """
+        Redacts content held in memory.
+
+        :param content: The content
+        :param counts: If given, how many matches of each pattern were redacted is added to this, too
+        :return: The redacted content, of the same type. If nothing was redacted, this is `content` itself.
+        """
+        data = content.encode("utf-8") if isinstance(content, str) else bytes(content)
+        if len(data) > self.block_size:
+            redacted = b"".join(self.redact_chunks((data,), counts))
+        else:
+            spans = _scan(self.rules, data, 0, len(data))
+            if not spans:
+                return content
+            found: Dict[str, int] = {}
+            redacted = self._splice(data, spans, 0, len(data), found)[0]
+            self._count(counts if counts is not None else {}, found)
+        if redacted == data:
+            return content
+        return redacted.decode("utf-8") if isinstance(content, str) else redacted
+
+    def redact_file(self, file: BaseFile, counts: Optional[Dict[str, int]] = None) -> BaseFile:
+        """
+        Redacts a file. `StreamFile`s are redacted lazily, as they are read, so they stay streams (and stay single-use
+        if they were).
+
+        :param file: The file
+        :param counts: If given, how many matches of each pattern were redacted is added to this, too. A stream that
+            is read more than once (e.g. hashed, then uploaded) is only counted the first time.
+        :return: A redacted copy of the file, or the file itself if nothing needed redacting.
+        """
+        if isinstance(file, StreamFile):
+            if not file.reusable:
+                return StreamFile(self.redact_chunks(file.iter_chunks(), counts), filename=file.filename)
+            source, reads = file, itertools.count()
+
+            def chunks() -> Iterator[bytes]:
+                return self.redact_chunks(source.iter_chunks(), counts if next(reads) == 0 else None)
+
+            return StreamFile(chunks, filename=file.filename)
+        content = file.content
+        redacted = self.redact(content, counts)
+        if redacted is content:
+            return file
+        if isinstance(file, GenericFile):
+            clone = copy.copy(file)
+            clone._content = redacted
+            return clone
+        return type(file)(redacted)
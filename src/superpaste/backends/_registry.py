@@ -0,0 +1,85 @@
+"""
+A registry of backends by name, which only imports a backend when it is asked for.
+
+Third-party packages can add backends through the ``superpaste.backends`` entry point group, e.g. in their
+``pyproject.toml``:
+
+.. code-block:: toml
+
+    [project.entry-points."superpaste.backends"]
+    "paste.example" = "superpaste_example:ExampleBackend"
+"""
+
+import importlib
+from typing import TYPE_CHECKING, Dict, List, Type, Union
+
+if TYPE_CHECKING:
+    from .base import BaseBackend
+
+__all__ = ("backend_names", "load_backend", "register_backend")
+
+ENTRY_POINT_GROUP = "superpaste.backends"
+
+_BACKENDS: Dict[str, Union[str, Type["BaseBackend"]]] = {
+    "hst.sh": "superpaste.backends.hst_sh:HstSHBackend",
+    "mystb.in": "superpaste.backends.mystb_in:MystbinBackend",
+    "paste.ee": "superpaste.backends.paste_ee:PasteEEBackend",
+    "skyra.pw": "superpaste.backends.hastebin_skyra_pw:HastebinSkyraPWBackend",
+    "toptal": "superpaste.backends.hastebin_com:HastebinBackend",
+}
+_plugins_loaded = False
+
+
+def _load_plugins() -> None:
+    """Adds backends from entry points. Built-in and explicitly registered backends take precedence."""
+    global _plugins_loaded
+    if _plugins_loaded:
+        return
+    _plugins_loaded = True
+    from importlib.metadata import entry_points
+
+    try:
+        found = entry_points(group=ENTRY_POINT_GROUP)
+    except TypeError:  # Python < 3.10
+        found = entry_points().get(ENTRY_POINT_GROUP, [])
+    for entry_point in found:
+        _BACKENDS.setdefault(entry_point.name, entry_point.value)
+
+
+def register_backend(name: str, backend: Union[str, Type["BaseBackend"]]) -> None:
+    """
+    Registers a backend under a name.
+
+    :param name: The name to use it by, e.g. on the command line
+    :param backend: The backend class, or its import path as ``"package.module:ClassName"``
+    """
+    _BACKENDS[name] = backend
+
+
+def backend_names(plugins: bool = True) -> List[str]:
+    """
+    Lists the names of every registered backend, without importing any of them.
+
+    :param plugins: Whether to include backends from entry points. Looking them up means reading package metadata.
+    """
+    if plugins:
+        _load_plugins()
+    return sorted(_BACKENDS)
+
+
+def load_backend(name: str) -> Type["BaseBackend"]:
+    """
+    Gets a backend class by name, importing it if needed.
+
+    :param name: The backend's name
+    :raises KeyError: If there is no backend by that name
+    """
+    if name not in _BACKENDS:
+        _load_plugins()
+    if name not in _BACKENDS:
+        raise KeyError("Unknown backend %r. Available: %s" % (name, ", ".join(backend_names())))
+    backend = _BACKENDS[name]
+    if isinstance(backend, str):
+        module, _, attr = backend.partition(":")
+        backend = _BACKENDS[name] = getattr(importlib.import_module(module), attr)
+    return backend
@@ -0,0 +1,321 @@
+"""
+Retrying of failed and rate-limited requests, and client-side pacing of requests to each host.
+
+Both are implemented as httpx transports, which `BaseBackend` installs on its pooled clients.
+"""
+
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Optional
+
+import httpx
+
+__all__ = ("RetryPolicy", "TokenBucket", "RateLimiter", "RetryTransport", "AsyncRetryTransport")
+
+# Errors raised before the request was sent. Retrying these can never cause a duplicate paste.
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parses a `Retry-After` header, which is either a number of seconds or an HTTP date.
+
+    :return: The number of seconds to wait, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+def parse_rate_limit_reset(headers: httpx.Headers) -> Optional[float]:
+    """
+    Reads the common rate limit headers (`RateLimit-*` and `X-RateLimit-*`).
+
+    :return: How many seconds until requests are allowed again, if the response says the limit is used up.
+    """
+    remaining = headers.get("ratelimit-remaining", headers.get("x-ratelimit-remaining"))
+    reset = headers.get("ratelimit-reset", headers.get("x-ratelimit-reset"))
+    if remaining is None or reset is None:
+        return None
+    try:
+        if float(remaining) > 0:
+            return None
+        reset = float(reset)
+    except ValueError:
+        return None
+    # Some services send a delta in seconds, others a unix timestamp.
+    if reset > 10**9:
+        reset -= time.time()
+    return max(0.0, reset)
+
+
+@dataclass
+class RetryPolicy:
+    """
+    When, and how long to wait before, retrying a request.
+
+    Idempotent requests (GET, HEAD, ...) are retried on any transport error and on `retry_statuses`. Other requests
+    (i.e. creating pastes) are only retried when they certainly were not processed: on connection errors, and on
+    429 Too Many Requests if the body can be sent again. Waits back off exponentially with full jitter, and
+    `Retry-After` is respected.
+    """
+
+    max_retries: int = 3
+    """How many times to retry a request. 0 disables retrying."""
+    backoff: float = 0.5
+    """The base wait in seconds, doubled after each attempt"""
+    max_backoff: float = 30.0
+    """The longest wait between attempts, in seconds. A longer `Retry-After` is not retried."""
+    jitter: bool = True
+    """Whether to randomise waits (between 0 and the backoff), so that many clients do not retry in lockstep."""
+    retry_statuses: FrozenSet[int] = field(default_factory=lambda: frozenset({429, 500, 502, 503, 504}))
+    """The response statuses that idempotent requests are retried on"""
+    idempotent_methods: FrozenSet[str] = field(
+        default_factory=lambda: frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+    )
+
+    def backoff_for(self, attempt: int) -> float:
+        """The wait before retry number `attempt` (starting at 0), without any `Retry-After`"""
+        delay = min(self.max_backoff, self.backoff * (2**attempt))
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def should_retry_error(self, request: httpx.Request, error: Exception, attempt: int) -> bool:
+        """Whether to retry a request that raised `error`"""
+        if attempt >= self.max_retries:
+            return False
+        if isinstance(error, CONNECT_ERRORS):
+            return True
+        return request.method in self.idempotent_methods and isinstance(error, httpx.TransportError)
+
+    def retry_delay(self, request: httpx.Request, response: httpx.Response, attempt: int) -> Optional[float]:
+        """
+        Whether to retry a request that got `response`, and how long to wait first.
+
+        :return: The number of seconds to wait, or None if the request should not be retried.
+        """
+        if attempt >= self.max_retries:
+            return None
+        if request.method in self.idempotent_methods:
+            retry = response.status_code in self.retry_statuses
+        else:
+            # A rate limited request was rejected outright, so it can be sent again if its body can be.
+            retry = response.status_code == 429 and isinstance(request.stream, httpx.ByteStream)
+        if not retry:
+            return None
+        retry_after = parse_retry_after(response.headers.get("retry-after"))
+        if retry_after is None:
+            return self.backoff_for(attempt)
+        return retry_after if retry_after <= self.max_backoff else None
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket, allowing `rate` requests per second on average, with bursts of up to `burst`.
+
+    Tokens are reserved up front, so concurrent callers queue up fairly rather than all waking at once.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        :param rate: The average number of requests per second
+        :param burst: How many requests can be sent at once after a quiet period
+        """
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Takes a token.
+
+        :return: How many seconds the caller must wait before sending its request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def pause(self, seconds: float) -> None:
+        """Stops handing out tokens for `seconds`, e.g. because the server said the rate limit is used up."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def acquire(self) -> None:
+        """Takes a token, sleeping until it can be used"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def async_acquire(self) -> None:
+        """Takes a token, sleeping (asynchronously) until it can be used"""
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class RateLimiter:
+    """
+    A set of token buckets, one per host. Share an instance between backends to share their request budgets.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, per_host: Optional[Dict[str, float]] = None):
+        """
+        :param rate: The default number of requests per second, for each host
+        :param burst: How many requests can be sent to a host at once after a quiet period
+        :param per_host: Rates for specific hosts, overriding `rate`
+        """
+        self.rate = rate
+        self.burst = burst
+        self.per_host = per_host or {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, host: str) -> TokenBucket:
+        """Gets the bucket for a host"""
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.per_host.get(host, self.rate), self.burst)
+            return self._buckets[host]
+
+
+class _RetryMixin:
+    def __init__(self, policy: Optional[RetryPolicy] = None, rate_limiter: Optional[RateLimiter] = None):
+        self.policy = policy or RetryPolicy(max_retries=0)
+        self.rate_limiter = rate_limiter
+
+    def _bucket(self, request: httpx.Request) -> Optional[TokenBucket]:
+        return self.rate_limiter.bucket(request.url.host) if self.rate_limiter else None
+
+    @staticmethod
+    def _observe(bucket: Optional[TokenBucket], response: httpx.Response) -> None:
+        """Pauses the host's bucket if the server says its rate limit is used up"""
+        if bucket is None:
+            return
+        reset = parse_rate_limit_reset(response.headers)
+        if reset is None and response.status_code == 429:
+            reset = parse_retry_after(response.headers.get("retry-after"))
+        if reset:
+            bucket.pause(reset)
+
+    @staticmethod
+    def _failed(request: httpx.Request, error: Exception) -> None:
+        """Reports a request that failed without a response to its metrics, if they are being recorded"""
+        trace = request.extensions.get("superpaste_metrics")
+        if trace is not None:
+            trace.finish(error)
+
+    @staticmethod
+    def _count_retry(request: httpx.Request) -> None:
+        request.extensions["superpaste_retries"] = request.extensions.get("superpaste_retries", 0) + 1
+
+
+class RetryTransport(_RetryMixin, httpx.BaseTransport):
+    """
+    A transport that paces requests with a `RateLimiter`, and retries them according to a `RetryPolicy`.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.BaseTransport,
+        policy: Optional[RetryPolicy] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
+        """
+        :param transport: The transport to send requests with
+        :param policy: When to retry. Defaults to never.
+        :param rate_limiter: The rate limiter to pace requests with, if any
+        """
+        super().__init__(policy, rate_limiter)
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        bucket = self._bucket(request)
+        attempt = 0
+        while True:
+            if bucket is not None:
+                bucket.acquire()
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError as e:
+                if not self.policy.should_retry_error(request, e, attempt):
+                    self._failed(request, e)
+                    raise
+                delay = self.policy.backoff_for(attempt)
+            else:
+                self._observe(bucket, response)
+                delay = self.policy.retry_delay(request, response, attempt)
+                if delay is None:
+                    return response
+                response.close()
+            self._count_retry(request)
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncRetryTransport(_RetryMixin, httpx.AsyncBaseTransport):
+    """
+    Async version of `RetryTransport`.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        policy: Optional[RetryPolicy] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
+        """
+        :param transport: The transport to send requests with
+        :param policy: When to retry. Defaults to never.
+        :param rate_limiter: The rate limiter to pace requests with, if any
+        """
+        super().__init__(policy, rate_limiter)
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        bucket = self._bucket(request)
+        attempt = 0
+        while True:
+            if bucket is not None:
+                await bucket.async_acquire()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                if not self.policy.should_retry_error(request, e, attempt):
+                    self._failed(request, e)
+                    raise
+                delay = self.policy.backoff_for(attempt)
+            else:
+                self._observe(bucket, response)
+                delay = self.policy.retry_delay(request, response, attempt)
+                if delay is None:
+                    return response
+                await response.aclose()
+            self._count_retry(request)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
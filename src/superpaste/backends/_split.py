@@ -0,0 +1,277 @@
+"""
+Splitting of content that is too large for a single paste into multiple parts, linked together by a manifest paste.
+"""
+
+import asyncio
+import itertools
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Iterable, Iterator, List, Optional, Tuple, Union
+
+from ._streaming import StreamFile, aiter_sync
+from .base import BaseBackend, BaseFile, BaseResult
+
+__all__ = (
+    "SplitResult",
+    "split_lines",
+    "create_split_paste",
+    "async_create_split_paste",
+    "iter_split_paste",
+    "async_iter_split_paste",
+    "parse_manifest",
+)
+
+MANIFEST_HEADER = "superpaste-manifest/1"
+
+
+@dataclass
+class SplitResult(BaseResult):
+    """
+    The result of a split paste. `key` and `url` point to the manifest paste, which lists every part.
+    """
+
+    parts: List[BaseResult] = field(default_factory=list)
+
+
+def _utf8_boundary(data: Union[bytes, bytearray], limit: int) -> int:
+    """Finds the largest offset <= limit that does not fall inside a UTF-8 sequence"""
+    cut = limit
+    while cut > 0 and (data[cut] & 0xC0) == 0x80:
+        cut -= 1
+    return cut or limit
+
+
+def split_lines(chunks: Iterable[bytes], max_size: int) -> Iterator[bytes]:
+    """
+    Re-chunks a stream of bytes into parts of at most `max_size` bytes, cutting after the last newline that fits.
+
+    Lines longer than `max_size` are cut mid-line, but never inside a UTF-8 sequence. Only the part being built
+    is held in memory.
+
+    Example:
+    >>> list(split_lines([b"one\\ntwo\\nthree\\n"], 8))
+    [b'one\\ntwo\\n', b'three\\n']
+
+    :param chunks: The content to split
+    :param max_size: The maximum size of each part
+    :return: The parts
+    """
+    if max_size <= 0:
+        raise ValueError("max_size must be greater than 0")
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) > max_size:
+            cut = buffer.rfind(b"\n", 0, max_size) + 1 or _utf8_boundary(buffer, max_size)
+            yield bytes(buffer[:cut])
+            del buffer[:cut]
+    if buffer:
+        yield bytes(buffer)
+
+
+def parse_manifest(content: Union[str, bytes]) -> Optional[List[str]]:
+    """
+    Parses a manifest paste.
+
+    :param content: The content of the paste
+    :return: The keys of each part, in order, or None if the content is not a manifest.
+    """
+    if isinstance(content, bytes):
+        if not content.startswith(MANIFEST_HEADER.encode("utf-8")):
+            return None
+        content = content.decode("utf-8")
+    lines = content.splitlines()
+    if not lines or not lines[0].startswith(MANIFEST_HEADER):
+        return None
+    return [line.split(" ", 1)[0] for line in lines[1:] if line.strip()]
+
+
+def _build_manifest(name: Optional[str], parts: List[BaseResult]) -> bytes:
+    lines = ["%s parts=%d name=%s" % (MANIFEST_HEADER, len(parts), name or "-")]
+    lines.extend("%s %s" % (part.key, part.url) for part in parts)
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _as_chunks(file: Union[BaseFile, StreamFile]) -> Iterator[bytes]:
+    if isinstance(file, StreamFile):
+        return file.iter_chunks()
+    content = file.content
+    return iter((content.encode("utf-8") if isinstance(content, str) else content,))
+
+
+def _make_file(backend: BaseBackend, data: bytes, filename: Optional[str]) -> BaseFile:
+    if backend.supports_streaming:
+        return StreamFile(lambda: (data,), filename=filename, size=len(data))
+    return backend.file_class(data.decode("utf-8"))
+
+
+def _part_size(backend: BaseBackend, part_size: Optional[int]) -> Optional[int]:
+    if part_size is not None:
+        return part_size
+    limits = [x for x in (backend.max_file_size, backend.max_paste_size) if x is not None]
+    return min(limits) if limits else None
+
+
+def _group_parts(backend: BaseBackend, parts: Iterable[bytes], name: Optional[str]) -> Iterator[List[BaseFile]]:
+    """Packs parts into as few pastes as the backend's limits allow, turning them into files as it goes."""
+    per_paste = backend.max_files_per_paste or 1
+    group, size = [], 0
+    for n, part in enumerate(parts, start=1):
+        too_big = backend.max_paste_size is not None and size + len(part) > backend.max_paste_size
+        if group and (len(group) == per_paste or too_big):
+            yield group
+            group, size = [], 0
+        filename = "%s.part%03d" % (name or "paste", n)
+        group.append(_make_file(backend, part, filename))
+        size += len(part)
+    if group:
+        yield group
+
+
+def _fits(file: Union[BaseFile, StreamFile], part_size: Optional[int]) -> bool:
+    """Whether a file is known to fit in a single part without reading it"""
+    if part_size is None:
+        return True
+    if isinstance(file, StreamFile):
+        return file.size is not None and file.size <= part_size
+    content = file.content
+    return len(content.encode("utf-8") if isinstance(content, str) else content) <= part_size
+
+
+def _peek(parts: Iterator[bytes]) -> Tuple[Optional[bytes], Iterator[bytes]]:
+    """Checks whether there is more than one part. Returns the only part if there is just one."""
+    first = next(parts, b"")
+    second = next(parts, None)
+    if second is None:
+        return first, iter(())
+    return None, itertools.chain((first, second), parts)
+
+
+def create_split_paste(
+    backend: BaseBackend,
+    file: Union[BaseFile, StreamFile],
+    *,
+    part_size: Optional[int] = None,
+    max_concurrency: int = 4,
+    **kwargs: Any,
+) -> Union[BaseResult, SplitResult]:
+    """
+    Creates a paste, splitting it into multiple parts if it is too large for the backend.
+
+    Parts are cut on line boundaries to fit the backend's `max_file_size` and `max_paste_size`, packed up to
+    `max_files_per_paste` at a time, and uploaded while the rest of the content is still being read. Then a manifest
+    paste listing every part is created. Use `iter_split_paste` to reassemble it.
+
+    :param backend: The backend to paste to
+    :param file: The file to paste. `StreamFile`s are split without reading them into memory.
+    :param part_size: The maximum size of each part in bytes. Defaults to the backend's limits.
+    :param max_concurrency: How many parts to upload at once
+    :param kwargs: Extra keyword arguments for `create_paste`
+    :return: The plain result if the content fit in one paste, otherwise a `SplitResult`
+    """
+    part_size = _part_size(backend, part_size)
+    if _fits(file, part_size):
+        return backend.create_paste(file, **kwargs)
+    name = getattr(file, "filename", None)
+    only, parts = _peek(split_lines(_as_chunks(file), part_size))
+    if only is not None:
+        return backend.create_paste(_make_file(backend, only, name), **kwargs)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        futures, pending = [], set()
+        for group in _group_parts(backend, parts, name):
+            if len(pending) >= max_concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()  # fail fast
+            future = pool.submit(backend.create_paste, *group, **kwargs)
+            futures.append(future)
+            pending.add(future)
+        results = [future.result() for future in futures]
+
+    manifest = backend.create_paste(_make_file(backend, _build_manifest(name, results), name), **kwargs)
+    return SplitResult(manifest.key, manifest.url, results)
+
+
+async def async_create_split_paste(
+    backend: BaseBackend,
+    file: Union[BaseFile, StreamFile],
+    *,
+    part_size: Optional[int] = None,
+    max_concurrency: int = 4,
+    **kwargs: Any,
+) -> Union[BaseResult, SplitResult]:
+    """
+    Async version of `create_split_paste`. The content is read in a thread.
+    """
+    part_size = _part_size(backend, part_size)
+    if _fits(file, part_size):
+        return await backend.async_create_paste(file, **kwargs)
+    name = getattr(file, "filename", None)
+    only, parts = await asyncio.to_thread(_peek, split_lines(_as_chunks(file), part_size))
+    if only is not None:
+        return await backend.async_create_paste(_make_file(backend, only, name), **kwargs)
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    tasks = []
+
+    async def upload(group: List[BaseFile]) -> BaseResult:
+        try:
+            return await backend.async_create_paste(*group, **kwargs)
+        finally:
+            semaphore.release()
+
+    try:
+        async for group in aiter_sync(_group_parts(backend, parts, name)):
+            await semaphore.acquire()
+            for task in tasks:
+                if task.done() and task.exception():
+                    raise task.exception()  # fail fast
+            tasks.append(asyncio.ensure_future(upload(group)))
+        results = list(await asyncio.gather(*tasks))
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    manifest = await backend.async_create_paste(_make_file(backend, _build_manifest(name, results), name), **kwargs)
+    return SplitResult(manifest.key, manifest.url, results)
+
+
+def _join_files(files: Union[BaseFile, List[BaseFile]]) -> bytes:
+    if not isinstance(files, list):
+        files = [files]
+    return b"".join(f.content.encode("utf-8") if isinstance(f.content, str) else f.content for f in files)
+
+
+def iter_split_paste(backend: BaseBackend, key: str, **kwargs: Any) -> Iterator[bytes]:
+    """
+    Reassembles a paste created by `create_split_paste`, yielding the content of one part at a time.
+
+    If `key` is not a manifest, the paste's own content is yielded, so this works for any paste.
+
+    :param backend: The backend the paste was created on
+    :param key: The key of the manifest paste
+    :param kwargs: Extra keyword arguments for `get_paste`
+    :return: The content of each part, in order
+    """
+    content = _join_files(backend.get_paste(key, **kwargs))
+    keys = parse_manifest(content)
+    if keys is None:
+        yield content
+        return
+    for part_key in keys:
+        yield _join_files(backend.get_paste(part_key, **kwargs))
+
+
+async def async_iter_split_paste(backend: BaseBackend, key: str, **kwargs: Any) -> AsyncIterator[bytes]:
+    """
+    Async version of `iter_split_paste`.
+    """
+    content = _join_files(await backend.async_get_paste(key, **kwargs))
+    keys = parse_manifest(content)
+    if keys is None:
+        yield content
+        return
+    for part_key in keys:
+        yield _join_files(await backend.async_get_paste(part_key, **kwargs))
@@ -0,0 +1,594 @@
+"""
+A durable, on-disk spool of pastes, uploaded in the background so that producers never wait on (or lose content to)
+a slow or unreachable backend.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import Any, List, NamedTuple, Optional, Set, Union
+
+import httpx
+
+from ._planner import _pack
+from ._split import _as_chunks, _make_file
+from ._streaming import MappedFile, StreamFile
+from .base import BaseBackend, BaseFile
+
+__all__ = ("SpooledPaste", "PasteSpool")
+
+_log = logging.getLogger(__name__)
+
+PENDING, DONE, FAILED = "pending", "done", "failed"
+_PERMANENT_STATUSES = range(400, 500)
+_TRANSIENT_STATUSES = (408, 425, 429)
+_ORPHAN_AGE = 3600
+"""How old spooled content that no ticket refers to must be before it is removed, in seconds"""
+LEASE = 60.0
+"""How long a spool's claim on the files it is uploading lasts, in seconds. It is renewed while they upload, and
+lapses if the process dies, after which another spool may upload them."""
+
+
+@dataclass
+class SpooledPaste:
+    """
+    A file submitted to a `PasteSpool`, and what became of it.
+    """
+
+    id: int
+    """The ticket `PasteSpool.submit` returned for the file"""
+    state: str
+    """`pending` until the file is uploaded, then `done`. `failed` if the spool gave up on it."""
+    filename: Optional[str]
+    size: int
+    created: float
+    """When the file was submitted, as a unix timestamp"""
+    attempts: int = 0
+    """How many times uploading the file has been tried"""
+    key: Optional[str] = None
+    """The key of the paste the file was uploaded in, once it is done"""
+    url: Optional[str] = None
+    """The URL of the paste the file was uploaded in, once it is done"""
+    error: Optional[str] = None
+    """Why the last attempt failed, if it did"""
+
+
+class _Entry(NamedTuple):
+    """A pending file, as the flusher sees it"""
+
+    id: int
+    data: str
+    filename: Optional[str]
+    size: int
+    attempts: int
+    solo: bool
+
+
+def _is_permanent(error: Exception) -> bool:
+    """Whether a failed upload would fail the same way if it were tried again"""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status in _PERMANENT_STATUSES and status not in _TRANSIENT_STATUSES
+    return isinstance(error, (ValueError, TypeError))
+
+
+def _fsync_dir(path: str) -> None:
+    """Makes a rename (or new file) in the directory durable. Directories cannot be opened like this on Windows."""
+    if os.name != "posix":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class PasteSpool:
+    """
+    A write-ahead spool directory in front of a backend.
+
+    `submit` writes a file to the spool and returns a ticket once it is safely on disk, without touching the network.
+    A background thread uploads spooled files in batches (sharing pastes where the backend allows, see
+    `plan_pastes`), `max_concurrency` pastes at a time. Failed uploads are retried with exponential backoff, so a
+    backend that is down for a while only delays pastes: nothing is lost, even if the process exits, as whatever is
+    still pending is picked up by the next `PasteSpool` opened on the same directory. Errors that would not go away on
+    retrying (such as a file the backend refuses as too large) fail the file straight away.
+
+    Every file's state, and once uploaded its paste's URL, is kept until `prune` removes it, so tickets can be looked up
+    long after they were submitted. Any number of processes can share a directory, submitting, looking tickets up and
+    uploading: each batch is claimed in the database by the spool that uploads it, so no two spools upload the same
+    file.
+
+    Example:
+    >>> spool = PasteSpool(HstSHBackend(), "/var/spool/superpaste")
+    >>> ticket = spool.submit(HstFile("build output"))  # returns at once, even if hst.sh is down
+    >>> spool.wait(ticket, timeout=60).url
+    'https://hst.sh/ayoqaqesil'
+    >>> spool.pending, spool.failed
+    (0, 0)
+
+    A file is marked done only once its paste has been created, so a process killed mid-upload may paste that file
+    twice (once its claim has lapsed, after `LEASE` seconds). Files are read into memory to upload them on backends
+    without `supports_streaming`.
+    """
+
+    def __init__(
+        self,
+        backend: BaseBackend,
+        path: Union[str, os.PathLike],
+        *,
+        max_concurrency: int = 4,
+        max_files: Optional[int] = None,
+        max_attempts: Optional[int] = 10,
+        retry_delay: float = 5.0,
+        max_retry_delay: float = 300.0,
+        background: bool = True,
+        poll_interval: float = 1.0,
+        **paste_kwargs: Any,
+    ):
+        """
+        :param backend: The backend to upload to
+        :param path: The spool directory. It is created if it does not exist.
+        :param max_concurrency: How many pastes to upload at once
+        :param max_files: The most files to put in one paste. Defaults to the backend's `max_files_per_paste`.
+        :param max_attempts: How many times to try uploading a file before marking it failed. None retries forever.
+        :param retry_delay: How long to wait before the first retry, in seconds. Doubled after each failed attempt.
+        :param max_retry_delay: The longest wait between attempts, in seconds
+        :param background: Whether to upload spooled files in a background thread. If False, nothing is uploaded
+            until `flush` is called, which is useful for only submitting, or only looking up tickets.
+        :param poll_interval: How often to check for files submitted (or uploaded) by other processes, in seconds
+        :param paste_kwargs: Extra keyword arguments for `create_paste`, used for every paste.
+        :raises ValueError: If the directory spools pastes for a different backend
+        """
+        if max_concurrency <= 0:
+            raise ValueError("max_concurrency must be greater than 0")
+        self.backend = backend
+        self.path = os.fspath(path)
+        self.max_concurrency = max_concurrency
+        self.max_files = max_files or backend.max_files_per_paste or 1
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.poll_interval = poll_interval
+        self.paste_kwargs = paste_kwargs
+        self.requests = 0
+        """How many pastes have been attempted by this spool"""
+
+        self._data = os.path.join(self.path, "data")
+        os.makedirs(self._data, exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(self.path, "spool.db"), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pastes (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL, filename "
+            "TEXT, size INTEGER NOT NULL, state TEXT NOT NULL, created REAL NOT NULL, attempts INTEGER NOT NULL "
+            "DEFAULT 0, next_attempt REAL NOT NULL DEFAULT 0, solo INTEGER NOT NULL DEFAULT 0, owner TEXT, lease REAL "
+            "NOT NULL DEFAULT 0, key TEXT, url TEXT, error TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS pastes_due ON pastes (state, next_attempt)")
+        self._db.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('backend', ?)", (backend.name,))
+        spooled_for = self._db.execute("SELECT value FROM meta WHERE name = 'backend'").fetchone()[0]
+        if spooled_for != backend.name:
+            self._db.close()
+            raise ValueError("%s spools pastes for %r, not %r" % (self.path, spooled_for, backend.name))
+
+        self._lock = threading.RLock()
+        self._cond = threading.Condition(self._lock)
+        self._owner = uuid.uuid4().hex
+        self._uploading: Set[int] = set()
+        """The files this spool has claimed, and renews the claims on"""
+        self._renewed = 0.0
+        self._in_flight = 0
+        self._closed = False
+        self._remove_orphans()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        if background:
+            self._pool = ThreadPoolExecutor(max_concurrency, thread_name_prefix="superpaste-spool")
+            self._thread = threading.Thread(target=self._run, name="superpaste-spool-flusher", daemon=True)
+            self._thread.start()
+
+    def __repr__(self):
+        return "<PasteSpool path=%r backend=%r pending=%d failed=%d>" % (
+            self.path,
+            self.backend.name,
+            self.pending,
+            self.failed,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await asyncio.to_thread(self.close)
+
+    def _count(self, state: str) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM pastes WHERE state = ?", (state,)).fetchone()[0]
+
+    @property
+    def pending(self) -> int:
+        """How many files are waiting to be uploaded, including any being uploaded now (by any process)"""
+        return self._count(PENDING)
+
+    @property
+    def failed(self) -> int:
+        """How many files the spool gave up on. See `retry_failed`."""
+        return self._count(FAILED)
+
+    @property
+    def done(self) -> int:
+        """How many files have been uploaded (and not pruned)"""
+        return self._count(DONE)
+
+    def _remove_orphans(self) -> None:
+        """
+        Removes content that no ticket refers to: left behind by a submit that did not finish, or by an upload whose
+        content was not deleted. Recent content is left alone, as another process may be submitting it right now.
+        """
+        with self._lock:
+            wanted = {row[0] for row in self._db.execute("SELECT data FROM pastes WHERE state != ?", (DONE,))}
+        cutoff = time.time() - _ORPHAN_AGE
+        for entry in os.scandir(self._data):
+            if entry.name.split(".")[0] not in wanted and entry.stat().st_mtime < cutoff:
+                with suppress(FileNotFoundError):
+                    os.remove(entry.path)
+
+    def submit(self, file: Union[BaseFile, StreamFile, str, bytes], filename: Optional[str] = None) -> int:
+        """
+        Writes a file to the spool, to be uploaded in the background. This never blocks on the network.
+
+        The file is read in full, and synced to disk, before this returns.
+
+        :param file: The file to paste
+        :param filename: The name of the file, where the backend supports one. Defaults to the file's own filename.
+        :return: A ticket, to look the paste up with `get` or `wait`
+        :raises RuntimeError: If the spool has been closed
+        """
+        if self._closed:
+            raise RuntimeError("Cannot submit to a closed PasteSpool")
+        if filename is None:
+            filename = getattr(file, "filename", None)
+        if isinstance(file, (str, bytes)):
+            chunks = iter((file.encode("utf-8") if isinstance(file, str) else file,))
+        else:
+            chunks = _as_chunks(file)
+        name = uuid.uuid4().hex
+        temp = os.path.join(self._data, name + ".part")
+        try:
+            with open(temp, "wb") as fd:
+                for chunk in chunks:
+                    fd.write(chunk)
+                size = fd.tell()
+                fd.flush()
+                os.fsync(fd.fileno())
+            # The content is in place (and the rename durable) before its ticket exists, so every pending ticket has
+            # its content. A crash in between only leaves content that no ticket refers to.
+            os.replace(temp, os.path.join(self._data, name))
+            _fsync_dir(self._data)
+        except BaseException:
+            with suppress(FileNotFoundError):
+                os.remove(temp)
+            raise
+        with self._cond:
+            paste_id = self._db.execute(
+                "INSERT INTO pastes (data, filename, size, state, created) VALUES (?, ?, ?, ?, ?)",
+                (name, filename, size, PENDING, time.time()),
+            ).lastrowid
+            self._cond.notify()
+        return paste_id
+
+    async def async_submit(self, file: Union[BaseFile, StreamFile, str, bytes], filename: Optional[str] = None) -> int:
+        """
+        Async version of `submit`. The file is written in a thread, so that syncing it does not block the event loop.
+        """
+        return await asyncio.to_thread(self.submit, file, filename)
+
+    def get(self, ticket: int) -> Optional[SpooledPaste]:
+        """
+        Looks up a file submitted to this spool (by any process).
+
+        :param ticket: The ticket `submit` returned
+        :return: The file's state, and its paste once it is done. None if there is no such ticket, or it was pruned.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, state, filename, size, created, attempts, key, url, error FROM pastes WHERE id = ?",
+                (ticket,),
+            ).fetchone()
+        return None if row is None else SpooledPaste(*row)
+
+    def wait(self, ticket: int, timeout: Optional[float] = None) -> SpooledPaste:
+        """
+        Waits until a file has been uploaded, or has failed.
+
+        Files uploaded by this spool are noticed at once. Those uploaded by another process (sharing the directory)
+        are noticed every `poll_interval` seconds.
+
+        :param ticket: The ticket `submit` returned
+        :param timeout: The longest to wait, in seconds. None waits as long as it takes.
+        :return: The file's state, which is `done` or `failed`
+        :raises KeyError: If there is no such ticket
+        :raises TimeoutError: If the file is still pending after `timeout` seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                paste = self.get(ticket)
+                if paste is None:
+                    raise KeyError(ticket)
+                if paste.state != PENDING:
+                    return paste
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("Paste %d is still pending after %s seconds" % (ticket, timeout))
+                self._cond.wait(self.poll_interval if remaining is None else min(self.poll_interval, remaining))
+
+    async def async_wait(self, ticket: int, timeout: Optional[float] = None) -> SpooledPaste:
+        """
+        Async version of `wait`.
+        """
+        return await asyncio.to_thread(self.wait, ticket, timeout)
+
+    def retry_failed(self) -> int:
+        """
+        Puts every failed file back in the queue, to be tried again from scratch.
+
+        :return: How many files were re-queued
+        """
+        with self._cond:
+            count = self._db.execute(
+                "UPDATE pastes SET state = ?, attempts = 0, next_attempt = 0, solo = 0 WHERE state = ?",
+                (PENDING, FAILED),
+            ).rowcount
+            self._cond.notify()
+        return count
+
+    def prune(self, older_than: float = 0, failed: bool = False) -> int:
+        """
+        Forgets uploaded files, so that their tickets can no longer be looked up.
+
+        :param older_than: Only forget files submitted at least this many seconds ago
+        :param failed: Whether to forget (and delete the content of) failed files too
+        :return: How many files were forgotten
+        """
+        states = (DONE, FAILED) if failed else (DONE,)
+        cutoff = time.time() - older_than
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, data FROM pastes WHERE state IN (%s) AND created <= ?" % ",".join("?" * len(states)),
+                (*states, cutoff),
+            ).fetchall()
+            self._db.executemany("DELETE FROM pastes WHERE id = ?", ((paste_id,) for paste_id, _ in rows))
+        for _, name in rows:
+            with suppress(FileNotFoundError):
+                os.remove(os.path.join(self._data, name))
+        return len(rows)
+
+    def flush(self, timeout: Optional[float] = None) -> int:
+        """
+        Uploads every pending file now, including those waiting to be retried, and waits for them.
+
+        Without a background thread, the uploads are made from the calling thread (still `max_concurrency` at a time).
+
+        :param timeout: The longest to wait, in seconds. None waits until nothing is pending, however many retries
+            that takes.
+        :return: How many files are still pending
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._db.execute("UPDATE pastes SET next_attempt = 0 WHERE state = ?", (PENDING,))
+            self._cond.notify_all()
+        if self._thread is None:
+            self._drain(deadline)
+            return self.pending
+        with self._cond:
+            while True:
+                pending = self.pending
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if not pending or (remaining is not None and remaining <= 0):
+                    return pending
+                self._cond.wait(remaining)
+
+    def close(self) -> None:
+        """
+        Stops uploading, waits for the uploads in progress, and closes the spool. Whatever is still pending stays in
+        the spool for next time.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._pool.shutdown()
+        with self._lock:
+            self._db.close()
+
+    def _next_due(self) -> Optional[float]:
+        """
+        When the next file that this spool is not uploading is due (or its claim by another spool lapses), as a unix
+        timestamp. Call with the lock held.
+        """
+        for paste_id, due in self._db.execute(
+            "SELECT id, MAX(next_attempt, lease) AS due FROM pastes WHERE state = ? ORDER BY due", (PENDING,)
+        ):
+            if paste_id not in self._uploading:
+                return due
+        return None
+
+    def _take(self, now: float, limit: int) -> List[List[_Entry]]:
+        """
+        Claims up to `limit` batches of the files that are due, and that no other spool has claimed, packed within the
+        backend's limits. Files that spoiled a shared paste go on their own. Call with the lock held.
+        """
+        self._db.execute("BEGIN IMMEDIATE")  # so that two processes cannot claim the same files
+        try:
+            due = [
+                _Entry(*row)
+                for row in self._db.execute(
+                    "SELECT id, data, filename, size, attempts, solo FROM pastes WHERE state = ? AND next_attempt <= ? "
+                    "AND lease <= ? ORDER BY next_attempt, id LIMIT ?",
+                    (PENDING, now, now, limit * self.max_files),
+                )
+            ]
+            shared = [entry for entry in due if not entry.solo]
+            plan = _pack([entry.size for entry in shared], self.max_files, self.backend.max_paste_size)
+            batches = [[shared[i] for i in group] for group in plan]
+            batches.extend([entry] for entry in due if entry.solo)
+            batches = batches[:limit]
+            claimed = [entry.id for batch in batches for entry in batch]
+            self._db.executemany(
+                "UPDATE pastes SET owner = ?, lease = ? WHERE id = ?",
+                ((self._owner, now + LEASE, paste_id) for paste_id in claimed),
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._uploading.update(claimed)
+        return batches
+
+    def _renew(self) -> None:
+        """Extends the claims on the files being uploaded, well before they lapse. Call with the lock held."""
+        now = time.time()
+        if not self._uploading or now - self._renewed < LEASE / 4:
+            return
+        self._db.executemany(
+            "UPDATE pastes SET lease = ? WHERE id = ? AND owner = ?",
+            ((now + LEASE, paste_id, self._owner) for paste_id in self._uploading),
+        )
+        self._renewed = now
+
+    def _drain(self, deadline: Optional[float]) -> None:
+        """Uploads from the calling thread until nothing is pending, or the next retry is past the deadline."""
+        with ThreadPoolExecutor(self.max_concurrency, thread_name_prefix="superpaste-spool") as pool:
+            while True:
+                with self._cond:
+                    batches = self._take(time.time(), self.max_concurrency)
+                    if not batches:
+                        due = self._next_due()
+                        if due is None:
+                            return
+                        delay = max(0.0, due - time.time())
+                        if deadline is not None and time.monotonic() + delay > deadline:
+                            return
+                        self._cond.wait(min(delay, self.poll_interval))
+                        continue
+                futures = [pool.submit(self._upload, batch) for batch in batches]
+                while wait(futures, timeout=self.poll_interval).not_done:
+                    with self._lock:
+                        self._renew()
+                for future in futures:
+                    future.result()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    self._renew()
+                    free = self.max_concurrency - self._in_flight
+                    batches = self._take(time.time(), free) if free > 0 else []
+                    if batches:
+                        break
+                    due = self._next_due() if free > 0 else None
+                    delay = self.poll_interval if due is None else max(0.0, due - time.time())
+                    self._cond.wait(min(delay, self.poll_interval))
+                self._in_flight += len(batches)
+            for batch in batches:
+                self._pool.submit(self._upload_in_background, batch)
+
+    def _upload_in_background(self, batch: List[_Entry]) -> None:
+        try:
+            self._upload(batch)
+        except Exception:
+            _log.exception("Could not record the outcome of a spooled paste of %d file(s)", len(batch))
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def _file(self, entry: _Entry) -> Union[BaseFile, StreamFile]:
+        path = os.path.join(self._data, entry.data)
+        if self.backend.supports_streaming:
+            return MappedFile(path, entry.filename or "")
+        with open(path, "rb") as fd:
+            return _make_file(self.backend, fd.read(), entry.filename)
+
+    def _upload(self, batch: List[_Entry]) -> None:
+        with self._lock:
+            self.requests += 1
+        try:
+            try:
+                result = self.backend.create_paste(*(self._file(entry) for entry in batch), **self.paste_kwargs)
+            except Exception as e:
+                self._failed(batch, e)
+                return
+            results = result if isinstance(result, list) else [result] * len(batch)
+            if len(results) != len(batch):
+                # Something was pasted, but which file went where is unknown, and retrying could paste them twice.
+                error = RuntimeError(
+                    "%s returned %d result(s) for a paste of %d file(s)" % (self.backend.name, len(results), len(batch))
+                )
+                self._failed(batch, error, give_up=True)
+                return
+            with self._cond:
+                self._db.executemany(
+                    "UPDATE pastes SET state = ?, attempts = attempts + 1, key = ?, url = ?, error = NULL, "
+                    "owner = NULL, lease = 0 WHERE id = ?",
+                    ((DONE, r.key, r.url, entry.id) for entry, r in zip(batch, results)),
+                )
+            for entry in batch:
+                with suppress(FileNotFoundError):
+                    os.remove(os.path.join(self._data, entry.data))
+        finally:
+            # Even if the outcome could not be recorded: the claims then lapse, and the files are tried again.
+            with self._cond:
+                self._uploading.difference_update(entry.id for entry in batch)
+                self._cond.notify_all()
+
+    def _failed(self, batch: List[_Entry], error: Exception, give_up: bool = False) -> None:
+        now = time.time()
+        permanent = give_up or _is_permanent(error)
+        if permanent and len(batch) > 1 and not give_up:
+            # One file may have spoiled the paste for the rest, so each is tried again on its own, straight away.
+            _log.warning("Spooled paste of %d files failed, retrying them one by one: %r", len(batch), error)
+            updates = [(PENDING, entry.attempts, now, 1, repr(error), entry.id) for entry in batch]
+        else:
+            updates = []
+            for entry in batch:
+                attempts = entry.attempts + 1
+                exhausted = permanent or (self.max_attempts is not None and attempts >= self.max_attempts)
+                delay = min(self.max_retry_delay, self.retry_delay * 2 ** (attempts - 1))
+                updates.append(
+                    (FAILED if exhausted else PENDING, attempts, now + delay, entry.solo, repr(error), entry.id)
+                )
+            if updates[0][0] == FAILED:
+                _log.error("Spooled paste of %d file(s) failed, giving up: %r", len(batch), error)
+            else:
+                _log.warning("Spooled paste of %d file(s) failed, retrying later: %r", len(batch), error)
+        with self._cond:
+            self._db.executemany(
+                "UPDATE pastes SET state = ?, attempts = ?, next_attempt = ?, solo = ?, error = ?, owner = NULL, "
+                "lease = 0 WHERE id = ? AND owner = ?",
+                (update + (self._owner,) for update in updates),
+            )
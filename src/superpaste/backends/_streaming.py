@@ -0,0 +1,441 @@
+"""
+Support for streaming file content to backends, without reading it all into memory first.
+"""
+
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Any, AsyncIterator, Callable, Dict, Iterable, Iterator, Literal, Optional, Tuple, Union
+
+from .base import BaseFile, Utf8Validator
+
+__all__ = ("StreamFile", "MappedFile", "spool_json")
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_SPOOL_SIZE = 1024 * 1024
+
+_STREAM_MARKER = "\x00superpaste-stream:%d\x00"
+_STREAM_MARKER_RE = re.compile(rb'"\\u0000superpaste-stream:(\d+)\\u0000"')
+
+
+def iter_fd(fd: IO[bytes], chunk_size: int = DEFAULT_CHUNK_SIZE, close: bool = False) -> Iterator[bytes]:
+    """
+    Reads a binary file object in chunks of `chunk_size` bytes.
+
+    :param fd: The file object to read
+    :param chunk_size: The maximum size of each chunk
+    :param close: Whether to close `fd` once it has been read (or the iterator is discarded)
+    :return: The chunks
+    """
+    try:
+        while True:
+            chunk = fd.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if close:
+            fd.close()
+
+
+async def aiter_sync(iterable: Iterable[bytes]) -> AsyncIterator[bytes]:
+    """
+    Iterates over a (potentially blocking) sync iterable from async code, pulling each item in a thread.
+    """
+    iterator = iter(iterable)
+    sentinel = object()
+    while True:
+        item = await asyncio.to_thread(next, iterator, sentinel)
+        if item is sentinel:
+            break
+        yield item
+
+
+def iter_json_string(
+    chunks: Iterable[Union[bytes, memoryview]], message: str = "Streamed files must contain UTF-8 text."
+) -> Iterator[bytes]:
+    """
+    Encodes a stream of UTF-8 bytes as a JSON string, chunk by chunk.
+
+    :param chunks: The UTF-8 encoded chunks
+    :param message: The start of the `ValueError` message raised if the content is not UTF-8.
+    :return: The JSON-encoded chunks, including the surrounding quotes.
+    :raises ValueError: If the content is not valid UTF-8, with the offset of the first invalid byte.
+    """
+    validator = Utf8Validator(message)
+    yield b'"'
+    for chunk in chunks:
+        text = validator.decode(chunk)
+        if text:
+            yield json.dumps(text, ensure_ascii=False)[1:-1].encode("utf-8")
+    text = validator.decode(b"", final=True)
+    if text:
+        yield json.dumps(text, ensure_ascii=False)[1:-1].encode("utf-8")
+    yield b'"'
+
+
+def iter_buffer(
+    content: Union[bytes, bytearray, memoryview], chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[memoryview]:
+    """Slices in-memory content into chunks without copying it"""
+    view = memoryview(content).cast("B")
+    for start in range(0, len(view), chunk_size):
+        yield view[start : start + chunk_size]
+
+
+class StreamFile(BaseFile):
+    """
+    A file whose content is a stream of byte chunks, rather than being held in memory.
+
+    Backends with `supports_streaming` send these without reading them into memory: raw-body backends stream them as
+    the request body, and JSON backends encode them into a bounded, spooled buffer.
+
+    Files created with `from_file` can be read any number of times. Files created from an iterator or stream
+    (such as stdin) can only be read once.
+    """
+
+    __slots__ = ("_chunks", "_consumed", "filename", "size")
+
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+
+    def __init__(
+        self,
+        chunks: Union[Iterable[bytes], Callable[[], Iterable[bytes]]],
+        filename: Optional[str] = None,
+        size: Optional[int] = None,
+    ):
+        """
+        :param chunks: An iterable of byte chunks, or a function returning a new one each time it is called.
+        :param filename: The name of the file, if any
+        :param size: The total size of the content in bytes, if known
+        """
+        self._chunks = chunks
+        self._consumed = False
+        self.filename = filename
+        self.size = size
+
+    @property
+    def content(self) -> bytes:
+        """
+        The entire content of the file.
+
+        .. warning::
+            This reads the whole stream into memory, defeating the point of streaming.
+        """
+        data = b"".join(self.iter_chunks())
+        if not callable(self._chunks):
+            self._chunks = lambda: (data,)
+        return data
+
+    @property
+    def reusable(self) -> bool:
+        """Whether the content can be read more than once"""
+        return callable(self._chunks)
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        """
+        Iterates over the content of this file.
+
+        :raises RuntimeError: If this is a single-use stream that has already been read.
+        """
+        if callable(self._chunks):
+            yield from self._chunks()
+            return
+        if self._consumed:
+            raise RuntimeError("This stream has already been consumed")
+        self._consumed = True
+        yield from self._chunks
+
+    def aiter_chunks(self) -> AsyncIterator[bytes]:
+        """
+        Async version of `iter_chunks`. Reads are done in a thread, so they do not block the event loop.
+        """
+        return aiter_sync(self.iter_chunks())
+
+    def as_payload(self) -> Dict[str, Any]:
+        """
+        The JSON payload for this file, for backends that take `content` and `filename` keys.
+        The content is only read when the payload is encoded with `spool_json`.
+        """
+        p = {"content": self}
+        if self.filename:
+            p["filename"] = self.filename
+        return p
+
+    @classmethod
+    def from_file(
+        cls, file: Union[str, os.PathLike], mode: Literal["rb"] = "rb", chunk_size: int = None
+    ) -> "StreamFile":
+        """
+        Streams a file from disk. The file is only opened when the content is read.
+
+        :param file: The path to the file
+        :param mode: Ignored, files are always read in binary mode.
+        :param chunk_size: The size of each chunk read. Defaults to `chunk_size`.
+        """
+        if not os.path.exists(file):
+            raise FileNotFoundError(file)
+        chunk_size = chunk_size or cls.chunk_size
+
+        def read_file() -> Iterator[bytes]:
+            with open(file, "rb") as fd:
+                yield from iter_fd(fd, chunk_size)
+
+        return cls(
+            read_file,
+            filename=os.path.basename(file),
+            size=os.path.getsize(file),
+        )
+
+    @classmethod
+    def from_stream(cls, fd: IO[bytes], filename: Optional[str] = None, chunk_size: int = None) -> "StreamFile":
+        """
+        Streams from an already open binary file object, such as `sys.stdin.buffer`. This can only be read once.
+
+        :param fd: The file object to read from
+        :param filename: The name of the file, if any
+        :param chunk_size: The size of each chunk read. Defaults to `chunk_size`.
+        """
+        return cls(iter_fd(fd, chunk_size or cls.chunk_size), filename=filename)
+
+    def digest(self) -> Optional[str]:
+        """
+        A SHA-256 digest of this file's content, computed chunk by chunk.
+
+        :return: The hex digest, or None for single-use streams, which cannot be hashed without consuming them.
+        """
+        if not callable(self._chunks):
+            return None
+        h = hashlib.sha256()
+        for chunk in self.iter_chunks():
+            h.update(chunk)
+        return h.hexdigest()
+
+    def __hash__(self):
+        return id(self)
+
+
+class MappedFile(StreamFile):
+    """
+    A file on disk that is memory-mapped when it is read, rather than read into memory up front.
+
+    Only the path is kept until the file is uploaded, so very large batches of these can be queued with flat memory
+    use. `size` comes from the file system, and `line_count` and `digest` are computed together in one pass over
+    the mapping the first time either is needed. They are recomputed if the file's size or modification time change.
+
+    These can be read any number of times.
+    """
+
+    __slots__ = ("path", "_scanned_for", "_line_count", "_digest")
+
+    def __init__(self, path: Union[str, os.PathLike], filename: Optional[str] = None):
+        """
+        :param path: The path to the file. It is not opened until it is read.
+        :param filename: The name of the file. Defaults to the path's base name.
+        """
+        self.path = os.fspath(path)
+        self.filename = filename if filename is not None else os.path.basename(self.path)
+        self._consumed = False
+        self._scanned_for: Optional[Tuple[int, int]] = None
+        self._line_count = 0
+        self._digest = ""
+
+    @property
+    def size(self) -> int:
+        """The size of the file in bytes, as it is now"""
+        return os.stat(self.path).st_size
+
+    @property
+    def reusable(self) -> bool:
+        return True
+
+    @property
+    def content(self) -> bytes:
+        """
+        The entire content of the file.
+
+        .. warning::
+            This reads the whole file into memory.
+        """
+        with open(self.path, "rb") as fd:
+            return fd.read()
+
+    @contextmanager
+    def mapped(self) -> Iterator[Union[mmap.mmap, bytes]]:
+        """
+        Memory-maps the file for reading, for as long as the context is open.
+
+        Slicing the mapping copies only the slice, and hashing or searching a `memoryview` of it copies nothing.
+        Empty files, which cannot be mapped, give ``b""``.
+        """
+        with open(self.path, "rb") as fd:
+            if os.fstat(fd.fileno()).st_size == 0:
+                yield b""
+                return
+            with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                if hasattr(mapping, "madvise"):  # Python 3.8+, and not on Windows
+                    mapping.madvise(mmap.MADV_SEQUENTIAL)
+                yield mapping
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        """
+        Iterates over the content of this file, in `chunk_size` slices of the mapping.
+        """
+        chunk_size = self.chunk_size
+        with self.mapped() as mapping:
+            for offset in range(0, len(mapping), chunk_size):
+                yield mapping[offset : offset + chunk_size]
+
+    def _scan(self) -> None:
+        """Computes `line_count` and `digest` in one pass, unless the file has not changed since they were."""
+        stat = os.stat(self.path)
+        if self._scanned_for == (stat.st_size, stat.st_mtime_ns):
+            return
+        h = hashlib.sha256()
+        newlines = 0
+        last = b""
+        for chunk in self.iter_chunks():
+            h.update(chunk)
+            newlines += chunk.count(b"\n")
+            last = chunk
+        self._line_count = newlines + (1 if last and not last.endswith(b"\n") else 0)
+        self._digest = h.hexdigest()
+        self._scanned_for = (stat.st_size, stat.st_mtime_ns)
+
+    @property
+    def line_count(self) -> int:
+        """The number of lines in the file. A last line without a trailing newline still counts."""
+        self._scan()
+        return self._line_count
+
+    def digest(self) -> str:
+        """
+        A SHA-256 digest of this file's content, cached until the file changes.
+        """
+        self._scan()
+        return self._digest
+
+    @classmethod
+    def from_file(
+        cls, file: Union[str, os.PathLike], mode: Literal["rb"] = "rb", chunk_size: int = None
+    ) -> "MappedFile":
+        """
+        Memory-maps a file from disk. The file is only opened when the content is read.
+
+        :param file: The path to the file
+        :param mode: Ignored, files are always read in binary mode.
+        :param chunk_size: Ignored, files are read in chunks of the class' `chunk_size`.
+        :raises FileNotFoundError: If the file does not exist
+        """
+        if not os.path.isfile(file):
+            raise FileNotFoundError(file)
+        return cls(file)
+
+    def __reduce__(self):
+        return type(self), (self.path, self.filename)
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, self.path)
+
+
+def spool_json(payload: Any, max_size: int = DEFAULT_SPOOL_SIZE) -> "tempfile.SpooledTemporaryFile":
+    """
+    Encodes a JSON payload into a spooled temporary file, streaming any `StreamFile` values in as strings.
+
+    Binary values (`bytes`, `bytearray` or `memoryview`) are treated as UTF-8 text, and are encoded in chunks straight
+    from the original buffer, rather than being decoded into one large string first.
+
+    Up to `max_size` bytes are kept in memory, anything larger is moved to a temporary file on disk.
+
+    :param payload: The JSON-serialisable payload, which may contain `StreamFile`s and binary values
+    :param max_size: The maximum size to hold in memory
+    :return: The spooled body, positioned at the start.
+    :raises ValueError: If a streamed value is not UTF-8 text
+    """
+    streams = []
+
+    def replace(obj):
+        if isinstance(obj, (StreamFile, bytes, bytearray, memoryview)):
+            streams.append(obj)
+            return _STREAM_MARKER % (len(streams) - 1)
+        if isinstance(obj, dict):
+            return {k: replace(v) for k, v in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return [replace(v) for v in obj]
+        return obj
+
+    encoded = json.dumps(replace(payload)).encode("utf-8")
+    spool = tempfile.SpooledTemporaryFile(max_size=max_size)
+    parts = _STREAM_MARKER_RE.split(encoded)
+    try:
+        for n, part in enumerate(parts):
+            if n % 2 == 0:
+                spool.write(part)
+                continue
+            stream = streams[int(part)]
+            chunks = stream.iter_chunks() if isinstance(stream, StreamFile) else iter_buffer(stream)
+            for chunk in iter_json_string(chunks):
+                spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def contains_stream(payload: Any) -> bool:
+    """Checks whether a JSON payload contains any `StreamFile`s or binary values, which `spool_json` streams in"""
+    if isinstance(payload, (StreamFile, bytes, bytearray, memoryview)):
+        return True
+    if isinstance(payload, dict):
+        return any(contains_stream(v) for v in payload.values())
+    if isinstance(payload, (list, tuple)):
+        return any(contains_stream(v) for v in payload)
+    return False
+
+
+def json_body(payload: Any, max_size: int = DEFAULT_SPOOL_SIZE) -> Dict[str, Any]:
+    """
+    Builds the request keyword arguments for a JSON body.
+
+    Payloads without any `StreamFile`s or binary values are passed straight to httpx. Otherwise, the body is encoded
+    with `spool_json`, and streamed from the spool.
+    """
+    if not contains_stream(payload):
+        return {"json": payload}
+    spool = spool_json(payload, max_size)
+    size = spool.seek(0, os.SEEK_END)
+    spool.seek(0)
+    return {
+        "content": iter_fd(spool, close=True),
+        "headers": {"Content-Type": "application/json", "Content-Length": str(size)},
+    }
+
+
+async def async_json_kwargs(files: Iterable[Any], build: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Calls `build` (which builds request keyword arguments with `json_body`) for an `httpx.AsyncClient`.
+
+    If any of the files are `StreamFile`s or hold binary content, `json_body` reads, validates and spools them, so
+    that is done in a thread rather than blocking the event loop for the length of the file.
+    """
+    if any(isinstance(f, StreamFile) or not isinstance(getattr(f, "content", ""), str) for f in files):
+        kwargs = await asyncio.to_thread(build)
+    else:
+        kwargs = build()
+    return as_async_kwargs(kwargs)
+
+
+def as_async_kwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Converts request keyword arguments with a sync iterator `content` into ones usable with an `httpx.AsyncClient`.
+    """
+    content = kwargs.get("content")
+    if content is not None and not isinstance(content, (str, bytes)) and not hasattr(content, "__aiter__"):
+        kwargs = dict(kwargs, content=aiter_sync(content))
+    return kwargs
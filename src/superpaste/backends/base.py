@@ -5,30 +5,84 @@ actual backends should inherit from in order to have a uniform use pattern
 
 import abc
 import asyncio
+import codecs
+import functools
+import hashlib
 import logging
 import os
-from contextlib import contextmanager
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, contextmanager, nullcontext, suppress
 from dataclasses import dataclass
-from importlib.metadata import version
-from typing import Dict, Generator, Iterable, List, Literal, Optional, TypeVar, Union, overload
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    ContextManager,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+    overload,
+)
 
 import httpx
 
+from ._metrics import MetricsSink, RequestTrace
+from ._retry import AsyncRetryTransport, RateLimiter, RetryPolicy, RetryTransport
+
+if TYPE_CHECKING:
+    from ._cache import FetchCache, ResultCache
+    from ._redact import Redactor
+
 __all__ = (
     "BaseFile",
     "BaseResult",
     "BaseBackend",
     "__author__",
-    "__user_agent__",
+    "__user_agent__",  # noqa: F822 (computed on first access, see `__getattr__`)
     "as_chunks",
+    "run_concurrently",
+    "async_run_concurrently",
+    "iter_concurrently",
+    "async_iter_concurrently",
+    "Utf8Validator",
+    "validate_utf8",
+    "check_utf8",
 )
 
 T = TypeVar("T")
+R = TypeVar("R")
 
-__user_agent__ = "SuperPaste/%s (+https://github.com/nexy7574/superpaste)" % version("superpaste")
 __author__ = "nexy7574 <https://github.com/nexy7574>"
 
 
+@functools.lru_cache(maxsize=None)
+def _user_agent() -> str:
+    """The User-Agent header. Reading the installed version is slow, so it is only done when first needed."""
+    from importlib.metadata import version
+
+    return "SuperPaste/%s (+https://github.com/nexy7574/superpaste)" % version("superpaste")
+
+
+def __getattr__(name: str) -> Any:
+    if name == "__user_agent__":
+        return _user_agent()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
 def as_chunks(iterable: Iterable[T], size: int) -> Generator[List[T], None, None]:
     """
     Splits the given iterable into chunks of N size.
@@ -54,7 +108,286 @@ def as_chunks(iterable: Iterable[T], size: int) -> Generator[List[T], None, None
         yield ret_chunk
 
 
+class Utf8Validator:
+    """
+    Checks that a stream of bytes is valid UTF-8, chunk by chunk, without keeping any decoded text.
+
+    ASCII chunks (which most logs are) are checked without being decoded at all. Anything else is decoded in windows
+    of at most `window` bytes which are thrown away straight after, so memory use does not grow with the content.
+
+    Example:
+    >>> validator = Utf8Validator()
+    >>> validator.feed(b"caf\\xc3")  # sequences may be split across chunks
+    >>> validator.feed(b"\\xa9 \\xff")
+    Traceback (most recent call last):
+    ValueError: Only text files are supported. Invalid UTF-8 at byte 6.
+    """
+
+    __slots__ = ("_decoder", "message", "offset")
+
+    window: int = 64 * 1024
+    """The most bytes decoded at once"""
+
+    def __init__(self, message: str = "Only text files are supported."):
+        """
+        :param message: The start of the `ValueError` message raised for invalid content
+        """
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.message = message
+        self.offset = 0
+        """How many bytes have been checked so far"""
+
+    def decode(self, chunk: Union[bytes, bytearray, memoryview], final: bool = False) -> str:
+        """
+        Decodes the next chunk, for callers that need the text anyway.
+
+        :param chunk: The next chunk of content
+        :param final: Whether this is the last chunk. If so, a sequence left incomplete is an error.
+        :return: The text decoded so far. Incomplete sequences at the end are held back for the next chunk.
+        :raises ValueError: If the content is not valid UTF-8, with the offset of the first invalid byte.
+        """
+        pending = len(self._decoder.getstate()[0])
+        try:
+            text = self._decoder.decode(chunk, final)
+        except UnicodeDecodeError as e:
+            raise ValueError("%s Invalid UTF-8 at byte %d." % (self.message, self.offset - pending + e.start)) from e
+        self.offset += len(chunk)
+        return text
+
+    def feed(self, chunk: Union[bytes, bytearray, memoryview]) -> None:
+        """
+        Checks the next chunk.
+
+        :raises ValueError: If the content is not valid UTF-8, with the offset of the first invalid byte.
+        """
+        if isinstance(chunk, (bytes, bytearray)) and chunk.isascii() and not self._decoder.getstate()[0]:
+            self.offset += len(chunk)
+            return
+        view = memoryview(chunk).cast("B")
+        for start in range(0, len(view), self.window):
+            self.decode(view[start : start + self.window])
+
+    def finish(self) -> None:
+        """
+        Checks that the content did not end part way through a sequence.
+
+        :raises ValueError: If it did
+        """
+        self.decode(b"", final=True)
+
+
+def validate_utf8(
+    chunks: Iterable[Union[bytes, memoryview]], message: str = "Only text files are supported."
+) -> Iterator[Union[bytes, memoryview]]:
+    """
+    Passes chunks through unchanged, checking that together they are valid UTF-8 with a `Utf8Validator`.
+
+    :param chunks: The chunks to check
+    :param message: The start of the `ValueError` message raised if the content is not UTF-8.
+    """
+    validator = Utf8Validator(message)
+    for chunk in chunks:
+        validator.feed(chunk)
+        yield chunk
+    validator.finish()
+
+
+def check_utf8(content: Union[str, bytes, bytearray, memoryview], message: str = "Only text files are supported."):
+    """
+    Checks that in-memory content is text, without copying it.
+
+    Strings are returned as they are. Binary content is checked with a `Utf8Validator`, and then returned as it is,
+    so that it can be sent without being decoded and encoded again.
+
+    :param content: The content to check
+    :param message: The start of the `ValueError` message raised if the content is not UTF-8.
+    :return: `content`, unchanged
+    """
+    if not isinstance(content, str):
+        validator = Utf8Validator(message)
+        validator.feed(content)
+        validator.finish()
+    return content
+
+
+def run_concurrently(
+    func: Callable[[T], R], items: Iterable[T], max_concurrency: int = 1, return_exceptions: bool = False
+) -> List[Union[R, BaseException]]:
+    """
+    Calls `func` once for each item, running up to `max_concurrency` calls at once in a thread pool.
+
+    Example:
+    >>> run_concurrently(lambda x: x * 2, range(5), max_concurrency=3)
+    [0, 2, 4, 6, 8]
+
+    :param func: The function to call with each item
+    :param items: The items to process
+    :param max_concurrency: The maximum number of calls to run at once. 1 runs them one after another.
+    :param return_exceptions: If True, exceptions are returned in place of their result instead of being raised.
+        Otherwise, the first exception is raised, and calls that have not yet started are cancelled.
+    :return: The results, in the same order as `items`.
+    """
+    if max_concurrency <= 0:
+        raise ValueError("max_concurrency must be greater than 0")
+    items = list(items)
+
+    if max_concurrency == 1 or len(items) <= 1:
+        results = []
+        for item in items:
+            try:
+                results.append(func(item))
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
+
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(items))) as pool:
+        futures = [pool.submit(func, item) for item in items]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                if not return_exceptions:
+                    for pending in futures:
+                        pending.cancel()
+                    raise
+                results.append(e)
+        return results
+
+
+async def async_run_concurrently(
+    func: Callable[[T], Awaitable[R]], items: Iterable[T], max_concurrency: int = 1, return_exceptions: bool = False
+) -> List[Union[R, BaseException]]:
+    """
+    Async version of `run_concurrently`, running each call as a task, bounded by a semaphore.
+
+    :param func: The coroutine function to call with each item
+    :param items: The items to process
+    :param max_concurrency: The maximum number of calls to run at once. 1 runs them one after another.
+    :param return_exceptions: If True, exceptions are returned in place of their result instead of being raised.
+        Otherwise, the first exception is raised, and the remaining tasks are cancelled.
+    :return: The results, in the same order as `items`.
+    """
+    if max_concurrency <= 0:
+        raise ValueError("max_concurrency must be greater than 0")
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(item: T) -> R:
+        async with semaphore:
+            return await func(item)
+
+    tasks = [asyncio.ensure_future(run(item)) for item in items]
+    try:
+        return list(await asyncio.gather(*tasks, return_exceptions=return_exceptions))
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+def iter_concurrently(
+    func: Callable[[T], R], items: Iterable[T], max_concurrency: int = 1, return_exceptions: bool = False
+) -> Iterator[Tuple[T, Union[R, BaseException]]]:
+    """
+    Like `run_concurrently`, but yields each item and its result as soon as it is done, rather than all at the end.
+
+    `items` is consumed lazily, and only `max_concurrency` calls are ever submitted at once, so this works with
+    very long (or endless) iterables. If the iterator is closed early, calls that have not started are cancelled.
+
+    :param func: The function to call with each item
+    :param items: The items to process
+    :param max_concurrency: The maximum number of calls to run at once
+    :param return_exceptions: If True, exceptions are yielded in place of their result instead of being raised.
+    :return: An iterator of `(item, result)` pairs, in the order they finished.
+    """
+    if max_concurrency <= 0:
+        raise ValueError("max_concurrency must be greater than 0")
+
+    def finished(done) -> Iterator[Tuple[T, Union[R, BaseException]]]:
+        for future in done:
+            item = pending.pop(future)
+            error = future.exception()
+            if error is not None and not return_exceptions:
+                raise error
+            yield item, future.result() if error is None else error
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        try:
+            for item in items:
+                pending[pool.submit(func, item)] = item
+                if len(pending) >= max_concurrency:
+                    yield from finished(wait(pending, return_when=FIRST_COMPLETED).done)
+            while pending:
+                yield from finished(wait(pending, return_when=FIRST_COMPLETED).done)
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+async def async_iter_concurrently(
+    func: Callable[[T], Awaitable[R]], items: Iterable[T], max_concurrency: int = 1, return_exceptions: bool = False
+) -> AsyncIterator[Tuple[T, Union[R, BaseException]]]:
+    """
+    Async version of `iter_concurrently`, running each call as a task.
+
+    :param func: The coroutine function to call with each item
+    :param items: The items to process
+    :param max_concurrency: The maximum number of calls to run at once
+    :param return_exceptions: If True, exceptions are yielded in place of their result instead of being raised.
+    :return: An async iterator of `(item, result)` pairs, in the order they finished.
+    """
+    if max_concurrency <= 0:
+        raise ValueError("max_concurrency must be greater than 0")
+    pending = {}
+    items = iter(items)
+    try:
+        while True:
+            for item in items:
+                pending[asyncio.ensure_future(func(item))] = item
+                if len(pending) >= max_concurrency:
+                    break
+            if not pending:
+                return
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                item = pending.pop(task)
+                error = task.exception()
+                if error is not None and not return_exceptions:
+                    raise error
+                yield item, task.result() if error is None else error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+@contextmanager
+def _atomic_write(path: Union[str, os.PathLike]) -> Generator[IO[bytes], None, None]:
+    """Opens `path` for writing, only moving the file into place once it has been written successfully."""
+    partial = "%s.part" % os.fspath(path)
+    try:
+        with open(partial, "wb") as fd:
+            yield fd
+        os.replace(partial, path)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.remove(partial)
+        raise
+
+
+def _download_name(key: str) -> str:
+    """The file name a paste is downloaded to. Keys that are URLs are named after their last path segment."""
+    name = key.rstrip("/").rsplit("/", 1)[-1]
+    if name in ("", ".", "..") or os.sep in name or (os.altsep and os.altsep in name):
+        raise ValueError("Cannot name a file after the paste key %r" % key)
+    return name
+
+
 class BaseFile(abc.ABC, metaclass=abc.ABCMeta):
+    __slots__ = ()
+
     @property
     @abc.abstractmethod
     def content(self) -> Union[str, bytes]: ...
@@ -67,6 +400,17 @@ class BaseFile(abc.ABC, metaclass=abc.ABCMeta):
         """
         raise NotImplementedError
 
+    def digest(self) -> Optional[str]:
+        """
+        A strong (SHA-256) digest of this file's content, used to deduplicate uploads.
+
+        :return: The hex digest, or None if the content cannot be read without consuming it.
+        """
+        content = self.content
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        return hashlib.sha256(content).hexdigest()
+
     def __hash__(self):
         return hash(self.content)
 
@@ -82,6 +426,98 @@ class BaseBackend(abc.ABC):
     base_url = "http://base.invalid"
     result_class = BaseResult
     file_class = BaseFile
+    supports_streaming: bool = False
+    """Whether this backend accepts `StreamFile`s, sending them without reading them into memory first."""
+    max_files_per_paste: Optional[int] = None
+    """The most files a single paste can hold, if known"""
+    max_file_size: Optional[int] = None
+    """The largest file a paste can hold in bytes, if known"""
+    max_paste_size: Optional[int] = None
+    """The largest total size of a single paste in bytes, if known"""
+
+    http2: bool = False
+    """Whether the pooled clients should negotiate HTTP/2. Requires the `http2` extra (`h2`) to be installed."""
+    limits: httpx.Limits = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=30.0)
+    """The connection pool limits for the pooled clients"""
+    timeout: httpx.Timeout = httpx.Timeout(30.0, connect=10.0)
+    """The default timeout for the pooled clients"""
+    retry: Optional[RetryPolicy] = RetryPolicy()
+    """When the pooled clients retry failed requests. None disables retrying."""
+    rate_limiter: Optional[RateLimiter] = None
+    """If set, the pooled clients pace their requests to each host with this rate limiter."""
+    metrics: Optional[MetricsSink] = None
+    """If set, the timings, sizes and outcomes of every request are recorded here."""
+
+    _client: Optional[httpx.Client] = None
+
+    result_cache: Optional["ResultCache"] = None
+    """If set, pastes are looked up here before being uploaded, so identical content is only uploaded once."""
+
+    fetch_cache: Optional["FetchCache"] = None
+    """If set, fetched pastes are served from here where possible, rather than being downloaded again."""
+    immutable_pastes: bool = False
+    """Whether pastes on this backend can never change once created. If so, `fetch_cache` never revalidates them."""
+
+    redactor: Optional["Redactor"] = None
+    """If set, every file is run through this `Redactor` before it is uploaded, scrubbing secrets out of it."""
+
+    def __init__(
+        self,
+        *,
+        http2: Optional[bool] = None,
+        limits: Optional[httpx.Limits] = None,
+        timeout: httpx.Timeout = None,
+        result_cache: Optional["ResultCache"] = None,
+        fetch_cache: Optional["FetchCache"] = None,
+        retry: Union[RetryPolicy, Literal[False], None] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        metrics: Optional[MetricsSink] = None,
+        redactor: Optional["Redactor"] = None,
+    ):
+        """
+        :param http2: Whether to negotiate HTTP/2. Defaults to the class' `http2` attribute.
+        :param limits: Connection pool limits. Defaults to the class' `limits` attribute.
+        :param timeout: Request timeouts. Defaults to the class' `timeout` attribute.
+        :param result_cache: A `ResultCache` to deduplicate uploads with. Disabled by default.
+        :param fetch_cache: A `FetchCache` to serve fetched pastes from. Disabled by default.
+        :param retry: When to retry failed requests, or False to never retry. Defaults to the class' `retry` attribute.
+        :param rate_limiter: A `RateLimiter` to pace requests to each host with. Disabled by default.
+        :param metrics: A `MetricsSink` to record request metrics into. Disabled by default.
+        :param redactor: A `Redactor` to scrub secrets out of files with before uploading them. Disabled by default.
+        """
+        # Guards creating and closing this backend's pooled clients.
+        self._client_lock = threading.RLock()
+        self._async_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+        if result_cache is not None:
+            self.result_cache = result_cache
+        if fetch_cache is not None:
+            self.fetch_cache = fetch_cache
+        if http2 is not None:
+            self.http2 = http2
+        if limits is not None:
+            self.limits = limits
+        if timeout is not None:
+            self.timeout = timeout
+        if retry is not None:
+            self.retry = retry or None
+        if rate_limiter is not None:
+            self.rate_limiter = rate_limiter
+        if metrics is not None:
+            self.metrics = metrics
+        if redactor is not None:
+            self.redactor = redactor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
 
     @property
     def _logger(self) -> logging.Logger:
@@ -92,18 +528,248 @@ class BaseBackend(abc.ABC):
         """
         Gets headers for the request.
         """
-        return {"User-Agent": __user_agent__, "Accept": "application/json"}
+        return {"User-Agent": _user_agent(), "Accept": "application/json"}
+
+    def _client_kwargs(self, asynchronous: bool = False) -> Dict[str, Any]:
+        """The keyword arguments used to construct the pooled clients"""
+        if asynchronous:
+            transport = AsyncRetryTransport(
+                httpx.AsyncHTTPTransport(http2=self.http2, limits=self.limits), self.retry, self.rate_limiter
+            )
+            hooks = {"request": [self._async_on_request], "response": [self._async_on_response]}
+        else:
+            transport = RetryTransport(
+                httpx.HTTPTransport(http2=self.http2, limits=self.limits), self.retry, self.rate_limiter
+            )
+            hooks = {"request": [self._on_request], "response": [self._on_response]}
+        return {"headers": self.get_headers(), "timeout": self.timeout, "transport": transport, "event_hooks": hooks}
+
+    def _on_request(self, request: httpx.Request) -> None:
+        """Event hook that starts recording a request's metrics, if there is a `metrics` sink"""
+        if self.metrics is not None:
+            RequestTrace.attach(self.metrics, self.name, request, asynchronous=False)
+
+    def _on_response(self, response: httpx.Response) -> None:
+        """Event hook that hands the final response to the request's metrics, which are recorded once it is closed"""
+        trace = response.request.extensions.get("superpaste_metrics")
+        if trace is not None:
+            trace.response = response
+
+    async def _async_on_request(self, request: httpx.Request) -> None:
+        if self.metrics is not None:
+            RequestTrace.attach(self.metrics, self.name, request, asynchronous=True)
+
+    async def _async_on_response(self, response: httpx.Response) -> None:
+        self._on_response(response)
+
+    def _timed(self, phase: str) -> ContextManager[None]:
+        """
+        Times the enclosed block as `phase` (e.g. `prepare` or `parse`) in `metrics`. Does nothing without a sink.
+        """
+        if self.metrics is None:
+            return nullcontext()
+        return self._record_phase(phase)
 
     @contextmanager
-    def with_session(self, session: Optional[httpx.Client] = None) -> "httpx.Client":
+    def _record_phase(self, phase: str) -> Generator[None, None, None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.metrics.record_phase(self.name, phase, time.perf_counter() - start)
+
+    @property
+    def client(self) -> httpx.Client:
         """
-        Return a client session, closing it properly if it was created by this method.
+        The pooled, keep-alive client owned by this backend.
+
+        It is created on first use, and is safe to share between threads. Call `close` (or use the backend as a
+        context manager) to release its connections.
         """
-        if not session:
-            with httpx.Client(headers=self.get_headers()) as session:
-                yield session
-        else:
-            yield session
+        if self._client is None or self._client.is_closed:
+            with self._client_lock:
+                if self._client is None or self._client.is_closed:
+                    self._logger.debug("Opening pooled HTTP client (http2=%s)", self.http2)
+                    self._client = httpx.Client(**self._client_kwargs())
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """
+        The pooled, keep-alive async client owned by this backend, for the running event loop.
+
+        Async clients cannot be shared between event loops, so each loop gets its own. `aclose` closes them all.
+        """
+        loop = asyncio.get_running_loop()
+        with self._client_lock:
+            client = self._async_clients.get(loop)
+            if client is None or client.is_closed:
+                # A client whose loop has closed (e.g. after `asyncio.run`) can no longer be closed, as that needs its
+                # loop. Dropping it lets its connections be collected, rather than piling up with each new loop.
+                for stale in [other for other in self._async_clients if other.is_closed()]:
+                    self._logger.debug("Dropping pooled async HTTP client of a closed event loop")
+                    del self._async_clients[stale]
+                self._logger.debug("Opening pooled async HTTP client (http2=%s)", self.http2)
+                client = self._async_clients[loop] = httpx.AsyncClient(**self._client_kwargs(asynchronous=True))
+            return client
+
+    def close(self) -> None:
+        """
+        Closes the pooled sync client, if one was opened. The backend can still be used afterwards,
+        a new client will be opened on demand.
+        """
+        with self._client_lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+    async def aclose(self) -> None:
+        """
+        Closes the pooled clients, if they were opened. Async clients of other event loops that are still running
+        are closed on their own loop.
+        """
+        loop = asyncio.get_running_loop()
+        with self._client_lock:
+            clients, self._async_clients = self._async_clients, {}
+        for client_loop, client in clients.items():
+            if client_loop is loop:
+                await client.aclose()
+            elif client_loop.is_running():
+                asyncio.run_coroutine_threadsafe(client.aclose(), client_loop)
+        self.close()
+
+    def warm_up(self) -> None:
+        """
+        Opens a connection to `base_url` ahead of time, so that the first paste does not have to pay for DNS
+        resolution, the TCP and the TLS handshakes.
+
+        The response itself is ignored, only connection errors are raised.
+        """
+        self.client.head(self.base_url)
+
+    async def async_warm_up(self) -> None:
+        """
+        Async version of `warm_up`.
+        """
+        await self.async_client.head(self.base_url)
+
+    def result_cache_key(self, files: Sequence[BaseFile], **options: Any) -> Optional[str]:
+        """
+        Builds the `result_cache` key for a single paste of the given files.
+
+        The key is a digest of this backend's name and base URL, each file's content digest, filename and syntax,
+        and any options that change the resulting paste (such as a password).
+
+        :param files: The files that make up the paste
+        :param options: Any options that change the resulting paste. They must have a stable `repr`.
+        :return: The key, or None if the paste cannot be cached (e.g. it contains single-use streams).
+        """
+        h = hashlib.sha256()
+        h.update(("%s\0%s\0%r\0" % (self.name, self.base_url, sorted(options.items()))).encode("utf-8"))
+        for file in files:
+            digest = file.digest()
+            if digest is None:
+                return None
+            metadata = (getattr(file, "filename", None), getattr(file, "syntax", None))
+            h.update(("%s\0%r\0" % (digest, metadata)).encode("utf-8"))
+        return h.hexdigest()
+
+    def _cached_result(self, files: Sequence[BaseFile], **options: Any) -> Tuple[Optional[str], Optional[BaseResult]]:
+        """
+        Looks the given paste up in `result_cache`.
+
+        :return: The cache key (to pass to `_cache_result` after uploading), and the cached result, if any.
+        """
+        if self.result_cache is None:
+            return None, None
+        key = self.result_cache_key(files, **options)
+        if key is None:
+            return None, None
+        result = self.result_cache.get(key)
+        if result is not None:
+            self._logger.debug("Result cache hit for %s: %r", key, result)
+        if self.metrics is not None:
+            self.metrics.record_cache(self.name, "result", "miss" if result is None else "hit")
+        return key, result
+
+    def _cache_result(self, key: Optional[str], result: BaseResult) -> BaseResult:
+        """Stores a freshly created paste in `result_cache`, if there is a key for it. Returns the result."""
+        if key is not None and self.result_cache is not None:
+            self.result_cache.set(key, result)
+        return result
+
+    def _redact(self, files: Sequence[BaseFile]) -> List[BaseFile]:
+        """
+        Scrubs secrets out of the files that make up a single paste with `redactor`, if there is one.
+        `StreamFile`s are scrubbed as they are uploaded.
+        """
+        if self.redactor is None:
+            return list(files)
+        with self._timed("redact"):
+            return [self.redactor.redact_file(file) for file in files]
+
+    def _fetch_cache_key(self, url: str) -> str:
+        return "%s:%s" % (self.name, url)
+
+    def _record_fetch_cache(self, outcome: str) -> None:
+        if self.metrics is not None:
+            self.metrics.record_cache(self.name, "fetch", outcome)
+
+    def cached_get(self, session: httpx.Client, url: str, **kwargs: Any) -> httpx.Response:
+        """
+        Makes a GET request through `fetch_cache`, if there is one.
+
+        A cached response that is still fresh is returned without a round trip. A stale one is revalidated with a
+        conditional request, and returned if the server replies 304 Not Modified.
+
+        :param session: The session to use
+        :param url: The URL to get
+        :param kwargs: Extra keyword arguments for `session.get`
+        :return: The response. Cached responses have an `X-SuperPaste-Cache: hit` header.
+        """
+        if self.fetch_cache is None:
+            return session.get(url, **kwargs)
+        key = self._fetch_cache_key(url)
+        entry, fresh = self.fetch_cache.lookup(key, self.immutable_pastes)
+        if fresh:
+            self._record_fetch_cache("hit")
+            return entry.to_response(url)
+        headers = {**(entry.validators if entry else {}), **kwargs.pop("headers", {})}
+        response = session.get(url, headers=headers, **kwargs)
+        self._record_fetch_cache("revalidated" if entry is not None and response.status_code == 304 else "miss")
+        return self.fetch_cache.update(key, entry, response)
+
+    async def async_cached_get(self, session: httpx.AsyncClient, url: str, **kwargs: Any) -> httpx.Response:
+        """
+        Async version of `cached_get`.
+        """
+        if self.fetch_cache is None:
+            return await session.get(url, **kwargs)
+        key = self._fetch_cache_key(url)
+        entry, fresh = self.fetch_cache.lookup(key, self.immutable_pastes)
+        if fresh:
+            self._record_fetch_cache("hit")
+            return entry.to_response(url)
+        headers = {**(entry.validators if entry else {}), **kwargs.pop("headers", {})}
+        response = await session.get(url, headers=headers, **kwargs)
+        self._record_fetch_cache("revalidated" if entry is not None and response.status_code == 304 else "miss")
+        return self.fetch_cache.update(key, entry, response)
+
+    @contextmanager
+    def with_session(self, session: Optional[httpx.Client] = None) -> Generator[httpx.Client, None, None]:
+        """
+        Return a client session. If one is not given, the backend's pooled `client` is used.
+        """
+        yield session or self.client
+
+    @asynccontextmanager
+    async def with_async_session(
+        self, session: Optional[httpx.AsyncClient] = None
+    ) -> AsyncGenerator[httpx.AsyncClient, None]:
+        """
+        Return an async client session. If one is not given, the backend's pooled `async_client` is used.
+        """
+        yield session or self.async_client
 
     @overload
     def create_paste(self, files: BaseFile) -> BaseResult: ...
@@ -116,6 +782,9 @@ class BaseBackend(abc.ABC):
         """
         Creates a paste.
 
+        Backends that have to split the files up into multiple pastes should accept `max_concurrency` and
+        `return_exceptions` keyword arguments, and pass them to `run_concurrently`.
+
         :param files: The files to upload. Strings are automatically converted to files
         :return: The paste result. Can be multiple if multiple files were uploaded.
         """
@@ -127,16 +796,19 @@ class BaseBackend(abc.ABC):
     @overload
     async def async_create_paste(self, *files: BaseFile) -> List[BaseResult]: ...
 
-    async def async_create_paste(self, *files: BaseFile) -> Union[BaseResult, List[BaseResult]]:
+    async def async_create_paste(self, *files: BaseFile, **kwargs) -> Union[BaseResult, List[BaseResult]]:
         """
         Creates a paste asynchronously.
 
-        internally, this function just calls `create_paste` in a thread, to make it non-blocking.
+        The built-in backends override this with a native `httpx.AsyncClient` implementation.
+        This default just calls `create_paste` in a thread, to make it non-blocking, so that third-party
+        backends which only implement the sync API still work.
 
         :param files: The files to upload
+        :param kwargs: Any extra keyword arguments that `create_paste` takes
         :return: The paste result. Can be multiple if multiple files were uploaded.
         """
-        return await asyncio.to_thread(self.create_paste, *files)
+        return await asyncio.to_thread(self.create_paste, *files, **kwargs)
 
     @abc.abstractmethod
     def get_paste(self, key: str) -> BaseFile:
@@ -147,3 +819,156 @@ class BaseBackend(abc.ABC):
         :return: The paste file
         """
         raise NotImplementedError
+
+    async def async_get_paste(self, key: str, **kwargs) -> Union[BaseFile, List[BaseFile]]:
+        """
+        Gets a paste asynchronously.
+
+        Like `async_create_paste`, this default calls `get_paste` in a thread, and is overridden by backends
+        with a native async implementation.
+
+        :param key: The paste key
+        :param kwargs: Any extra keyword arguments that `get_paste` takes
+        :return: The paste file(s)
+        """
+        return await asyncio.to_thread(self.get_paste, key, **kwargs)
+
+    def get_pastes(
+        self, keys: Iterable[str], max_concurrency: int = 4, return_exceptions: bool = False, **kwargs: Any
+    ) -> Iterator[Tuple[str, Union[BaseFile, List[BaseFile], BaseException]]]:
+        """
+        Gets many pastes at once, yielding each one as soon as it has been fetched.
+
+        Keys are read lazily, and only `max_concurrency` pastes are fetched (and held) at once.
+
+        :param keys: The paste keys
+        :param max_concurrency: How many pastes to fetch at once
+        :param return_exceptions: If True, a paste that cannot be fetched has its exception yielded in place of its
+            files, instead of stopping the rest.
+        :param kwargs: Any extra keyword arguments that `get_paste` takes
+        :return: An iterator of `(key, files)` pairs, in the order they were fetched.
+        """
+        func = functools.partial(self.get_paste, **kwargs) if kwargs else self.get_paste
+        return iter_concurrently(func, keys, max_concurrency, return_exceptions)
+
+    def async_get_pastes(
+        self, keys: Iterable[str], max_concurrency: int = 4, return_exceptions: bool = False, **kwargs: Any
+    ) -> AsyncIterator[Tuple[str, Union[BaseFile, List[BaseFile], BaseException]]]:
+        """
+        Async version of `get_pastes`. Use it with `async for`.
+        """
+        func = functools.partial(self.async_get_paste, **kwargs) if kwargs else self.async_get_paste
+        return async_iter_concurrently(func, keys, max_concurrency, return_exceptions)
+
+    def raw_url(self, key: str) -> Optional[str]:
+        """
+        The URL serving the raw content of a paste, which `download_paste` streams to disk.
+
+        :param key: The paste's key
+        :return: The URL, or None if the backend has none. Such pastes are downloaded with `get_paste` instead.
+        """
+        return None
+
+    def _write_files(self, path: Union[str, os.PathLike], files: Union[BaseFile, List[BaseFile]]) -> int:
+        """
+        Writes fetched files to disk. A single file is written to `path`, several are written into a directory there.
+
+        :return: The number of bytes written
+        """
+        if not isinstance(files, list):
+            files = [files]
+        targets = [path]
+        if len(files) > 1:
+            os.makedirs(path, exist_ok=True)
+            names = [os.path.basename(getattr(file, "filename", None) or "") for file in files]
+            targets = [os.path.join(path, "%d-%s" % (n, name) if name else str(n)) for n, name in enumerate(names, 1)]
+        written = 0
+        for file, target in zip(files, targets):
+            content = file.content
+            with _atomic_write(target) as fd:
+                written += fd.write(content.encode("utf-8") if isinstance(content, str) else content)
+        return written
+
+    def download_paste(self, key: str, path: Union[str, os.PathLike]) -> int:
+        """
+        Downloads a paste to disk.
+
+        Where the backend has a `raw_url`, the body is streamed straight to the file, so memory use stays flat
+        however large the paste is. These downloads bypass `fetch_cache`. Other backends fetch the paste with
+        `get_paste`, and if it holds several files, `path` becomes a directory with one file for each.
+
+        Files only appear at their path once they have been completely written.
+
+        :param key: The paste's key
+        :param path: Where to write the paste
+        :return: The number of bytes written
+        """
+        url = self.raw_url(key)
+        if url is None:
+            return self._write_files(path, self.get_paste(key))
+        with self.with_session() as session, session.stream("GET", url) as response:
+            response.raise_for_status()
+            written = 0
+            with _atomic_write(path) as fd:
+                for chunk in response.iter_bytes():
+                    written += fd.write(chunk)
+            return written
+
+    async def async_download_paste(self, key: str, path: Union[str, os.PathLike]) -> int:
+        """
+        Async version of `download_paste`. Each chunk is written to disk as it arrives, from the event loop.
+        """
+        url = self.raw_url(key)
+        if url is None:
+            return self._write_files(path, await self.async_get_paste(key))
+        async with self.with_async_session() as session, session.stream("GET", url) as response:
+            response.raise_for_status()
+            written = 0
+            with _atomic_write(path) as fd:
+                async for chunk in response.aiter_bytes():
+                    written += fd.write(chunk)
+            return written
+
+    def download_pastes(
+        self,
+        keys: Iterable[str],
+        directory: Union[str, os.PathLike],
+        max_concurrency: int = 4,
+        return_exceptions: bool = False,
+    ) -> Iterator[Tuple[str, Union[int, BaseException]]]:
+        """
+        Downloads many pastes into a directory with `download_paste`, yielding each as soon as it is done.
+
+        Each paste is named after its key (or, for keys that are URLs, their last path segment).
+
+        :param keys: The paste keys
+        :param directory: The directory to download into. It is created if it does not exist.
+        :param max_concurrency: How many pastes to download at once
+        :param return_exceptions: If True, a paste that cannot be downloaded has its exception yielded in place of
+            its size, instead of stopping the rest.
+        :return: An iterator of `(key, bytes written)` pairs, in the order they finished.
+        """
+        os.makedirs(directory, exist_ok=True)
+        return iter_concurrently(
+            lambda key: self.download_paste(key, os.path.join(directory, _download_name(key))),
+            keys,
+            max_concurrency,
+            return_exceptions,
+        )
+
+    def async_download_pastes(
+        self,
+        keys: Iterable[str],
+        directory: Union[str, os.PathLike],
+        max_concurrency: int = 4,
+        return_exceptions: bool = False,
+    ) -> AsyncIterator[Tuple[str, Union[int, BaseException]]]:
+        """
+        Async version of `download_pastes`. Use it with `async for`.
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        async def download(key: str) -> int:
+            return await self.async_download_paste(key, os.path.join(directory, _download_name(key)))
+
+        return async_iter_concurrently(download, keys, max_concurrency, return_exceptions)
@@ -5,11 +5,11 @@ Backend for posting pastes to http://hastebin.com
 # NOTE: Hastebin.com has moved to toptal.com/developers/hastebin.
 # As of 2024-06-24, hastebin.com still works.
 
-from typing import List, Union, overload
-
-import httpx
+from typing import Any, Dict, List, Union, overload
 
 from ._generic import GenericBackend, GenericFile, GenericResult
+from ._streaming import StreamFile
+from .base import check_utf8, validate_utf8
 
 __author__ = "nexy7574 <https://github.com/nexy7574>"
 __all__ = ("HastebinBackend", "HastebinFile", "HastebinResult")
@@ -22,11 +22,12 @@ class HastebinBackend(GenericBackend):
     name = "toptal"
     base_url = "https://hastebin.com"
 
-    def __init__(self, token: str):
+    def __init__(self, token: str, **kwargs):
         """
         :param token: The API token from toptal: https://www.toptal.com/developers/hastebin/documentation
+        :param kwargs: Extra connection options, passed to `BaseBackend.__init__`.
         """
-        super().__init__()
+        super().__init__(**kwargs)
         self.token = token
 
     def get_headers(self):
@@ -36,13 +37,23 @@ class HastebinBackend(GenericBackend):
             h["Authorization"] = f"Bearer {self.token}"
         return h
 
+    def _post_kwargs(self, file: Union[GenericFile, StreamFile]) -> Dict[str, Any]:
+        if isinstance(file, StreamFile):
+            kwargs = super()._post_kwargs(file)
+            kwargs["content"] = validate_utf8(kwargs["content"], "hastebin.com only supports text files.")
+            return kwargs
+        # Binary content is sent as it is once it has been checked, rather than being decoded and encoded again.
+        return {"content": check_utf8(file.content, "hastebin.com only supports text files.")}
+
     @overload
     def create_paste(self, files: GenericFile) -> GenericResult: ...
 
     @overload
     def create_paste(self, *files: GenericFile) -> List[GenericResult]: ...
 
-    def create_paste(self, *files: GenericFile) -> Union[GenericResult, List[GenericResult]]:
+    def create_paste(
+        self, *files: GenericFile, max_concurrency: int = 1, return_exceptions: bool = False
+    ) -> Union[GenericResult, List[GenericResult]]:
         """
         Create a paste on hastebin.com
 
@@ -51,29 +62,11 @@ class HastebinBackend(GenericBackend):
             multiple pastes will be made.
 
         :param files: The files to post.
+        :param max_concurrency: How many pastes to make at once, if multiple files were given.
+        :param return_exceptions: If True, return a failed file's exception in place of its result instead of raising.
         :return: The paste, or multiple if multiple files were provided.
         """
-        if len(files) > 1:
-            r = []
-            for file in files:
-                r.append(self.create_paste(file))
-            return r
-
-        with self.with_session() as session:
-            for file in files:
-                if isinstance(file.content, bytes):
-                    try:
-                        file.content = file.content.decode("utf-8")
-                    except UnicodeDecodeError:
-                        raise ValueError("hastebin.com only supports text files.")
-
-            response: httpx.Response = session.post(
-                self.post_url,
-                data=file.content,
-            )
-            response.raise_for_status()
-            key = response.json()["key"]
-            return GenericResult(key, self.html_url.format(key=key))
+        return super().create_paste(*files, max_concurrency=max_concurrency, return_exceptions=return_exceptions)
 
     def get_paste(self, key: str) -> GenericFile:
         """
@@ -82,7 +75,4 @@ class HastebinBackend(GenericBackend):
         :param key: The paste key to get.
         :return: The file that was in the paste.
         """
-        with self.with_session() as session:
-            response: httpx.Response = session.get(self.base_url + "/raw/" + key)
-            response.raise_for_status()
-            return GenericFile(response.text)
+        return super().get_paste(key)
@@ -6,12 +6,14 @@ import datetime
 import os
 import pathlib
 from dataclasses import dataclass
-from typing import Dict, List, Literal, Optional, Union, overload
+from typing import Any, Dict, List, Literal, Optional, Union, overload
 
 import httpx
 
 from ._generic import GenericFile
-from .base import BaseBackend, BaseResult, as_chunks
+from ._planner import plan_pastes
+from ._streaming import StreamFile, async_json_kwargs, json_body
+from .base import BaseBackend, BaseResult, async_run_concurrently, run_concurrently
 
 __author__ = "nexy7574 <https://github.com/nexy7574>"
 
@@ -23,6 +25,11 @@ __all__ = (
 
 
 class MystbinFile(GenericFile):
+    __slots__ = ("filename", "parent_id", "loc", "charcount", "annotation", "warning_positions")
+
+    max_length: Optional[int] = 300_000
+    """The most characters a file can hold"""
+
     def __init__(
         self,
         content: str,
@@ -34,8 +41,10 @@ class MystbinFile(GenericFile):
         annotation: str = None,
         warning_positions: list = None,
     ):
-        if len(content) > 300_000:
-            raise ValueError("Mystbin only supports pastes up to 300,000 characters.")
+        if self.max_length is not None and len(content) > self.max_length:
+            raise ValueError(
+                "Mystbin only supports pastes up to 300,000 characters. Use `create_split_paste` for larger content."
+            )
         super().__init__(content)
         self.filename = filename
         self.parent_id = parent_id
@@ -75,6 +84,61 @@ class MystbinBackend(BaseBackend):
     html_url = "https://mystb.in/{key}"
     result_class = MystbinResult
     file_class = MystbinFile
+    supports_streaming = True
+    max_files_per_paste = 5
+    # Mystbin limits files by characters. Every character is at least one byte, so this is a safe limit.
+    max_file_size = 300_000
+
+    def _coerce_files(self, files) -> List[Union[MystbinFile, StreamFile]]:
+        """Converts any non-native files into `MystbinFile`s. `StreamFile`s are left as they are."""
+        converted = []
+        for file in files:
+            if not isinstance(file, (MystbinFile, StreamFile)):
+                if not isinstance(file, GenericFile):
+                    raise TypeError("Unsupported file type %r" % file)
+                self._logger.warning("Got non-native file %r - expected MystbinFile", file)
+                file = MystbinFile(file.content)
+            converted.append(file)
+        return converted
+
+    def _post_kwargs(
+        self, files: List[Union[MystbinFile, StreamFile]], expires: datetime.datetime = None, password: str = None
+    ) -> Dict[str, Any]:
+        """
+        Builds the keyword arguments passed to `session.post` when creating a single paste.
+        If any of the files are `StreamFile`s, the body is spooled rather than built in memory.
+        """
+        payload = {
+            "files": [f.as_payload() for f in files],
+        }
+        if expires:
+            payload["expires"] = expires.isoformat()
+        if password:
+            payload["password"] = password
+        return json_body(payload)
+
+    def _parse_post(self, response: httpx.Response) -> MystbinResult:
+        """Converts the response from `post_url` into a result"""
+        response.raise_for_status()
+        data = response.json()
+        return MystbinResult(
+            data["id"],
+            self.html_url.format(key=data["id"]),
+            datetime.datetime.fromisoformat(data["created_at"]),
+            datetime.datetime.fromisoformat(data["expires"]) if data["expires"] else None,
+            data["safety"],
+            data["views"],
+        )
+
+    @staticmethod
+    def _parse_get(response: httpx.Response) -> List[MystbinFile]:
+        """Converts a fetched paste into its files"""
+        response.raise_for_status()
+        data = response.json()
+        files = []
+        for file in data["files"]:
+            files.append(MystbinFile(**file))
+        return files
 
     @overload
     def create_paste(self, files: MystbinFile) -> MystbinResult: ...
@@ -83,7 +147,12 @@ class MystbinBackend(BaseBackend):
     def create_paste(self, *files: MystbinFile) -> List[MystbinResult]: ...
 
     def create_paste(
-        self, *files: MystbinFile, expires: datetime.datetime = None, password: str = None
+        self,
+        *files: MystbinFile,
+        expires: datetime.datetime = None,
+        password: str = None,
+        max_concurrency: int = 1,
+        return_exceptions: bool = False,
     ) -> Union[MystbinResult, List[MystbinResult]]:
         """
         Creates a paste on Mystbin
@@ -94,54 +163,103 @@ class MystbinBackend(BaseBackend):
         .. warning::
             Mystbin does not utilise end-to-end encryption. Passwords are only used to access the paste.
 
+        .. note::
+            With a `result_cache`, a cached paste is only reused if it was also created with the same password,
+            and with an expiry if (and only if) `expires` is given. It is evicted when it expires.
+
         :param files: The files to paste
         :param expires: A datetime (in the future) when the pastes should automatically be deleted. Default: never
         :param password: A password to use to protect the paste. Default: None
-        :return: The paste result (a list of them if >5 files)
+        :param max_concurrency: How many pastes to make at once, if more than 5 files were given.
+        :param return_exceptions: If True, return a failed paste's exception in place of its result instead of raising.
+        :return: The paste result (a list of them if >5 files). The files are split over the pastes in order, as
+            planned by `plan_pastes(backend, files, keep_order=True)`.
         """
         if expires and expires < datetime.datetime.now(datetime.timezone.utc):
             raise ValueError("expires must be in the future")
-        if len(files) > 5:
+        plan = plan_pastes(self, files, keep_order=True) if len(files) > 5 else [files]
+        if len(plan) > 1:
             self._logger.warning(
                 "Posting %d files to Mystbin; Mystbin only supports 5 files per-paste, so this will have to be split"
-                " up into multiple pastes."
+                " up into %d pastes.",
+                len(files),
+                len(plan),
             )
-            results = []
-            for chunk in as_chunks(files, 5):
+
+            def post_chunk(group: List[int]) -> MystbinResult:
+                chunk = [files[i] for i in group]
                 self._logger.debug("Posting files to mystbin: %r", chunk)
-                results.append(self.create_paste(*chunk))
-            return results
+                return self.create_paste(*chunk, expires=expires, password=password)
+
+            return run_concurrently(post_chunk, plan, max_concurrency, return_exceptions)
 
-        files = list(files)
+        files = self._redact(self._coerce_files(files))
+        cache_key, cached = self._cached_result(files, password=password, expiring=expires is not None)
+        if cached is not None:
+            return cached
         with self.with_session() as session:
-            for file in files.copy():
-                if not isinstance(file, MystbinFile):
-                    if not isinstance(file, GenericFile):
-                        raise TypeError("Unsupported file type %r" % file)
-                    self._logger.warning("Got non-native file %r - expected MystbinFile", file)
-                    files.remove(file)
-                    file = MystbinFile(file.content)
-                    files.append(file)
-
-            payload = {
-                "files": [f.as_payload() for f in files],
-            }
-            if expires:
-                payload["expires"] = expires.isoformat()
-            if password:
-                payload["password"] = password
-            response: httpx.Response = session.post(self.post_url, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            return MystbinResult(
-                data["id"],
-                self.html_url.format(data["id"]),
-                datetime.datetime.fromisoformat(data["created_at"]),
-                datetime.datetime.fromisoformat(data["expires"]) if data["expires"] else None,
-                data["safety"],
-                data["views"],
+            with self._timed("prepare"):
+                kwargs = self._post_kwargs(files, expires, password)
+            response: httpx.Response = session.post(self.post_url, **kwargs)
+            with self._timed("parse"):
+                return self._cache_result(cache_key, self._parse_post(response))
+
+    @overload
+    async def async_create_paste(self, files: MystbinFile) -> MystbinResult: ...
+
+    @overload
+    async def async_create_paste(self, *files: MystbinFile) -> List[MystbinResult]: ...
+
+    async def async_create_paste(
+        self,
+        *files: MystbinFile,
+        expires: datetime.datetime = None,
+        password: str = None,
+        max_concurrency: int = 1,
+        return_exceptions: bool = False,
+    ) -> Union[MystbinResult, List[MystbinResult]]:
+        """
+        Creates a paste on Mystbin asynchronously.
+
+        See `create_paste` for details.
+
+        :param files: The files to paste
+        :param expires: A datetime (in the future) when the pastes should automatically be deleted. Default: never
+        :param password: A password to use to protect the paste. Default: None
+        :param max_concurrency: How many pastes to make at once, if more than 5 files were given.
+        :param return_exceptions: If True, return a failed paste's exception in place of its result instead of raising.
+        :return: The paste result (a list of them if >5 files). The files are split over the pastes in order, as
+            planned by `plan_pastes(backend, files, keep_order=True)`.
+        """
+        if expires and expires < datetime.datetime.now(datetime.timezone.utc):
+            raise ValueError("expires must be in the future")
+        plan = plan_pastes(self, files, keep_order=True) if len(files) > 5 else [files]
+        if len(plan) > 1:
+            self._logger.warning(
+                "Posting %d files to Mystbin; Mystbin only supports 5 files per-paste, so this will have to be split"
+                " up into %d pastes.",
+                len(files),
+                len(plan),
             )
 
+            async def post_chunk(group: List[int]) -> MystbinResult:
+                chunk = [files[i] for i in group]
+                self._logger.debug("Posting files to mystbin: %r", chunk)
+                return await self.async_create_paste(*chunk, expires=expires, password=password)
+
+            return await async_run_concurrently(post_chunk, plan, max_concurrency, return_exceptions)
+
+        files = self._redact(self._coerce_files(files))
+        cache_key, cached = self._cached_result(files, password=password, expiring=expires is not None)
+        if cached is not None:
+            return cached
+        async with self.with_async_session() as session:
+            with self._timed("prepare"):
+                kwargs = await async_json_kwargs(files, lambda: self._post_kwargs(files, expires, password))
+            response: httpx.Response = await session.post(self.post_url, **kwargs)
+            with self._timed("parse"):
+                return self._cache_result(cache_key, self._parse_post(response))
+
     def get_paste(self, key: str, password: Optional[str] = None) -> List[MystbinFile]:
         """
         Fetches a paste from Mystbin
@@ -151,11 +269,19 @@ class MystbinBackend(BaseBackend):
         :return: A list of files in the paste
         """
         with self.with_session() as session:
-            response: httpx.Response = session.get(self.post_url + "/" + key)
-            response.raise_for_status()
-
-            data = response.json()
-            files = []
-            for file in data["files"]:
-                files.append(MystbinFile(**file))
-            return files
+            response: httpx.Response = self.cached_get(session, self.post_url + "/" + key)
+            with self._timed("parse"):
+                return self._parse_get(response)
+
+    async def async_get_paste(self, key: str, password: Optional[str] = None) -> List[MystbinFile]:
+        """
+        Fetches a paste from Mystbin asynchronously
+
+        :param key: The key of the paste to fetch
+        :param password: The password to use to access the paste
+        :return: A list of files in the paste
+        """
+        async with self.with_async_session() as session:
+            response: httpx.Response = await self.async_cached_get(session, self.post_url + "/" + key)
+            with self._timed("parse"):
+                return self._parse_get(response)
@@ -2,11 +2,13 @@
 Backend for posting pastes to http://paste.ee
 """
 
-from typing import List, Union
+from typing import Any, Dict, List, Union
 
 import httpx
 
-from .base import BaseBackend, BaseResult, as_chunks
+from ._planner import plan_pastes
+from ._streaming import StreamFile, async_json_kwargs, json_body
+from .base import BaseBackend, BaseResult, async_run_concurrently, check_utf8, run_concurrently
 from .mystb_in import MystbinFile
 
 __author__ = "nexy7574 <https://github.com/nexy7574>"
@@ -16,6 +18,10 @@ PasteEEResult = BaseResult
 
 
 class PasteEEFile(MystbinFile):
+    __slots__ = ("syntax", "id")
+
+    max_length = None  # paste.ee limits the size of the whole paste, see `PasteEEBackend.max_paste_size`
+
     # noinspection PyShadowingBuiltins
     def __init__(self, content: str, filename: str = None, syntax: str = "autodetect", *, id: int = None):
         super().__init__(content)
@@ -36,62 +42,151 @@ class PasteEEFile(MystbinFile):
 class PasteEEBackend(BaseBackend):
     name = "paste.ee"
     base_url = post_url = "https://api.paste.ee/v1/pastes"
-    html_url = "https://hst.sh/{key}"
+    html_url = "https://paste.ee/p/{key}"
+    supports_streaming = True
+    max_files_per_paste = 5
+    max_paste_size = 6 * 1024 * 1024
 
-    def __init__(self, token: str):
+    def __init__(self, token: str, **kwargs):
         """
         :param token: The API token to use for authentication
+        :param kwargs: Extra connection options, passed to `BaseBackend.__init__`.
         """
+        super().__init__(**kwargs)
         self.token = token
 
+    def _post_kwargs(
+        self,
+        files: List[Union[PasteEEFile, MystbinFile, StreamFile]],
+        paste_description: str = None,
+        encrypted: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Builds the keyword arguments passed to `session.post` when creating a single paste.
+        If any of the files are `StreamFile`s, the body is spooled rather than built in memory.
+        """
+        sections = []
+        for file in files:
+            section = file.as_payload()
+            # Binary content is checked up front, then encoded into the JSON body straight from its buffer.
+            if not isinstance(section["content"], StreamFile):
+                check_utf8(section["content"], "paste.ee only supports text files.")
+            sections.append(section)
+
+        payload = {"sections": sections, "description": paste_description or "SuperPaste"}
+        if encrypted:
+            payload["encrypted"] = True
+        return {**json_body(payload), "auth": (self.token, "")}
+
+    @staticmethod
+    def _parse_post(response: httpx.Response) -> PasteEEResult:
+        """Converts the response from `post_url` into a result"""
+        response.raise_for_status()
+        data = response.json()
+        return PasteEEResult(data["id"], data["link"])
+
+    @staticmethod
+    def _parse_get(response: httpx.Response) -> List[PasteEEFile]:
+        """Converts a fetched paste into its sections"""
+        response.raise_for_status()
+        data = response.json()
+        r = []
+        for section in data["paste"]["sections"]:
+            r.append(PasteEEFile(section["content"], section["name"], section["syntax"], id=section["id"]))
+        return r
+
     def create_paste(
-        self, *files: Union[PasteEEFile, MystbinFile], paste_description: str = None, encrypted: bool = False
-    ) -> Union[BaseResult, List[BaseResult]]:
+        self,
+        *files: Union[PasteEEFile, MystbinFile, StreamFile],
+        paste_description: str = None,
+        encrypted: bool = False,
+        max_concurrency: int = 1,
+        return_exceptions: bool = False,
+    ) -> Union[PasteEEResult, List[PasteEEResult]]:
         """
         Creates a paste on paste.ee
 
         .. warning::
             Paste.ee only supports 5 files per paste, and up to 6MB
             See [their wiki/acceptable use policy](https://paste.ee/wiki/AUP) for more information.
+            Files that do not fit in one paste are packed into as few as possible, see `plan_pastes`.
 
         :param files: A list of files to post
         :param paste_description: A description of the overall paste. Can be omitted.
         :param encrypted: Whether this paste is already encrypted. Defaults to False.
-        :return: A single `BasePasteResult` if less than 5 files were posted, or a list of `BasePasteResult`s if more.
+        :param max_concurrency: How many pastes to make at once, if the files do not fit in one.
+        :param return_exceptions: If True, return a failed paste's exception in place of its result instead of raising.
+        :return: A single `BasePasteResult` if the files fit in one paste, or a list of `BasePasteResult`s (one per
+            paste) if not. The files are split over the pastes in order, as planned by
+            `plan_pastes(backend, files, keep_order=True)`.
         :raises ValueError: If any of the files are not text files.
         """
-        if len(files) > 5:
-            results = []
-            for chunk in as_chunks(files, 5):
+        plan = plan_pastes(self, files, keep_order=True) if len(files) > 1 else [files]
+        if len(plan) > 1:
+
+            def post_chunk(group: List[int]) -> PasteEEResult:
+                chunk = [files[i] for i in group]
                 self._logger.debug("Posting files to paste.ee: %r", chunk)
-                results.append(self.create_paste(*chunk))
-            return results
+                return self.create_paste(*chunk, paste_description=paste_description, encrypted=encrypted)
+
+            return run_concurrently(post_chunk, plan, max_concurrency, return_exceptions)
 
+        files = self._redact(files)
+        cache_key, cached = self._cached_result(files, description=paste_description, encrypted=encrypted)
+        if cached is not None:
+            return cached
         with self.with_session() as session:
-            for file in files:
-                if isinstance(file.content, bytes):
-                    try:
-                        file.content = file.content.decode("utf-8")
-                    except UnicodeDecodeError:
-                        raise ValueError("paste.ee only supports text files.")
-
-            payload = {"sections": [x.as_payload() for x in files]}
-            if paste_description:
-                payload["description"] = paste_description
-            if encrypted:
-                payload["encrypted"] = True
-            response: httpx.Response = session.post(
-                self.post_url,
-                json={
-                    "encrypted": False,
-                    "description": "SuperPaste",
-                },
-                auth=(self.token, ""),
-            )
-            response.raise_for_status()
-
-            data = response.json()
-            return BaseResult(data["id"], data["link"])
+            with self._timed("prepare"):
+                kwargs = self._post_kwargs(list(files), paste_description, encrypted)
+            response: httpx.Response = session.post(self.post_url, **kwargs)
+            with self._timed("parse"):
+                return self._cache_result(cache_key, self._parse_post(response))
+
+    async def async_create_paste(
+        self,
+        *files: Union[PasteEEFile, MystbinFile, StreamFile],
+        paste_description: str = None,
+        encrypted: bool = False,
+        max_concurrency: int = 1,
+        return_exceptions: bool = False,
+    ) -> Union[PasteEEResult, List[PasteEEResult]]:
+        """
+        Creates a paste on paste.ee asynchronously.
+
+        See `create_paste` for details.
+
+        :param files: A list of files to post
+        :param paste_description: A description of the overall paste. Can be omitted.
+        :param encrypted: Whether this paste is already encrypted. Defaults to False.
+        :param max_concurrency: How many pastes to make at once, if the files do not fit in one.
+        :param return_exceptions: If True, return a failed paste's exception in place of its result instead of raising.
+        :return: A single `BasePasteResult` if the files fit in one paste, or a list of `BasePasteResult`s (one per
+            paste) if not. The files are split over the pastes in order, as planned by
+            `plan_pastes(backend, files, keep_order=True)`.
+        :raises ValueError: If any of the files are not text files.
+        """
+        plan = plan_pastes(self, files, keep_order=True) if len(files) > 1 else [files]
+        if len(plan) > 1:
+
+            async def post_chunk(group: List[int]) -> PasteEEResult:
+                chunk = [files[i] for i in group]
+                self._logger.debug("Posting files to paste.ee: %r", chunk)
+                return await self.async_create_paste(*chunk, paste_description=paste_description, encrypted=encrypted)
+
+            return await async_run_concurrently(post_chunk, plan, max_concurrency, return_exceptions)
+
+        files = self._redact(files)
+        cache_key, cached = self._cached_result(files, description=paste_description, encrypted=encrypted)
+        if cached is not None:
+            return cached
+        async with self.with_async_session() as session:
+            with self._timed("prepare"):
+                kwargs = await async_json_kwargs(
+                    files, lambda: self._post_kwargs(list(files), paste_description, encrypted)
+                )
+            response: httpx.Response = await session.post(self.post_url, **kwargs)
+            with self._timed("parse"):
+                return self._cache_result(cache_key, self._parse_post(response))
 
     def get_paste(self, key: str) -> List[PasteEEFile]:
         """
@@ -100,11 +195,19 @@ class PasteEEBackend(BaseBackend):
         :param key: The key of the paste to get
         :return: A list of files that were in the paste
         """
-        r = []
         with self.with_session() as session:
-            response: httpx.Response = session.get(self.post_url + "/" + key)
-            response.raise_for_status()
-            data = response.json()
-            for section in data["paste"]["sections"]:
-                r.append(PasteEEFile(section["content"], section["name"], section["syntax"], id=section["id"]))
-        return r
+            response: httpx.Response = self.cached_get(session, self.post_url + "/" + key)
+            with self._timed("parse"):
+                return self._parse_get(response)
+
+    async def async_get_paste(self, key: str) -> List[PasteEEFile]:
+        """
+        Gets a paste from paste.ee asynchronously
+
+        :param key: The key of the paste to get
+        :return: A list of files that were in the paste
+        """
+        async with self.with_async_session() as session:
+            response: httpx.Response = await self.async_cached_get(session, self.post_url + "/" + key)
+            with self._timed("parse"):
+                return self._parse_get(response)
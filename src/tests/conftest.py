@@ -0,0 +1,33 @@
+import asyncio
+import threading
+
+import pytest
+
+from superpaste._server import PasteServer, PasteStore
+
+
+@pytest.fixture
+def serve(tmp_path):
+    """Starts `superpaste serve` on localhost, in a thread. Takes `PasteStore` options, and returns the server."""
+    running = []
+
+    def start(**store_kwargs) -> PasteServer:
+        loop = asyncio.new_event_loop()
+        server = PasteServer(PasteStore(tmp_path / ("pastes%d" % len(running)), **store_kwargs), port=0)
+        loop.run_until_complete(server.start())
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        running.append((server, loop, thread))
+        return server
+
+    yield start
+    for server, loop, thread in running:
+        asyncio.run_coroutine_threadsafe(server.close(), loop).result(10)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(10)
+        loop.close()
+
+
+@pytest.fixture
+def server(serve):
+    return serve(max_size=1024 * 1024)
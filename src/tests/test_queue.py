@@ -0,0 +1,97 @@
+import asyncio
+import itertools
+
+import pytest
+
+from superpaste.backends import BaseResult, GenericBackend, GenericFile, PasteQueue
+
+
+class MultiFileBackend(GenericBackend):
+    """Takes several files per paste (up to 6 MiB between them), and names each paste after the files in it."""
+
+    max_files_per_paste = 5
+    max_paste_size = 6 * 1024 * 1024
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pastes = []
+        self._keys = itertools.count()
+
+    def create_paste(self, *files, **kwargs):
+        names = [file.content[0] for file in files]
+        self.pastes.append(names)
+        key = "%d-%s" % (next(self._keys), "".join(names))
+        return BaseResult(key, "https://example.com/" + key)
+
+
+def test_round_trip(server):
+    backend = GenericBackend(server.url)
+    with PasteQueue(backend, max_delay=0.05) as queue:
+        futures = [queue.submit(GenericFile("file %d" % n)) for n in range(5)]
+        results = [future.result(timeout=10) for future in futures]
+    assert [backend.get_paste(result.key).content for result in results] == ["file %d" % n for n in range(5)]
+    assert queue.requests == 5
+
+
+def test_async_submit(server):
+    backend = GenericBackend(server.url)
+
+    async def main():
+        async with PasteQueue(backend, max_delay=0.05) as queue:
+            return await asyncio.gather(*(queue.async_submit(GenericFile("async %d" % n)) for n in range(3)))
+
+    results = asyncio.run(main())
+    assert [backend.get_paste(result.key).content for result in results] == ["async %d" % n for n in range(3)]
+
+
+def test_files_share_pastes():
+    backend = MultiFileBackend("http://127.0.0.1:1")
+    with PasteQueue(backend, max_delay=10) as queue:
+        futures = [queue.submit(GenericFile(name)) for name in "abcdefg"]
+        queue.flush()
+    assert backend.pastes == [list("abcde"), list("fg")]
+    assert [future.result().key.split("-")[1] for future in futures] == ["abcde"] * 5 + ["fg"] * 2
+
+
+def test_each_file_gets_its_own_paste():
+    # The files do not all fit in one paste, so each future must resolve to the paste its own file went in.
+    mib = 1024 * 1024
+    backend = MultiFileBackend("http://127.0.0.1:1")
+    with PasteQueue(backend, max_delay=10) as queue:
+        sizes = {"a": 4 * mib, "b": 4 * mib, "c": 2 * mib, "d": 2 * mib}
+        futures = {name: queue.submit(GenericFile(name * size)) for name, size in sizes.items()}
+        queue.flush()
+    for name, future in futures.items():
+        assert name in future.result().key.split("-")[1]
+    assert sorted(name for paste in backend.pastes for name in paste) == list("abcd")
+
+
+def test_upload_errors_fail_their_files():
+    class Failing(GenericBackend):
+        def create_paste(self, *files, **kwargs):
+            raise ConnectionError("The server is down")
+
+    with PasteQueue(Failing("http://127.0.0.1:1"), max_delay=0.05) as queue:
+        future = queue.submit(GenericFile("lost"))
+        with pytest.raises(ConnectionError):
+            future.result(timeout=10)
+
+
+def test_wrong_result_count_keeps_urls():
+    class Shortchanging(MultiFileBackend):
+        def create_paste(self, *files, **kwargs):
+            return [BaseResult("x", "https://example.com/x"), BaseResult("y", "https://example.com/y")]
+
+    with PasteQueue(Shortchanging("http://127.0.0.1:1"), max_delay=10) as queue:
+        futures = [queue.submit(GenericFile(name)) for name in "abc"]
+        queue.flush()
+    for future in futures:
+        with pytest.raises(RuntimeError, match="https://example.com/x, https://example.com/y"):
+            future.result()
+
+
+def test_submit_after_close():
+    queue = PasteQueue(MultiFileBackend("http://127.0.0.1:1"))
+    queue.close()
+    with pytest.raises(RuntimeError):
+        queue.submit(GenericFile("too late"))
@@ -0,0 +1,94 @@
+import gzip
+import time
+
+import httpx
+import pytest
+
+from superpaste.backends import GenericBackend, GenericFile, StreamFile
+
+
+def test_round_trip(server):
+    backend = GenericBackend(server.url)
+    result = backend.create_paste(GenericFile("hello world\n"))
+    assert result.url == server.url + "/" + result.key
+    assert backend.get_paste(result.key).content == "hello world\n"
+    # Pastes are stored by the hash of their content, so the same content gets the same key.
+    assert backend.create_paste(GenericFile("hello world\n")).key == result.key
+    assert httpx.get(server.url + "/documents/" + result.key).json() == {"key": result.key, "data": "hello world\n"}
+
+
+def test_streamed_upload(server):
+    content = b"".join(b"line %d\n" % i for i in range(50_000))
+    chunks = [content[i : i + 4096] for i in range(0, len(content), 4096)]
+    backend = GenericBackend(server.url)
+    result = backend.create_paste(StreamFile(iter(chunks)))
+    assert backend.get_paste(result.key).content.encode() == content
+
+
+def test_gzip_upload(server):
+    content = "compress me\n" * 10_000
+    backend = GenericBackend(server.url, compression="gzip")
+    result = backend.create_paste(GenericFile(content))
+    assert backend.get_paste(result.key).content == content
+
+    response = httpx.post(
+        server.url + "/documents", content=gzip.compress(b"raw gzip\n"), headers={"Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 200
+    assert httpx.get(server.url + "/raw/" + response.json()["key"]).content == b"raw gzip\n"
+
+
+def test_gzip_download_is_negotiated(server):
+    content = b"negotiate me\n" * 10_000
+    key = httpx.post(server.url + "/documents", content=content).json()["key"]
+    compressed = httpx.get(server.url + "/raw/" + key, headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert compressed.content == content
+    plain = httpx.get(server.url + "/raw/" + key, headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+    assert plain.content == content
+
+
+def test_etag(server):
+    key = httpx.post(server.url + "/documents", content=b"cache me").json()["key"]
+    response = httpx.get(server.url + "/raw/" + key)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    revalidated = httpx.get(server.url + "/raw/" + key, headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_too_large(server, chunked):
+    content = b"x" * (1024 * 1024 + 1)
+    body = iter([content[:1024], content[1024:]]) if chunked else content
+    response = httpx.post(server.url + "/documents", content=body)
+    assert response.status_code == 413
+
+
+def test_compressed_too_large(serve):
+    # A small compressed body must not be expanded past `max_size` before it is refused.
+    server = serve(max_size=64 * 1024)
+    bomb = gzip.compress(b"\0" * (16 * 1024 * 1024))
+    response = httpx.post(server.url + "/documents", content=bomb, headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 413
+
+
+def test_unsupported_encoding(server):
+    response = httpx.post(server.url + "/documents", content=b"abc", headers={"Content-Encoding": "compress"})
+    assert response.status_code == 415
+
+
+def test_not_found(server):
+    assert httpx.get(server.url + "/raw/" + "0" * 16).status_code == 404
+    assert httpx.get(server.url + "/raw/not-a-key").status_code == 404
+
+
+def test_ttl_expiry(serve):
+    server = serve(ttl=1)
+    backend = GenericBackend(server.url)
+    key = backend.create_paste(GenericFile("short lived")).key
+    assert httpx.get(server.url + "/raw/" + key).status_code == 200
+    time.sleep(1.1)
+    assert httpx.get(server.url + "/raw/" + key).status_code == 404
@@ -0,0 +1,91 @@
+import threading
+
+import httpx
+import pytest
+
+from superpaste.backends import BaseResult, GenericBackend, GenericFile, PasteSpool
+
+
+class FlakyBackend(GenericBackend):
+    """Fails its first `failures` uploads as if the server were down, and records every file it uploads."""
+
+    def __init__(self, *args, failures: int = 0, **kwargs):
+        super().__init__(*args, retry=False, **kwargs)
+        self.failures = failures
+        self.uploaded = []
+        self._lock = threading.Lock()
+
+    def create_paste(self, *files, **kwargs):
+        with self._lock:
+            if self.failures:
+                self.failures -= 1
+                raise httpx.ConnectError("The server is down")
+            self.uploaded.extend(file.content for file in files)
+        return super().create_paste(*files, **kwargs)
+
+
+def test_round_trip(server, tmp_path):
+    backend = GenericBackend(server.url)
+    with PasteSpool(backend, tmp_path / "spool") as spool:
+        tickets = [spool.submit("text"), spool.submit(b"bytes"), spool.submit(GenericFile("a file"))]
+        pastes = [spool.wait(ticket, timeout=10) for ticket in tickets]
+    assert [paste.state for paste in pastes] == ["done"] * 3
+    assert [backend.get_paste(paste.key).content for paste in pastes] == ["text", "bytes", "a file"]
+
+
+def test_pending_files_survive_close(server, tmp_path):
+    with PasteSpool(GenericBackend(server.url), tmp_path / "spool", background=False) as spool:
+        ticket = spool.submit("kept for later")
+        assert spool.pending == 1
+    with PasteSpool(GenericBackend(server.url), tmp_path / "spool") as spool:
+        assert spool.wait(ticket, timeout=10).state == "done"
+
+
+def test_retries_transient_failures(server, tmp_path):
+    backend = FlakyBackend(server.url, failures=2)
+    with PasteSpool(backend, tmp_path / "spool", background=False, retry_delay=0.01) as spool:
+        ticket = spool.submit("eventually")
+        assert spool.flush(timeout=10) == 0
+        paste = spool.get(ticket)
+    assert paste.state == "done"
+    assert paste.attempts == 3
+    assert backend.uploaded == [b"eventually"]
+
+
+def test_gives_up_on_permanent_failures(serve, tmp_path):
+    server = serve(max_size=10)
+    with PasteSpool(FlakyBackend(server.url), tmp_path / "spool", background=False, retry_delay=0.01) as spool:
+        ticket = spool.submit("far too large for the server")
+        spool.flush(timeout=10)
+        paste = spool.get(ticket)
+    assert paste.state == "failed"
+    assert paste.attempts == 1
+    assert "413" in paste.error
+
+
+def test_wrong_result_count_fails_the_batch(tmp_path):
+    class Shortchanging(GenericBackend):
+        max_files_per_paste = 3
+
+        def create_paste(self, *files, **kwargs):
+            return [BaseResult("key", "https://example.com/key")]
+
+    with PasteSpool(Shortchanging("http://127.0.0.1:1"), tmp_path / "spool", background=False) as spool:
+        tickets = [spool.submit(str(n)) for n in range(3)]
+        spool.flush(timeout=10)
+        pastes = [spool.get(ticket) for ticket in tickets]
+    assert [paste.state for paste in pastes] == ["failed"] * 3
+    assert "returned 1 result(s) for a paste of 3 file(s)" in pastes[0].error
+
+
+@pytest.mark.parametrize("spools", [2, 3])
+def test_shared_directory_uploads_each_file_once(server, tmp_path, spools):
+    backend = FlakyBackend(server.url)
+    opened = [PasteSpool(backend, tmp_path / "spool", poll_interval=0.05) for _ in range(spools)]
+    try:
+        tickets = [opened[n % spools].submit("file %d" % n) for n in range(20)]
+        assert all(opened[0].wait(ticket, timeout=10).state == "done" for ticket in tickets)
+    finally:
+        for spool in opened:
+            spool.close()
+    assert sorted(backend.uploaded) == sorted(b"file %d" % n for n in range(20))